@@ -0,0 +1,179 @@
+"""
+DAT del nivel digital (formato Leica M5) -> CSV 'CÓDIGO;COTA' para nivel_digital_v2.lsp.
+
+Sustituye el paso de Excel de la guía (texto en columnas, copiar código y
+cota, guardar como CSV): lee el .DAT línea a línea y escribe directamente el
+CSV con la cota en centésimas de milímetro, como lo espera el LISP.
+
+Registros M5 (bloques de ancho fijo separados por '|'):
+    For M5|Adr     6|KD1       A1      09:43:081    |Rz        1.66066 m   |HD         17.852 m   |Z         9.97845 m   |
+- 'KD1 <punto> <hora>' identifica la lectura; los bloques siguientes son
+  valores: 'R'/'Rz'/'Rb'/'Rf' (lectura de mira), 'HD' (distancia), 'Z' (cota).
+- Solo van al CSV las lecturas con cota Z. La cota de partida (solo Z, sin
+  lectura de mira, p.ej. 'COTA0') se deja fuera salvo con --cota0.
+
+Uso (también arrastrando ficheros o carpetas sobre el script):
+    python dat_a_csv.py 071125.DAT                -> 071125.csv
+    python dat_a_csv.py "D:\\Nivelaciones" [--cota0]  -> un .csv por cada .DAT de la carpeta
+"""
+import argparse
+import os
+import sys
+from collections import namedtuple
+
+Registro = namedtuple('Registro', ['direccion', 'tipo', 'punto', 'hora', 'valores', 'linea'])
+
+# Lecturas de mira (su presencia distingue una visual de una cota de partida)
+LECTURAS = ('R', 'Rz', 'Rb', 'Rf')
+
+# Metros -> centésimas de milímetro (lo que lee el LISP)
+CENTESIMAS_POR_METRO = 100000
+
+UNIDADES = {'m': 1.0, 'mm': 0.001, 'ft': 0.3048}
+
+
+def parsear_registro(linea_txt, num_linea=0):
+    """
+    Registro de una línea M5, o None si no es una línea 'For M5'.
+    'valores' es {clave: valor en metros (o tal cual si no lleva unidad)}.
+    """
+    bloques = linea_txt.rstrip('\r\n').split('|')
+    if len(bloques) < 3 or bloques[0].strip() != 'For M5':
+        return None
+    direccion = bloques[1].split()
+    direccion = int(direccion[1]) if len(direccion) > 1 and direccion[1].isdigit() else None
+
+    info = bloques[2].split()
+    tipo = info[0] if info else ''
+    punto = hora = ''
+    if tipo.startswith('K') and len(info) > 1:
+        punto = info[1]
+        hora = info[2] if len(info) > 2 else ''
+
+    valores = {}
+    for bloque in bloques[3:]:
+        trozos = bloque.split()
+        if len(trozos) < 2:
+            continue
+        try:
+            valor = float(trozos[1])
+        except ValueError:
+            continue
+        if len(trozos) > 2:
+            if trozos[2] not in UNIDADES:
+                continue
+            valor *= UNIDADES[trozos[2]]
+        valores[trozos[0]] = valor
+    return Registro(direccion, tipo, punto, hora, valores, num_linea)
+
+
+def leer_m5(archivo_entrada):
+    """Registros M5 del fichero, en flujo. Las líneas que no son 'For M5' se saltan."""
+    # Los DAT son ASCII; latin-1 no falla con comentarios con tildes
+    with open(archivo_entrada, 'r', encoding='latin-1') as f:
+        for num_linea, linea_txt in enumerate(f, 1):
+            registro = parsear_registro(linea_txt, num_linea)
+            if registro is not None:
+                yield registro
+
+
+def es_cota_partida(registro):
+    """Cota introducida a mano (Z sin lectura de mira), como la 'COTA0'."""
+    return not any(clave in registro.valores for clave in LECTURAS)
+
+
+def cotas(registros, con_cota0=False):
+    """(punto, cota en metros) de las lecturas con Z, en el orden del fichero."""
+    for registro in registros:
+        if 'Z' not in registro.valores or not registro.punto:
+            continue
+        if not con_cota0 and es_cota_partida(registro):
+            continue
+        yield registro.punto, registro.valores['Z']
+
+
+def linea_csv(punto, cota):
+    """'A1;997845': cota en centésimas de mm, sin separadores (el LISP solo lee dígitos)."""
+    return f"{punto};{round(cota * CENTESIMAS_POR_METRO)}"
+
+
+def procesar_dat(archivo_entrada, archivo_salida, con_cota0=False):
+    """Escribe el CSV de un .DAT. Retorna el número de puntos (None si hay error)."""
+    print(f"DAT - Leyendo: {archivo_entrada}...")
+    filas = []
+    negativas = []
+    try:
+        for punto, cota in cotas(leer_m5(archivo_entrada), con_cota0):
+            if cota < 0:
+                negativas.append(punto)
+            filas.append(linea_csv(punto, cota))
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+
+    if not filas:
+        print("Archivo sin lecturas con cota (Z).")
+        return
+    if negativas:
+        # limpiar-numero del LISP quita el signo
+        print(f"  Aviso: cotas negativas (el LISP las leerá positivas): {', '.join(negativas[:10])}"
+              + (" ..." if len(negativas) > 10 else ""))
+
+    try:
+        with open(archivo_salida, 'w', encoding='utf-8', newline='\n') as f:
+            f.write('\n'.join(filas) + '\n')
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    print(f"¡Éxito! {len(filas)} puntos. Generado: {archivo_salida}")
+    return len(filas)
+
+
+def ficheros_dat(rutas):
+    """Los .DAT indicados; de una carpeta, todos los .DAT de dentro (y de sus subcarpetas)."""
+    for ruta in rutas:
+        if not os.path.isdir(ruta):
+            yield ruta
+            continue
+        for carpeta, subcarpetas, nombres in os.walk(ruta):
+            subcarpetas.sort()
+            for nombre in sorted(nombres):
+                if nombre.lower().endswith('.dat'):
+                    yield os.path.join(carpeta, nombre)
+
+
+def ruta_salida(ruta_entrada):
+    """CSV junto al DAT: '071125.DAT' -> '071125.csv'."""
+    return os.path.splitext(ruta_entrada)[0] + ".csv"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DAT del nivel digital (Leica M5) -> CSV para nivel_digital_v2.lsp.")
+    parser.add_argument('entradas', nargs='*', help="Fichero(s) .DAT o carpeta(s)")
+    parser.add_argument('--cota0', action='store_true', help="Incluir la cota de partida (COTA0) en el CSV")
+    args = parser.parse_args(argv)
+
+    entradas = args.entradas
+    if not entradas:
+        entrada = input("Arrastra aquí el .DAT (o la carpeta) y pulsa Intro: ").strip().strip('"')
+        entradas = [entrada] if entrada else []
+
+    procesados = fallos = 0
+    for entrada in ficheros_dat(entradas):
+        if not os.path.exists(entrada):
+            print(f"No se encuentra el archivo de entrada: {entrada}")
+            fallos += 1
+            continue
+        procesados += 1
+        if procesar_dat(entrada, ruta_salida(entrada), args.cota0) is None:
+            fallos += 1
+    if not procesados and not fallos:
+        print("No hay ficheros .DAT que procesar.")
+
+    if fallos and sys.stdin is not None and sys.stdin.isatty():
+        input("Presiona Intro para salir...")
+    return 1 if fallos or not procesados else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
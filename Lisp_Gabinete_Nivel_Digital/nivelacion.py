@@ -0,0 +1,535 @@
+"""
+Cálculo y compensación de nivelaciones a partir de las lecturas del DAT (Leica M5).
+
+dat_a_csv.py copia la cota Z que calculó el nivel; aquí se rehacen las cotas
+desde las lecturas de mira y se comprueba el cierre:
+- 'R' / 'Rb': lectura de espalda (atrás). Altura del instrumento = cota + lectura.
+- 'Rf': lectura de frente (adelante) a un punto de cambio o de cierre.
+- 'Rz': puntería intermedia (radiación): cota = altura del instrumento - lectura.
+- 'HD': distancia a la mira; el peso de cada desnivel es 1 / distancia.
+- Una Z sin lectura de mira (la 'COTA0') es una cota fija de partida.
+
+Los puntos de espalda y de frente (puntos de cambio y bases) forman la red de
+nivelación; un mismo nombre en varios DAT es el mismo punto, así que varias
+sesiones que comparten bases se compensan juntas. Por cada DAT se detecta si
+la línea es un anillo cerrado, una ida y vuelta, si acaba en una base conocida
+o si queda abierta, y se da su error de cierre y la tolerancia.
+
+La compensación es por mínimos cuadrados (pesos 1 / distancia), sin montar la
+matriz completa: los puntos de paso (dos tramos) y los ramales sin salida se
+eliminan de la red, los tramos repetidos entre los mismos puntos se promedian,
+y solo los nudos (tres tramos o más) se resuelven juntos. En una línea simple
+eso es repartir el cierre en proporción a la distancia.
+
+Salida: por cada DAT un '_nivelado.csv' ('CÓDIGO;COTA' en centésimas de mm,
+el mismo formato que lee nivel_digital_v2.lsp) y un informe
+'nivelacion_informe.txt' en la carpeta de la primera entrada.
+
+Uso:
+    python nivelacion.py "D:\\Nivelaciones\\2025" [--tolerancia 3] [--cota0]
+    python nivelacion.py dia1.DAT dia2.DAT
+"""
+import argparse
+import math
+import os
+import sys
+from collections import defaultdict, namedtuple
+
+# dat_a_csv.py va en la misma carpeta, también si se ejecuta como script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dat_a_csv import es_cota_partida, ficheros_dat, leer_m5, linea_csv
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Tolerancia de cierre: mm por raíz de km recorrido
+TOLERANCIA_MM_KM = 3.0
+
+# Distancia mínima de un tramo (si el DAT no trae HD), metros
+DISTANCIA_MINIMA = 1.0
+
+Tramo = namedtuple('Tramo', ['desde', 'hasta', 'desnivel', 'distancia', 'sesion'])
+Salida = namedtuple('Salida', ['punto', 'estacion', 'lectura', 'z_nivel'])
+Cierre = namedtuple('Cierre', ['tipo', 'inicio', 'fin', 'distancia', 'cierre', 'tolerancia'])
+Compensacion = namedtuple('Compensacion', ['cotas', 'redundancia', 'avisos'])
+
+
+class ErrorNivelacion(Exception):
+    """Datos con los que no se puede calcular (cotas fijas contradictorias...)."""
+
+
+class Estacion:
+    """Un estacionamiento del nivel: punto de espalda, sus lecturas y las de frente."""
+
+    def __init__(self, atras):
+        self.atras = atras
+        self.lecturas_atras = []
+        self.distancias_atras = []
+        self.adelante = {} # punto -> [(lectura, distancia)], en orden
+
+    def lectura_atras(self):
+        return sum(self.lecturas_atras) / len(self.lecturas_atras)
+
+    def distancia_atras(self):
+        return sum(self.distancias_atras) / len(self.distancias_atras) if self.distancias_atras else 0.0
+
+    def tramos(self, sesion):
+        """Desniveles espalda -> frente (lecturas repetidas promediadas)."""
+        for punto, lecturas in self.adelante.items():
+            frente = sum(l for l, _ in lecturas) / len(lecturas)
+            distancias = [d for _, d in lecturas if d is not None]
+            d = self.distancia_atras() + (sum(distancias) / len(distancias) if distancias else 0.0)
+            yield Tramo(self.atras, punto, self.lectura_atras() - frente, max(d, DISTANCIA_MINIMA), sesion)
+
+
+class Sesion:
+    """Lecturas de un DAT: cotas fijas, estacionamientos y filas de salida en orden."""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.fijas = {}
+        self.orden_fijas = []
+        self.estaciones = []
+        self.salidas = []
+        self.avisos = []
+
+    def tramos(self):
+        return [t for estacion in self.estaciones for t in estacion.tramos(self)]
+
+    def recorrido(self):
+        """Puntos de la red en el orden de la línea (espalda, frentes...)."""
+        puntos = []
+        for estacion in self.estaciones:
+            for punto in [estacion.atras] + list(estacion.adelante):
+                if not puntos or puntos[-1] != punto:
+                    puntos.append(punto)
+        return puntos
+
+
+def leer_sesion(archivo_entrada):
+    """Lee un DAT M5 y lo separa en estacionamientos (en flujo, sin cargar el fichero)."""
+    sesion = Sesion(archivo_entrada)
+    estacion = None
+    for registro in leer_m5(archivo_entrada):
+        valores = registro.valores
+        if not registro.punto or not any(clave in valores for clave in ('Z', 'R', 'Rb', 'Rf', 'Rz')):
+            continue
+        if es_cota_partida(registro):
+            if 'Z' in valores:
+                if registro.punto not in sesion.fijas:
+                    sesion.orden_fijas.append(registro.punto)
+                sesion.fijas[registro.punto] = valores['Z']
+            continue
+
+        distancia = valores.get('HD')
+        atras = valores.get('Rb', valores.get('R'))
+        if atras is not None:
+            # Espalda a otro punto: nuevo estacionamiento (la misma, p.ej. en BFFB, se promedia)
+            if estacion is None or registro.punto != estacion.atras:
+                estacion = Estacion(registro.punto)
+                sesion.estaciones.append(estacion)
+            estacion.lecturas_atras.append(atras)
+            if distancia is not None:
+                estacion.distancias_atras.append(distancia)
+            continue
+
+        if estacion is None:
+            sesion.avisos.append(f"línea {registro.linea}: lectura de {registro.punto} sin espalda, se ignora")
+            continue
+        if 'Rf' in valores:
+            lecturas = estacion.adelante.setdefault(registro.punto, [])
+            lecturas.append((valores['Rf'], distancia))
+            if len(lecturas) == 1:
+                sesion.salidas.append(Salida(registro.punto, estacion, None, valores.get('Z')))
+        elif 'Rz' in valores:
+            sesion.salidas.append(Salida(registro.punto, estacion, valores['Rz'], valores.get('Z')))
+    return sesion
+
+
+def _fijas_comunes(sesiones):
+    """Cotas fijas de todas las sesiones. Lanza ErrorNivelacion si un punto tiene dos distintas."""
+    fijas = {}
+    for sesion in sesiones:
+        for punto in sesion.orden_fijas:
+            cota = sesion.fijas[punto]
+            if punto in fijas and abs(fijas[punto] - cota) > 0.00001:
+                raise ErrorNivelacion(f"Cota fija de {punto} distinta en {os.path.basename(sesion.archivo)}: "
+                                      f"{cota:.5f} (antes {fijas[punto]:.5f})")
+            fijas.setdefault(punto, cota)
+    return fijas
+
+
+def _componentes(puntos, tramos):
+    """Grupos de puntos unidos por tramos (unión-búsqueda)."""
+    padre = {p: p for p in puntos}
+
+    def raiz(p):
+        while padre[p] != p:
+            padre[p] = padre[padre[p]]
+            p = padre[p]
+        return p
+
+    for t in tramos:
+        a, b = raiz(t.desde), raiz(t.hasta)
+        if a != b:
+            padre[a] = b
+    grupos = defaultdict(list)
+    for p in puntos:
+        grupos[raiz(p)].append(p)
+    return list(grupos.values())
+
+
+def compensar(tramos, fijas):
+    """
+    Cotas compensadas de los puntos de la red (mínimos cuadrados, pesos
+    1 / distancia). Retorna Compensacion(cotas, redundancia, avisos). Un
+    grupo de puntos sin ninguna cota fija toma como fija la del primer punto
+    a 0 (con aviso).
+    """
+    avisos = []
+    puntos = list(dict.fromkeys([t.desde for t in tramos] + [t.hasta for t in tramos] + list(fijas)))
+    fijas = dict(fijas)
+    redundancia = len(tramos) - (len(puntos) - len(fijas))
+    for grupo in _componentes(puntos, tramos):
+        if not any(p in fijas for p in grupo):
+            fijas[grupo[0]] = 0.0
+            redundancia += 1
+            avisos.append(f"Sin cota fija para {grupo[0]} y los unidos a él: se toma {grupo[0]} = 0")
+
+    # Red reducida: aristas (a, b) -> [desnivel a->b, distancia]; las repetidas se promedian
+    aristas = {}
+    vecinos = defaultdict(set)
+
+    def anadir(a, b, desnivel, distancia):
+        if a == b:
+            return # Anillo que se ha quedado en un punto: ya no aporta nada a los demás
+        if (b, a) in aristas:
+            a, b, desnivel = b, a, -desnivel
+        if (a, b) in aristas:
+            d0, l0 = aristas[(a, b)]
+            peso = 1 / l0 + 1 / distancia
+            aristas[(a, b)] = [(d0 / l0 + desnivel / distancia) / peso, 1 / peso]
+        else:
+            aristas[(a, b)] = [desnivel, distancia]
+            vecinos[a].add(b)
+            vecinos[b].add(a)
+
+    def quitar(a, b):
+        if (a, b) in aristas:
+            desnivel, distancia = aristas.pop((a, b))
+        else:
+            desnivel, distancia = aristas.pop((b, a))
+            desnivel = -desnivel
+        vecinos[a].discard(b)
+        vecinos[b].discard(a)
+        return desnivel, distancia
+
+    for t in tramos:
+        anadir(t.desde, t.hasta, t.desnivel, t.distancia)
+
+    # Eliminación de ramales (1 vecino) y puntos de paso (2 vecinos); se deshace al final
+    eliminados = []
+    pendientes = [p for p in puntos if p not in fijas]
+    while pendientes:
+        v = pendientes.pop()
+        if v in fijas or v not in vecinos or len(vecinos[v]) > 2:
+            continue
+        lados = sorted(vecinos[v])
+        if not lados:
+            continue
+        if len(lados) == 1:
+            u = lados[0]
+            desnivel, _ = quitar(u, v)
+            eliminados.append(('ramal', v, u, desnivel))
+            pendientes.append(u)
+            continue
+        u, w = lados
+        d1, l1 = quitar(u, v)
+        d2, l2 = quitar(v, w)
+        eliminados.append(('paso', v, u, w, d1, l1, d2, l2))
+        anadir(u, w, d1 + d2, l1 + l2)
+        pendientes.extend((u, w))
+
+    cotas = dict(fijas)
+    nudos = [p for p in vecinos if vecinos[p] and p not in fijas]
+    if nudos:
+        cotas.update(zip(nudos, _resolver(nudos, aristas, cotas)))
+
+    for paso in reversed(eliminados):
+        if paso[0] == 'ramal':
+            _, v, u, desnivel = paso
+            cotas[v] = cotas[u] + desnivel
+        else:
+            # El cierre del tramo u-w se reparte entre u-v y v-w en proporción a la distancia
+            _, v, u, w, d1, l1, d2, l2 = paso
+            correccion = (cotas[w] - cotas[u]) - (d1 + d2)
+            cotas[v] = cotas[u] + d1 + correccion * l1 / (l1 + l2)
+    return Compensacion(cotas, redundancia, avisos)
+
+
+def _resolver(nudos, aristas, cotas):
+    """Ecuaciones normales de los nudos (las cotas fijas pasan al término independiente)."""
+    indice = {p: i for i, p in enumerate(nudos)}
+    n = len(nudos)
+    normal = [[0.0] * n for _ in range(n)] if np is None else np.zeros((n, n))
+    termino = [0.0] * n
+    for (a, b), (desnivel, distancia) in aristas.items():
+        peso = 1 / distancia
+        ia, ib = indice.get(a), indice.get(b)
+        if ia is None and ib is None:
+            continue # Entre dos cotas fijas
+        # cota[b] - cota[a] = desnivel
+        if ia is not None:
+            normal[ia][ia] += peso
+            termino[ia] -= peso * desnivel
+        else:
+            termino[ib] += peso * cotas[a]
+        if ib is not None:
+            normal[ib][ib] += peso
+            termino[ib] += peso * desnivel
+        else:
+            termino[ia] += peso * cotas[b]
+        if ia is not None and ib is not None:
+            normal[ia][ib] -= peso
+            normal[ib][ia] -= peso
+    if np is not None:
+        return np.linalg.solve(normal, np.array(termino)).tolist()
+    return _gauss(normal, termino)
+
+
+def _gauss(matriz, termino):
+    """Sistema lineal (simétrico definido positivo) sin NumPy."""
+    n = len(termino)
+    a = [fila[:] + [t] for fila, t in zip(matriz, termino)]
+    for k in range(n):
+        pivote = max(range(k, n), key=lambda i: abs(a[i][k]))
+        a[k], a[pivote] = a[pivote], a[k]
+        for i in range(k + 1, n):
+            factor = a[i][k] / a[k][k]
+            if factor:
+                fila_k, fila_i = a[k], a[i]
+                for j in range(k, n + 1):
+                    fila_i[j] -= factor * fila_k[j]
+    x = [0.0] * n
+    for i in reversed(range(n)):
+        x[i] = (a[i][n] - sum(a[i][j] * x[j] for j in range(i + 1, n))) / a[i][i]
+    return x
+
+
+def linea_medida(sesion):
+    """
+    (inicio, fin, desnivel medido, distancia) de la línea de la sesión,
+    siguiendo de cada estacionamiento al punto de frente en el que se apoya
+    el siguiente. None si no hay tramos.
+    """
+    tramos = sesion.tramos()
+    if not tramos:
+        return None
+    recorrido = sesion.recorrido()
+    inicio = actual = recorrido[0]
+    medido = 0.0
+    for estacion in sesion.estaciones:
+        if estacion.atras != actual or not estacion.adelante:
+            break
+        tramo = list(estacion.tramos(sesion))[-1]
+        medido += tramo.desnivel
+        actual = tramo.hasta
+    return inicio, actual, medido, sum(t.distancia for t in tramos)
+
+
+def _cierre(tipo, inicio, fin, distancia, medido, cotas, tolerancia_mm_km):
+    cierre = medido - (cotas[fin] - cotas[inicio])
+    tolerancia = tolerancia_mm_km / 1000 * math.sqrt(distancia / 1000)
+    return Cierre(tipo, inicio, fin, distancia, cierre, tolerancia)
+
+
+def cierre_sesion(sesion, cotas, fijas, compartidos=(), tolerancia_mm_km=TOLERANCIA_MM_KM):
+    """
+    Tipo de línea y error de cierre de una sesión (con las lecturas sin
+    compensar). Solo hay cierre si vuelve al punto de salida o va de una
+    cota fija a otra; entre puntos medidos también en otras sesiones
+    ('compartidos') es 'en red' y su cierre entra en la compensación.
+    """
+    medida = linea_medida(sesion)
+    if medida is None:
+        recorrido = sesion.recorrido()
+        return Cierre('radiación', recorrido[0] if recorrido else '', '', 0.0, None, None)
+    inicio, fin, medido, distancia = medida
+    if inicio == fin:
+        # Vuelve por algún punto de la ida: ida y vuelta; si no, anillo
+        interiores = sesion.recorrido()[1:-1]
+        tipo = 'ida y vuelta' if len(set(interiores)) < len(interiores) else 'anillo'
+    elif fin in fijas and inicio in fijas:
+        tipo = 'enlazada'
+    elif fin in compartidos and inicio in compartidos:
+        return Cierre('en red', inicio, fin, distancia, None, None)
+    else:
+        return Cierre('abierta', inicio, fin, distancia, None, None)
+    return _cierre(tipo, inicio, fin, distancia, medido, cotas, tolerancia_mm_km)
+
+
+def idas_y_vueltas(sesiones, cotas, tolerancia_mm_km=TOLERANCIA_MM_KM):
+    """
+    Parejas de sesiones A -> B y B -> A (ida un día, vuelta otro) con el
+    cierre de las dos juntas. Retorna [(sesión ida, sesión vuelta, Cierre)].
+    """
+    por_extremos = {}
+    parejas = []
+    for sesion in sesiones:
+        medida = linea_medida(sesion)
+        if medida is None or medida[0] == medida[1]:
+            continue
+        inicio, fin, medido, distancia = medida
+        ida = por_extremos.pop((fin, inicio), None)
+        if ida is None:
+            por_extremos.setdefault((inicio, fin), (sesion, medido, distancia))
+            continue
+        sesion_ida, medido_ida, distancia_ida = ida
+        cierre = _cierre('ida y vuelta', fin, fin, distancia_ida + distancia, medido_ida + medido,
+                         cotas, tolerancia_mm_km)
+        parejas.append((sesion_ida, sesion, cierre._replace(fin=inicio)))
+    return parejas
+
+
+def cotas_salida(sesion, cotas):
+    """
+    (punto, cota compensada, Z del nivel) de cada lectura de frente o
+    intermedia, en orden. Sin cota de espalda (estacionamiento suelto, sin
+    cota fija) la cota es None.
+    """
+    for salida in sesion.salidas:
+        if salida.lectura is None:
+            yield salida.punto, cotas.get(salida.punto), salida.z_nivel
+        elif salida.estacion.atras in cotas:
+            estacion = salida.estacion
+            altura_instrumento = cotas[estacion.atras] + estacion.lectura_atras()
+            yield salida.punto, altura_instrumento - salida.lectura, salida.z_nivel
+        else:
+            yield salida.punto, None, salida.z_nivel
+
+
+def ruta_salida(ruta_entrada):
+    """CSV compensado junto al DAT: '071125.DAT' -> '071125_nivelado.csv'."""
+    return os.path.splitext(ruta_entrada)[0] + "_nivelado.csv"
+
+
+def procesar(entradas, tolerancia_mm_km=TOLERANCIA_MM_KM, con_cota0=False):
+    """Compensa juntas todas las sesiones y escribe los CSV y el informe. Retorna el número de fallos."""
+    sesiones = []
+    fallos = 0
+    for entrada in ficheros_dat(entradas):
+        if not os.path.exists(entrada):
+            print(f"No se encuentra el archivo de entrada: {entrada}")
+            fallos += 1
+            continue
+        try:
+            sesiones.append(leer_sesion(entrada))
+        except Exception as e:
+            print(f"Error lectura ({entrada}): {e}")
+            fallos += 1
+    if not sesiones:
+        print("No hay ficheros .DAT que procesar.")
+        return fallos or 1
+
+    try:
+        fijas = _fijas_comunes(sesiones)
+        tramos = [t for sesion in sesiones for t in sesion.tramos()]
+        compensacion = compensar(tramos, fijas)
+    except ErrorNivelacion as e:
+        print(f"Error: {e}")
+        return fallos + 1
+    cotas = compensacion.cotas
+
+    informe = [f"NIVELACIÓN: {len(sesiones)} sesiones, {len(tramos)} tramos, {len(cotas)} puntos de la red",
+               f"Tolerancia de cierre: {tolerancia_mm_km:g} mm·√km"]
+    informe += [f"AVISO: {aviso}" for aviso in compensacion.avisos]
+    if compensacion.redundancia > 0:
+        # Error de un tramo de 1 km (peso 1 / distancia en metros)
+        residuos = [t.desnivel - (cotas[t.hasta] - cotas[t.desde]) for t in tramos]
+        sigma = math.sqrt(sum(v * v / t.distancia for v, t in zip(residuos, tramos)) / compensacion.redundancia)
+        informe.append(f"Error medio por km: {sigma * math.sqrt(1000) * 1000:.2f} mm "
+                       f"(redundancia {compensacion.redundancia})")
+
+    # Por sesión: puntos conocidos = fijos o medidos también en otra sesión
+    sesiones_de = defaultdict(set)
+    for t in tramos:
+        sesiones_de[t.desde].add(t.sesion.archivo)
+        sesiones_de[t.hasta].add(t.sesion.archivo)
+    for sesion in sesiones:
+        nombre = os.path.basename(sesion.archivo)
+        compartidos = set(fijas) | {p for p, de in sesiones_de.items() if len(de - {sesion.archivo})}
+        cierre = cierre_sesion(sesion, cotas, fijas, compartidos, tolerancia_mm_km)
+        linea = f"{nombre}: {cierre.tipo}"
+        if cierre.fin:
+            linea += f" {cierre.inicio} -> {cierre.fin}, {cierre.distancia:.1f} m"
+        if cierre.cierre is not None:
+            estado = "OK" if abs(cierre.cierre) <= cierre.tolerancia else "FUERA DE TOLERANCIA"
+            linea += f", cierre {cierre.cierre * 1000:+.2f} mm (tolerancia {cierre.tolerancia * 1000:.2f} mm) {estado}"
+        informe.append(linea)
+        informe += [f"  Aviso: {aviso}" for aviso in sesion.avisos]
+
+        filas = list(cotas_salida(sesion, cotas))
+        sin_cota = [punto for punto, cota, _ in filas if cota is None]
+        if sin_cota:
+            informe.append(f"  Aviso: {len(sin_cota)} lecturas sin cota (espalda sin cota conocida): "
+                           f"{', '.join(sin_cota[:10])}" + (" ..." if len(sin_cota) > 10 else ""))
+            filas = [fila for fila in filas if fila[1] is not None]
+        if con_cota0:
+            filas = [(p, sesion.fijas[p], None) for p in sesion.orden_fijas] + filas
+        diferencias = [abs(cota - z) for _, cota, z in filas if z is not None]
+        if diferencias:
+            informe.append(f"  Máxima diferencia con la Z del nivel: {max(diferencias) * 1000:.2f} mm")
+        if not filas:
+            print(f"{nombre}: sin lecturas con cota.")
+            continue
+        salida = ruta_salida(sesion.archivo)
+        try:
+            with open(salida, 'w', encoding='utf-8', newline='\n') as f:
+                f.write('\n'.join(linea_csv(punto, cota) for punto, cota, _ in filas) + '\n')
+        except Exception as e:
+            print(f"Error escritura: {e}")
+            fallos += 1
+            continue
+        print(f"¡Éxito! {len(filas)} puntos. Generado: {salida}")
+
+    for ida, vuelta, cierre in idas_y_vueltas(sesiones, cotas, tolerancia_mm_km):
+        estado = "OK" if abs(cierre.cierre) <= cierre.tolerancia else "FUERA DE TOLERANCIA"
+        informe.append(f"{os.path.basename(ida.archivo)} + {os.path.basename(vuelta.archivo)}: ida y vuelta "
+                       f"{cierre.inicio} <-> {cierre.fin}, {cierre.distancia:.1f} m, "
+                       f"cierre {cierre.cierre * 1000:+.2f} mm (tolerancia {cierre.tolerancia * 1000:.2f} mm) {estado}")
+
+    ruta_informe = os.path.join(os.path.dirname(os.path.abspath(sesiones[0].archivo)), "nivelacion_informe.txt")
+    try:
+        with open(ruta_informe, 'w', encoding='utf-8', newline='\n') as f:
+            f.write('\n'.join(informe) + '\n')
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return fallos + 1
+    print('\n'.join(informe))
+    print(f"Informe: {ruta_informe}")
+    return fallos
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcula y compensa nivelaciones desde los DAT (Leica M5).")
+    parser.add_argument('entradas', nargs='*', help="Fichero(s) .DAT o carpeta(s)")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_MM_KM,
+                        help=f"Tolerancia de cierre en mm·√km ({TOLERANCIA_MM_KM:g})")
+    parser.add_argument('--cota0', action='store_true', help="Incluir la cota de partida (COTA0) en el CSV")
+    args = parser.parse_args(argv)
+
+    entradas = args.entradas
+    if not entradas:
+        entrada = input("Arrastra aquí el .DAT (o la carpeta) y pulsa Intro: ").strip().strip('"')
+        entradas = [entrada] if entrada else []
+
+    fallos = procesar(entradas, args.tolerancia, args.cota0)
+    if fallos and sys.stdin is not None and sys.stdin.isatty():
+        input("Presiona Intro para salir...")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
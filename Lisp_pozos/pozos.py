@@ -0,0 +1,374 @@
+"""
+PRIMERA_PASADA.txt + SEGUNDA_PASADA.txt -> script de AutoCAD (.scr) con la red ya calculada.
+
+P1_v2.1 lee los CSV dentro de AutoCAD y va tubo por tubo pidiendo clicks en
+polilíneas dibujadas a mano. Aquí se hace todo antes, en Python:
+- Cruce de las dos pasadas por ID_POZO (un diccionario, no búsquedas en listas).
+- Red de tubos: cada colector de un pozo se empareja con el colector
+  complementario (salida <-> entrada) de otro pozo, del mismo TIPO_AGUA,
+  prefiriendo el que da pendiente a favor, el mismo diámetro y el más cercano.
+  Sirve para redes lineales (caso1) y radiales (caso2).
+- Cota de tubo = cota tapa - PROF_TUBO en cada extremo; el tramo va de la
+  cota más alta a la más baja, con su longitud en planta y su pendiente.
+- Un único .scr que dibuja las polilíneas 3D e inserta un bloque POZO por
+  tubo con RESULTADO (cota de tubo), DIAMETRODETUBO y NUMERODETUBOS.
+
+Las acometidas y los colectores sin pareja no se dibujan (no se conoce su
+dirección): llevan su bloque junto al pozo y salen en el informe.
+
+Uso (también arrastrando la carpeta o SEGUNDA_PASADA.txt sobre el script):
+    python pozos.py 1_datos_brutos/caso1            -> caso1/pozos.scr + pozos_informe.txt
+    python pozos.py .../SEGUNDA_PASADA.txt [--distancia-max 150] [--separacion 1.5]
+En AutoCAD (con el bloque POZO en el dibujo): comando SCRIPT -> pozos.scr
+"""
+import argparse
+import math
+import os
+import sys
+from collections import namedtuple
+
+Pozo = namedtuple('Pozo', ['id', 'x', 'y', 'z', 'linea'])
+Tubo = namedtuple('Tubo', ['pozo', 'tipo_agua', 'num', 'total', 'tipo', 'diametro', 'profundidad', 'linea'])
+# Extremo: un tubo de SEGUNDA_PASADA ya cruzado con su pozo
+Extremo = namedtuple('Extremo', ['tubo', 'pozo', 'cota'])
+Tramo = namedtuple('Tramo', ['desde', 'hasta', 'longitud', 'pendiente'])
+
+PRIMERA = "PRIMERA_PASADA.txt"
+SEGUNDA = "SEGUNDA_PASADA.txt"
+
+COLECTORES = ('colector_salida', 'colector_entrada')
+DESCONOCIDO = 'desconocido'
+
+# Distancia máxima en planta entre dos pozos unidos por un tubo (m)
+DISTANCIA_MAX = 150.0
+# Separación entre el centro del pozo y cada bloque (m)
+SEPARACION = 1.5
+# Decimales de los atributos, como en P1_v2.1 (precRes, precDiam)
+DECIMALES_COTA = 3
+DECIMALES_DIAMETRO = 2
+BLOQUE = "POZO"
+
+
+def _campos(archivo):
+    """(número de línea, campos) de un CSV separado por comas, sin las líneas vacías."""
+    # Los txt de campo pueden venir en UTF-8 o en ANSI
+    try:
+        with open(archivo, 'r', encoding='utf-8-sig') as f:
+            lineas = f.read().splitlines()
+    except UnicodeDecodeError:
+        with open(archivo, 'r', encoding='latin-1') as f:
+            lineas = f.read().splitlines()
+    for num_linea, linea_txt in enumerate(lineas, 1):
+        if linea_txt.strip():
+            yield num_linea, [c.strip() for c in linea_txt.split(',')]
+
+
+def leer_primera(archivo, avisos):
+    """{ID_POZO: Pozo} de PRIMERA_PASADA.txt."""
+    pozos = {}
+    for num_linea, campos in _campos(archivo):
+        try:
+            pozo = Pozo(campos[0], float(campos[1]), float(campos[2]), float(campos[3]), num_linea)
+        except (IndexError, ValueError):
+            avisos.append(f"{PRIMERA} línea {num_linea}: fila no válida")
+            continue
+        if pozo.id in pozos:
+            avisos.append(f"{PRIMERA} línea {num_linea}: pozo {pozo.id} repetido (se usa el último)")
+        pozos[pozo.id] = pozo
+    return pozos
+
+
+def leer_segunda(archivo, avisos):
+    """Tubo por cada fila de SEGUNDA_PASADA.txt."""
+    tubos = []
+    for num_linea, campos in _campos(archivo):
+        try:
+            tubos.append(Tubo(campos[0], campos[1].lower(), int(campos[5]), int(campos[6]),
+                              campos[7].lower(), float(campos[8]), float(campos[9]), num_linea))
+        except (IndexError, ValueError):
+            avisos.append(f"{SEGUNDA} línea {num_linea}: fila no válida")
+    return tubos
+
+
+def cruzar(pozos, tubos, avisos):
+    """Extremos (tubo con su pozo y su cota) y {ID_POZO: [extremos]}."""
+    extremos = []
+    por_pozo = {}
+    for tubo in tubos:
+        pozo = pozos.get(tubo.pozo)
+        if pozo is None:
+            avisos.append(f"{SEGUNDA} línea {tubo.linea}: el pozo {tubo.pozo} no está en {PRIMERA}")
+            continue
+        extremo = Extremo(tubo, pozo, pozo.z - tubo.profundidad)
+        extremos.append(extremo)
+        por_pozo.setdefault(pozo.id, []).append(extremo)
+
+    for id_pozo, suyos in por_pozo.items():
+        totales = {e.tubo.total for e in suyos}
+        if totales != {len(suyos)}:
+            avisos.append(f"Pozo {id_pozo}: {len(suyos)} tubos en {SEGUNDA}, TOTAL_TUBOS {'/'.join(map(str, sorted(totales)))}")
+    for id_pozo in pozos:
+        if id_pozo not in por_pozo:
+            avisos.append(f"Pozo {id_pozo}: sin tubos en {SEGUNDA}")
+    return extremos, por_pozo
+
+
+def _distancia(a, b):
+    return math.hypot(b.pozo.x - a.pozo.x, b.pozo.y - a.pozo.y)
+
+
+def _contrapendiente(a, b):
+    """El agua va de la salida a la entrada: True si la entrada queda más alta."""
+    if a.tubo.tipo == 'colector_entrada' or b.tubo.tipo == 'colector_salida':
+        a, b = b, a
+    if a.tubo.tipo != 'colector_salida' and b.tubo.tipo != 'colector_entrada':
+        return False
+    return b.cota > a.cota
+
+
+def _candidatos(extremos, distancia_max, compatibles):
+    """
+    Parejas (clave, i, j) de extremos compatibles a menos de 'distancia_max',
+    buscando por celdas de ese lado (solo las 9 celdas de alrededor).
+    Clave: (contrapendiente, distinto diámetro, distancia) -> menor es mejor.
+    """
+    celdas = {}
+    for i, e in enumerate(extremos):
+        celda = (math.floor(e.pozo.x / distancia_max), math.floor(e.pozo.y / distancia_max))
+        celdas.setdefault(celda, []).append(i)
+
+    candidatos = []
+    for (cx, cy), suyos in celdas.items():
+        vecinos = [j for dx in (-1, 0, 1) for dy in (-1, 0, 1) for j in celdas.get((cx + dx, cy + dy), ())]
+        for i in suyos:
+            a = extremos[i]
+            for j in vecinos:
+                b = extremos[j]
+                if j <= i or a.pozo.id == b.pozo.id or a.tubo.tipo_agua != b.tubo.tipo_agua:
+                    continue
+                if not compatibles(a.tubo.tipo, b.tubo.tipo):
+                    continue
+                distancia = _distancia(a, b)
+                if distancia > distancia_max:
+                    continue
+                candidatos.append(((_contrapendiente(a, b), a.tubo.diametro != b.tubo.diametro, distancia), i, j))
+    candidatos.sort()
+    return candidatos
+
+
+def _salida_con_entrada(tipo_a, tipo_b):
+    return {tipo_a, tipo_b} == set(COLECTORES)
+
+
+def _con_desconocido(tipo_a, tipo_b):
+    return DESCONOCIDO in (tipo_a, tipo_b) and tipo_a in COLECTORES + (DESCONOCIDO,) \
+        and tipo_b in COLECTORES + (DESCONOCIDO,)
+
+
+def emparejar(extremos, distancia_max=DISTANCIA_MAX):
+    """
+    Tramos de la red y extremos que se quedan sin pareja (acometidas incluidas).
+    Primero salida <-> entrada; luego, con lo que sobra, los 'desconocido'
+    con cualquier colector. Cada extremo entra en un solo tramo.
+    """
+    usado = [False] * len(extremos)
+    tramos = []
+    for compatibles in (_salida_con_entrada, _con_desconocido):
+        for (_, _, distancia), i, j in _candidatos(extremos, distancia_max, compatibles):
+            if usado[i] or usado[j]:
+                continue
+            usado[i] = usado[j] = True
+            a, b = extremos[i], extremos[j]
+            # El tramo baja: de la cota de tubo más alta a la más baja
+            if b.cota > a.cota or (b.cota == a.cota and b.tubo.tipo == 'colector_salida'):
+                a, b = b, a
+            pendiente = (a.cota - b.cota) / distancia * 100 if distancia else 0.0
+            tramos.append(Tramo(a, b, distancia, pendiente))
+    tramos.sort(key=lambda t: (t.desde.pozo.linea, t.desde.tubo.linea))
+    sueltos = [e for e, u in zip(extremos, usado) if not u]
+    return tramos, sueltos
+
+
+def _rotacion_legible(angulo):
+    """Ángulo del bloque para que el texto se lea de izquierda a derecha (como P1.03)."""
+    while angulo > math.pi / 2:
+        angulo -= math.pi
+    while angulo <= -math.pi / 2:
+        angulo += math.pi
+    return angulo
+
+
+def _texto_lisp(texto):
+    return '"' + str(texto).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _punto(x, y, z):
+    return f"({x:.4f} {y:.4f} {z:.4f})"
+
+
+def nombre_capa(tipo_agua):
+    """Capa de los tubos por tipo de agua: 'fecal' -> 'TUBO_FECAL'."""
+    limpio = ''.join(c if c.isalnum() or c in '_-' else '_' for c in tipo_agua.upper())
+    return f"TUBO_{limpio or 'SIN_TIPO'}"
+
+
+# Funciones del script (una por línea: el .scr se lee línea a línea)
+CABECERA_SCR = [
+    '(vl-load-com)',
+    '(setq _pz_osmode (getvar "OSMODE")) (setvar "OSMODE" 0) (setvar "CMDECHO" 0)',
+    # Polilínea 3D con entmake (sin pasar por el comando 3DPOLY)
+    '(defun _pz_tubo (capa pts) (entmake (list \'(0 . "POLYLINE") (cons 8 capa) \'(66 . 1) \'(10 0.0 0.0 0.0) \'(70 . 8)))'
+    ' (foreach p pts (entmake (list \'(0 . "VERTEX") (cons 8 capa) (cons 10 p) \'(70 . 32))))'
+    ' (entmake (list \'(0 . "SEQEND") (cons 8 capa))))',
+    # Bloque con atributos por TAG, como _insert-pozo-with-attrs de P1_v2.1
+    '(defun _pz_bloque (nombre p rot sRes sDiam sNum / blk) (if (tblsearch "BLOCK" nombre)'
+    ' (progn (setq blk (vla-InsertBlock (vla-get-ModelSpace (vla-get-ActiveDocument (vlax-get-acad-object)))'
+    ' (vlax-3d-point p) nombre 1.0 1.0 1.0 rot))'
+    ' (if (= (vla-get-HasAttributes blk) :vlax-true)'
+    ' (foreach a (vlax-safearray->list (vlax-variant-value (vla-GetAttributes blk)))'
+    ' (cond ((= (strcase (vla-get-TagString a)) "RESULTADO") (vla-put-TextString a sRes))'
+    ' ((member (strcase (vla-get-TagString a)) \'("DIAMETRODETUBO" "DIAMETRODELTUBO")) (vla-put-TextString a sDiam))'
+    ' ((= (strcase (vla-get-TagString a)) "NUMERODETUBOS") (vla-put-TextString a sNum))))))'
+    ' (setq _pz_sin_bloque T)))',
+    '(setq _pz_sin_bloque nil)',
+]
+
+PIE_SCR = [
+    '(setvar "OSMODE" _pz_osmode)',
+    '(if _pz_sin_bloque (prompt (strcat "\\n**ERROR**: No existe el bloque \'" _pz_nombre "\' en el dibujo.")))',
+    '(prompt (strcat "\\nPozos: " _pz_resumen)) (princ)',
+]
+
+
+def lineas_bloque(extremo, x, y, rotacion):
+    """Llamada a _pz_bloque para un extremo (Z=0 en la inserción, como P1_v2.1)."""
+    tubo = extremo.tubo
+    return (f"(_pz_bloque _pz_nombre '{_punto(x, y, 0.0)} {rotacion:.6f} "
+            f"{_texto_lisp(f'{extremo.cota:.{DECIMALES_COTA}f}')} "
+            f"{_texto_lisp(f'{tubo.diametro:.{DECIMALES_DIAMETRO}f}')} "
+            f"{_texto_lisp(tubo.total)})")
+
+
+def lineas_scr(tramos, sueltos, bloque=BLOQUE, separacion=SEPARACION):
+    """Líneas del .scr: cabecera, un tubo por tramo, un bloque por extremo, pie."""
+    yield from CABECERA_SCR
+    yield f"(setq _pz_nombre {_texto_lisp(bloque)})"
+    for tramo in tramos:
+        a, b = tramo.desde, tramo.hasta
+        yield (f"(_pz_tubo {_texto_lisp(nombre_capa(a.tubo.tipo_agua))} "
+               f"'({_punto(a.pozo.x, a.pozo.y, a.cota)} {_punto(b.pozo.x, b.pozo.y, b.cota)}))")
+        # Cada bloque, sobre su tubo a 'separacion' del centro del pozo
+        angulo = math.atan2(b.pozo.y - a.pozo.y, b.pozo.x - a.pozo.x)
+        rotacion = _rotacion_legible(angulo)
+        ux, uy = math.cos(angulo), math.sin(angulo)
+        yield lineas_bloque(a, a.pozo.x + ux * separacion, a.pozo.y + uy * separacion, rotacion)
+        yield lineas_bloque(b, b.pozo.x - ux * separacion, b.pozo.y - uy * separacion, rotacion)
+
+    # Sin dirección conocida: bloques apilados bajo el pozo
+    apilados = {}
+    for extremo in sueltos:
+        k = apilados[extremo.pozo.id] = apilados.get(extremo.pozo.id, 0) + 1
+        yield lineas_bloque(extremo, extremo.pozo.x, extremo.pozo.y - k * separacion, 0.0)
+    yield f"(setq _pz_resumen {_texto_lisp(f'{len(tramos)} tubos, {2 * len(tramos) + len(sueltos)} bloques')})"
+    yield from PIE_SCR
+
+
+def informe(pozos, tramos, sueltos, avisos):
+    """Líneas del informe: tramos con cotas y pendientes, extremos sueltos y avisos."""
+    yield f"RED DE POZOS: {len(pozos)} pozos, {len(tramos)} tramos, {len(sueltos)} tubos sin pareja"
+    yield ""
+    yield "TRAMOS (cota de tubo = cota tapa - PROF_TUBO)"
+    yield f"{'DESDE':<10}{'HASTA':<10}{'Ø cm':>6}{'COTA INI':>11}{'COTA FIN':>11}{'LONG m':>9}{'PEND %':>8}"
+    for t in tramos:
+        aviso = "  diámetros distintos" if t.desde.tubo.diametro != t.hasta.tubo.diametro else ""
+        if t.desde.tubo.tipo == 'colector_entrada' and t.hasta.tubo.tipo == 'colector_salida':
+            aviso += "  ¿entrada/salida al revés?"
+        yield (f"{t.desde.pozo.id:<10}{t.hasta.pozo.id:<10}{t.desde.tubo.diametro:>6g}"
+               f"{t.desde.cota:>11.3f}{t.hasta.cota:>11.3f}{t.longitud:>9.2f}{t.pendiente:>8.2f}{aviso}")
+    if sueltos:
+        yield ""
+        yield "SIN PAREJA (no se dibujan; solo bloque junto al pozo)"
+        for e in sueltos:
+            yield (f"{e.pozo.id:<10}tubo {e.tubo.num}/{e.tubo.total:<4}{e.tubo.tipo:<18}"
+                   f"Ø{e.tubo.diametro:g}  cota {e.cota:.3f}")
+    if avisos:
+        yield ""
+        yield "AVISOS"
+        yield from avisos
+
+
+def rutas_entrada(entrada):
+    """(PRIMERA_PASADA, SEGUNDA_PASADA) de una carpeta o de la SEGUNDA_PASADA (la otra, al lado)."""
+    carpeta = entrada if os.path.isdir(entrada) else os.path.dirname(entrada)
+    segunda = os.path.join(entrada, SEGUNDA) if os.path.isdir(entrada) else entrada
+    return os.path.join(carpeta, PRIMERA), segunda
+
+
+def procesar(entrada, distancia_max=DISTANCIA_MAX, separacion=SEPARACION, bloque=BLOQUE):
+    """Escribe pozos.scr y pozos_informe.txt junto a los datos. Retorna el número de tramos (None si hay error)."""
+    primera, segunda = rutas_entrada(entrada)
+    for ruta in (primera, segunda):
+        if not os.path.exists(ruta):
+            print(f"No se encuentra el archivo de entrada: {ruta}")
+            return
+    print(f"Pozos - Leyendo: {primera} + {os.path.basename(segunda)}...")
+    avisos = []
+    try:
+        pozos = leer_primera(primera, avisos)
+        tubos = leer_segunda(segunda, avisos)
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+    extremos, _ = cruzar(pozos, tubos, avisos)
+    if not extremos:
+        print("Sin tubos que cruzar con los pozos.")
+        return
+    tramos, sueltos = emparejar(extremos, distancia_max)
+
+    carpeta = os.path.dirname(segunda)
+    ruta_scr = os.path.join(carpeta, "pozos.scr")
+    ruta_informe = os.path.join(carpeta, "pozos_informe.txt")
+    try:
+        # AutoCAD lee los .scr en ANSI
+        with open(ruta_scr, 'w', encoding='cp1252', errors='replace', newline='\r\n') as f:
+            f.write('\n'.join(lineas_scr(tramos, sueltos, bloque, separacion)) + '\n')
+        with open(ruta_informe, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(informe(pozos, tramos, sueltos, avisos)) + '\n')
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    print(f"  {len(pozos)} pozos, {len(extremos)} tubos: {len(tramos)} tramos, {len(sueltos)} sin pareja, {len(avisos)} avisos")
+    print(f"¡Éxito! Generado: {ruta_scr}")
+    print(f"        Informe: {ruta_informe}")
+    return len(tramos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PRIMERA + SEGUNDA_PASADA -> script de AutoCAD con tubos 3D y bloques POZO.")
+    parser.add_argument('entradas', nargs='*', help="Carpeta(s) con las pasadas, o SEGUNDA_PASADA.txt")
+    parser.add_argument('--distancia-max', type=float, default=DISTANCIA_MAX,
+                        help=f"Distancia máxima entre pozos unidos por un tubo, en m (por defecto {DISTANCIA_MAX:g})")
+    parser.add_argument('--separacion', type=float, default=SEPARACION,
+                        help=f"Separación de los bloques al centro del pozo, en m (por defecto {SEPARACION:g})")
+    parser.add_argument('--bloque', default=BLOQUE, help=f"Bloque a insertar (por defecto {BLOQUE}; también LA)")
+    args = parser.parse_args(argv)
+    if not args.distancia_max > 0:
+        parser.error("--distancia-max debe ser mayor que 0")
+
+    entradas = args.entradas
+    if not entradas:
+        entrada = input("Arrastra aquí la carpeta (o SEGUNDA_PASADA.txt) y pulsa Intro: ").strip().strip('"')
+        entradas = [entrada] if entrada else []
+
+    fallos = 0
+    for entrada in entradas:
+        if procesar(entrada, args.distancia_max, args.separacion, args.bloque) is None:
+            fallos += 1
+
+    if fallos and sys.stdin is not None and sys.stdin.isatty():
+        input("Presiona Intro para salir...")
+    return 1 if fallos or not entradas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,107 +1,78 @@
 import os
 import sys
 
+# Paquete común 'protopo' (carpeta Protopo/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from protopo.flujo import ErrorLectura, procesar_en_flujo
+from protopo.perfil import perfil_desde_entorno
+from protopo.codigos import codigo_id_linea
+
 def obtener_id_limpio(codigo_completo):
     """
     Parsea el campo final (ej: '3&17F') para obtener el ID de línea (ej: '17').
     Retorna (id_limpio, tiene_f)
+    Cada código distinto se parsea una sola vez (tabla compartida).
     """
-    # 1. Quitar espacios
-    codigo = codigo_completo.strip()
-    
-    # 2. Detectar y quitar F final (independiente de mayús/minús)
-    tiene_f = False
-    if codigo.lower().endswith('f'):
-        tiene_f = True
-        codigo = codigo[:-1] # Quitamos la F temporalmente para extraer ID
+    info = codigo_id_linea(codigo_completo)
+    return info.contador, info.tiene_f
+
+def marcar_codigo(codigo_raw_prev, codigo_raw_actual, codigo_raw_next):
+    """
+    Regla de la fase 1 para un punto, mirando el anterior y el siguiente.
+    Retorna el código de salida (el original + 'C' si es inicio de línea).
+    """
+    id_actual, tiene_f_actual = obtener_id_limpio(codigo_raw_actual)
     
-    # 3. Separar por '&'
-    if '&' in codigo:
-        partes = codigo.split('&')
-        # El ID es la parte derecha (última)
-        id_limpio = partes[-1]
+    # Mirar ANTERIOR
+    if codigo_raw_prev is not None:
+        id_prev, _ = obtener_id_limpio(codigo_raw_prev)
     else:
-        # Si no tiene &, asumimos que todo es el ID (robustez)
-        id_limpio = codigo
-        
-    return id_limpio, tiene_f
+        id_prev = None # Inicio de archivo
+
+    # Mirar SIGUIENTE
+    if codigo_raw_next is not None:
+        id_next, _ = obtener_id_limpio(codigo_raw_next)
+    else:
+        id_next = None # Fin de archivo
+
+    # LÓGICA DE MARCADO
+    # ¿Es Inicio?
+    # Condición: El ID cambia respecto al anterior Y es igual al siguiente (continuidad)
+    es_nuevo_id = (id_actual != id_prev)
+    tiene_continuidad = (id_actual == id_next)
+    
+    suffijo_c = ""
+    # Solo ponemos C si es nuevo Y tiene continuación (evita marcar puntos aislados)
+    if es_nuevo_id and tiene_continuidad:
+        suffijo_c = "C"
+    
+    # RECONSTRUCCIÓN DEL CÓDIGO
+    # Queremos mantener el formato original (con o sin F original) + C si corresponde
+    return codigo_raw_actual.strip() + suffijo_c
 
 def procesar_topografia(archivo_entrada, archivo_salida):
     print(f"Leyendo: {archivo_entrada}...")
     
-    lineas = []
-    
-    # --- LECTURA ---
+    # Lectura, marcado y escritura en una sola pasada (ventana anterior/actual/siguiente)
+    perfil = perfil_desde_entorno(1, archivo_entrada, 'flujo')
     try:
-        with open(archivo_entrada, 'r', encoding='utf-8') as f:
-            for raw_linea in f:
-                linea_txt = raw_linea.strip()
-                if not linea_txt: continue
-                campos = linea_txt.split(',')
-                if len(campos) < 1: continue
-                lineas.append(campos)
-    except Exception as e:
+        total_lineas = procesar_en_flujo(archivo_entrada, archivo_salida, marcar_codigo)
+    except ErrorLectura as e:
         print(f"Error al leer archivo: {e}")
         input("Presiona Intro para salir...")
         return
+    except Exception as e:
+        print(f"Error al escribir archivo: {e}")
+        return
 
-    if not lineas:
+    if not total_lineas:
         print("El archivo está vacío.")
         return
 
-    lineas_procesadas = []
-    total_lineas = len(lineas)
-
-    # --- PROCESAMIENTO ---
-    for i in range(total_lineas):
-        campos_actuales = lineas[i]
-        codigo_raw_actual = campos_actuales[-1]
-        
-        id_actual, tiene_f_actual = obtener_id_limpio(codigo_raw_actual)
-        
-        # Mirar ANTERIOR
-        if i > 0:
-            codigo_raw_prev = lineas[i-1][-1]
-            id_prev, _ = obtener_id_limpio(codigo_raw_prev)
-        else:
-            id_prev = None # Inicio de archivo
-
-        # Mirar SIGUIENTE
-        if i < total_lineas - 1:
-            codigo_raw_next = lineas[i+1][-1]
-            id_next, _ = obtener_id_limpio(codigo_raw_next)
-        else:
-            id_next = None # Fin de archivo
-
-        # LÓGICA DE MARCADO
-        # ¿Es Inicio?
-        # Condición: El ID cambia respecto al anterior Y es igual al siguiente (continuidad)
-        es_nuevo_id = (id_actual != id_prev)
-        tiene_continuidad = (id_actual == id_next)
-        
-        suffijo_c = ""
-        # Solo ponemos C si es nuevo Y tiene continuación (evita marcar puntos aislados)
-        if es_nuevo_id and tiene_continuidad:
-            suffijo_c = "C"
-        
-        # RECONSTRUCCIÓN DEL CÓDIGO
-        # Queremos mantener el formato original (con o sin F original) + C si corresponde
-        
-        nuevo_codigo = codigo_raw_actual.strip() + suffijo_c
-        
-        # Crear COPIA de campos para no modificar la lista original 'lineas'
-        campos_salida = list(campos_actuales)
-        campos_salida[-1] = nuevo_codigo
-        lineas_procesadas.append(campos_salida)
-
-    # --- ESCRITURA ---
-    try:
-        with open(archivo_salida, 'w', encoding='utf-8') as f_out:
-            for campos in lineas_procesadas:
-                f_out.write(','.join(campos) + '\n')
-        print(f"¡Éxito! Generado: {archivo_salida}")
-    except Exception as e:
-        print(f"Error al escribir archivo: {e}")
+    print(f"¡Éxito! Generado: {archivo_salida}")
+    perfil.marca('flujo', total_lineas)
+    perfil.emitir(total_lineas)
+    return total_lineas
 
 if __name__ == "__main__":
     # Soporte Drag & Drop
@@ -1,9 +1,10 @@
 # -*- mode: python ; coding: utf-8 -*-
+import os
 
 
 a = Analysis(
     ['procesar_topografia.py'],
-    pathex=[],
+    pathex=[os.path.join(SPECPATH, '..', '..')],  # paquete comun 'protopo'
     binaries=[],
     datas=[],
     hiddenimports=[],
@@ -1,110 +1,88 @@
 import os
 import sys
 
+# Paquete común 'protopo' (carpeta Protopo/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from protopo.flujo import ErrorLectura, procesar_en_flujo
+from protopo.perfil import perfil_desde_entorno
+from protopo.codigos import codigo_id_linea
+
 def obtener_id_limpio(codigo_completo):
     """
     Parsea el campo final (ej: '3&17F') para obtener el ID de línea (ej: '17').
     Retorna (id_limpio, tiene_f)
+    Cada código distinto se parsea una sola vez (tabla compartida).
+    """
+    info = codigo_id_linea(codigo_completo)
+    return info.contador, info.tiene_f
+
+def marcar_codigo(codigo_raw_prev, codigo_raw_actual, codigo_raw_next):
     """
-    codigo = codigo_completo.strip()
+    Regla de la fase 2 para un punto, mirando el anterior y el siguiente.
+    Retorna el código de salida (sin F, + '00' si es inicio de línea).
+    """
+    id_actual, tiene_f_actual = obtener_id_limpio(codigo_raw_actual)
     
-    # Detectar y quitar F final
-    tiene_f = False
-    if codigo.lower().endswith('f'):
-        tiene_f = True
-        codigo = codigo[:-1] 
+    # Mirar ANTERIOR
+    if codigo_raw_prev is not None:
+        id_prev, _ = obtener_id_limpio(codigo_raw_prev)
+    else:
+        id_prev = None 
+
+    # Mirar SIGUIENTE
+    if codigo_raw_next is not None:
+        id_next, _ = obtener_id_limpio(codigo_raw_next)
+    else:
+        id_next = None
+
+    # --- LÓGICA FASE 2 ---
     
-    # Separar por '&'
-    if '&' in codigo:
-        partes = codigo.split('&')
-        id_limpio = partes[-1]
+    # 1. Detectar Inicio: Cambio ID + Continuidad
+    es_nuevo_id = (id_actual != id_prev)
+    tiene_continuidad = (id_actual == id_next)
+    es_inicio = es_nuevo_id and tiene_continuidad
+
+    # 2. Reconstruir Código
+    # Base: El código original SIN la F (porque en Fase 2 "se eliminan las F")
+    if tiene_f_actual:
+        # Si tenía F, la quitamos del string original
+        # Cuidado: codigo_raw_actual puede ser '3&MuroF'
+        # Hay que quitar la 'F' del final conservando el '3&Muro'
+        base_sin_f = codigo_raw_actual.strip()[:-1] 
     else:
-        id_limpio = codigo
-        
-    return id_limpio, tiene_f
+        base_sin_f = codigo_raw_actual.strip()
+
+    nuevos_digitos = ""
+    if es_inicio:
+        nuevos_digitos = "00"
+    
+    # Resultado: CódigoBase + 00 (si inicio)
+    # Nota: Si era Fin, ya le quitamos la F en 'base_sin_f'
+    return base_sin_f + nuevos_digitos
 
 def procesar_fase2(archivo_entrada, archivo_salida):
     print(f"Fase 2 - Leyendo: {archivo_entrada}...")
     
-    lineas = []
+    # Lectura, marcado y escritura en una sola pasada
+    perfil = perfil_desde_entorno(2, archivo_entrada, 'flujo')
     try:
-        with open(archivo_entrada, 'r', encoding='utf-8') as f:
-            for raw_linea in f:
-                linea_txt = raw_linea.strip()
-                if not linea_txt: continue
-                campos = linea_txt.split(',')
-                if len(campos) < 1: continue
-                lineas.append(campos)
-    except Exception as e:
+        total_lineas = procesar_en_flujo(archivo_entrada, archivo_salida, marcar_codigo)
+    except ErrorLectura as e:
         print(f"Error al leer: {e}")
         input("Presiona Intro...")
         return
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
 
-    if not lineas:
+    if not total_lineas:
         print("Archivo vacío.")
         return
 
-    lineas_procesadas = []
-    total_lineas = len(lineas)
-
-    for i in range(total_lineas):
-        campos_actuales = lineas[i]
-        codigo_raw_actual = campos_actuales[-1]
-        
-        id_actual, tiene_f_actual = obtener_id_limpio(codigo_raw_actual)
-        
-        # Mirar ANTERIOR
-        if i > 0:
-            codigo_raw_prev = lineas[i-1][-1]
-            id_prev, _ = obtener_id_limpio(codigo_raw_prev)
-        else:
-            id_prev = None 
-
-        # Mirar SIGUIENTE
-        if i < total_lineas - 1:
-            codigo_raw_next = lineas[i+1][-1]
-            id_next, _ = obtener_id_limpio(codigo_raw_next)
-        else:
-            id_next = None
-
-        # --- LÓGICA FASE 2 ---
-        
-        # 1. Detectar Inicio: Cambio ID + Continuidad
-        es_nuevo_id = (id_actual != id_prev)
-        tiene_continuidad = (id_actual == id_next)
-        es_inicio = es_nuevo_id and tiene_continuidad
-
-        # 2. Reconstruir Código
-        # Base: El código original SIN la F (porque en Fase 2 "se eliminan las F")
-        if tiene_f_actual:
-            # Si tenía F, la quitamos del string original
-            # Cuidado: codigo_raw_actual puede ser '3&MuroF'
-            # Hay que quitar la 'F' del final conservando el '3&Muro'
-            base_sin_f = codigo_raw_actual.strip()[:-1] 
-        else:
-            base_sin_f = codigo_raw_actual.strip()
-
-        nuevos_digitos = ""
-        if es_inicio:
-            nuevos_digitos = "00"
-        
-        # Resultado: CódigoBase + 00 (si inicio)
-        # Nota: Si era Fin, ya le quitamos la F en 'base_sin_f'
-        final_codigo = base_sin_f + nuevos_digitos
-        
-        # Guardar en copia
-        campos_salida = list(campos_actuales)
-        campos_salida[-1] = final_codigo
-        lineas_procesadas.append(campos_salida)
-
-    # Escritura
-    try:
-        with open(archivo_salida, 'w', encoding='utf-8') as f_out:
-            for campos in lineas_procesadas:
-                f_out.write(','.join(campos) + '\n')
-        print(f"¡Éxito Fase 2! Generado: {archivo_salida}")
-    except Exception as e:
-        print(f"Error escritura: {e}")
+    print(f"¡Éxito Fase 2! Generado: {archivo_salida}")
+    perfil.marca('flujo', total_lineas)
+    perfil.emitir(total_lineas)
+    return total_lineas
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
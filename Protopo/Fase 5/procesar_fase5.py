@@ -1,5 +1,19 @@
 import os
 import sys
+from itertools import chain
+
+# Paquete común 'protopo' (carpeta Protopo/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from protopo import columnar
+from protopo.cache import CacheResultados, procesar_con_cache
+from protopo.flujo import escribir_lineas, leer_lineas, num_punto
+from protopo.perfil import perfil_desde_entorno
+from protopo.orden import Punto, agrupar_lineas, ordenar_grupos, recorrer_grupos
+from protopo.orden_externo import ordenar_por_grupos_externo
+from protopo.codigos import codigo_tipo_contador
+
+# Subir al cambiar lo que escribe la fase (invalida la caché de resultados)
+VERSION_REGLAS = 1
 
 # Estructura de campos esperada:
 # 0: Estacion
@@ -9,157 +23,181 @@ import sys
 
 def parsear_codigo(codigo_completo):
     """
-    Retorna: tipo, contador, tiene_f
+    Retorna: Codigo(tipo, contador, tiene_f, atributos)
+    Cada código distinto se parsea una sola vez (tabla compartida).
     """
-    codigo = codigo_completo.strip()
-    
-    tiene_f = False
-    if codigo.lower().endswith('f'):
-        tiene_f = True
-        codigo = codigo[:-1] 
-    
-    if '&' in codigo:
-        partes = codigo.split('&')
-        contador = partes[-1] # Ultima parte es el contador
-        tipo = "&".join(partes[:-1]) # El resto es el tipo
-    else:
-        tipo = codigo
-        contador = None 
-        
-    return tipo, contador, tiene_f
+    return codigo_tipo_contador(codigo_completo)
+
+def procesar_fase5_columnar(archivo_entrada, archivo_salida):
+    """
+    Misma regla que procesar_fase5, pero con la tabla de puntos por
+    columnas (NumPy): agrupación y ordenación vectorizadas.
+    """
+    perfil = perfil_desde_entorno(5, archivo_entrada, 'columnar')
+    try:
+        tabla = columnar.TablaPuntos.leer(archivo_entrada, parsear_codigo, campo_punto=1, min_campos=2, perfil=perfil)
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+
+    if not len(tabla):
+        print("Archivo vacío.")
+        return
+
+    orden, es_inicio = columnar.orden_por_grupos(tabla, perfil)
+
+    # Inicio de línea -> Tipo00, resto (y puntos sueltos) -> Tipo limpio
+    tipos = [info.tipo for info in tabla.info]
+    codigos_salida = (
+        tipos[idx] + "00" if inicio else tipos[idx]
+        for idx, inicio in zip(tabla.id_codigo[orden].tolist(), es_inicio.tolist())
+    )
+    if perfil.activo:
+        codigos_salida = list(codigos_salida) # Medidos aparte de la escritura
+    perfil.marca('codigos', len(tabla))
+
+    try:
+        tabla.escribir(archivo_salida, orden, codigos_salida)
+        perfil.marca('escritura', len(tabla))
+        print(f"¡Éxito Fase 5! Generado: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    if perfil.activo:
+        perfil.grupos(columnar.cuentas_grupos(tabla))
+    perfil.emitir(len(tabla))
+    return len(tabla)
+
+def procesar_fase5_externo(archivo_entrada, archivo_salida, memoria_max_mb):
+    """
+    Misma regla que procesar_fase5, para ficheros más grandes que la memoria:
+    ordena por tandas de como mucho 'memoria_max_mb' MB en ficheros
+    temporales y las mezcla al escribir (ver protopo.orden_externo).
+    """
+    perfil = perfil_desde_entorno(5, archivo_entrada, 'externo')
+    filas = ordenar_por_grupos_externo(archivo_entrada, parsear_codigo, 1, memoria_max_mb)
+    filas = perfil.contando(filas, 1)
+
+    # La lectura y el reparto en tandas ocurren al pedir la primera fila
+    try:
+        primera = next(filas, None)
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+
+    # En este motor 'ordenacion' incluye la lectura y el reparto en tandas
+    perfil.marca('ordenacion')
+
+    if primera is None:
+        print("Archivo vacío.")
+        return
 
-def procesar_fase5(archivo_entrada, archivo_salida):
+    # Inicio de línea -> Tipo00, resto (y puntos sueltos) -> Tipo limpio
+    lineas_salida = (
+        prefijo + info.tipo + ("00" if es_inicio else "")
+        for prefijo, info, es_inicio in chain([primera], filas)
+    )
+
+    try:
+        total = escribir_lineas(archivo_salida, lineas_salida)
+        perfil.marca('escritura', total) # Mezcla de tandas, códigos y escritura
+        print(f"¡Éxito Fase 5! Generado: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    perfil.emitir(total)
+    return total
+
+def procesar_fase5(archivo_entrada, archivo_salida, memoria_max_mb=None):
+    """
+    Agrupa, ordena y limpia los códigos.
+    Con 'memoria_max_mb' el fichero se ordena fuera de memoria.
+    """
     print(f"Fase 5 (Sort) - Leyendo: {archivo_entrada}...")
     
-    lineas = []
+    if memoria_max_mb:
+        return procesar_fase5_externo(archivo_entrada, archivo_salida, memoria_max_mb)
+
+    if columnar.HAY_NUMPY:
+        return procesar_fase5_columnar(archivo_entrada, archivo_salida)
+
+    perfil = perfil_desde_entorno(5, archivo_entrada, 'python')
+
+    # Un Punto (__slots__) por fila: prefijo de texto, número e info del código
+    puntos = []
     try:
-        with open(archivo_entrada, 'r', encoding='utf-8') as f:
-            for raw_linea in f:
-                linea_txt = raw_linea.strip()
-                if not linea_txt: continue
-                campos = linea_txt.split(',')
-                if len(campos) < 2: continue 
-                lineas.append(campos)
+        for linea_txt, corte in leer_lineas(archivo_entrada, min_campos=2):
+            info = parsear_codigo(linea_txt[corte:])
+            puntos.append(Punto(linea_txt[:corte], num_punto(linea_txt, 1), info)) # Campo 1: PUNTO
     except Exception as e:
         print(f"Error lectura: {e}")
         return
 
-    if not lineas:
+    if not puntos:
         print("Archivo vacío.")
         return
 
+    perfil.marca('lectura', len(puntos))
+
     # --- 1. AGRUPACIÓN ---
-    grupos = [] 
-    mapa_grupos = {}
-    puntos_sueltos_idx = 0 
-    
-    for campos in lineas:
-        cod_raw = campos[-1]
-        tipo, contador, _ = parsear_codigo(cod_raw)
-        
-        try:
-            num_punto = float(campos[1]) 
-        except:
-            num_punto = 0 
-            
-        punto_obj = {
-            'campos': campos,
-            'num': num_punto
-        }
-
-        if contador is not None:
-            # Línea numerada: Agrupar por (Tipo, Contador)
-            clave_grupo = (tipo, contador)
-            
-            if clave_grupo in mapa_grupos:
-                idx = mapa_grupos[clave_grupo]
-                grupos[idx]['puntos'].append(punto_obj)
-            else:
-                nuevo_grupo = {
-                    'tipo': 'linea',
-                    'clave': clave_grupo,
-                    'puntos': [punto_obj],
-                    'primer_orden': len(grupos), # Orden de llegada original (fallback)
-                    'min_punto': float('inf')    # Se calculará despues
-                }
-                grupos.append(nuevo_grupo)
-                mapa_grupos[clave_grupo] = len(grupos) - 1
-        else:
-            # Punto suelto: Se queda solo
-            # Usamos num_punto también para ordenarlos luego entre sí
-            nuevo_grupo = {
-                'tipo': 'suelto',
-                'clave': (tipo, f"suelto_{puntos_sueltos_idx}"),
-                'puntos': [punto_obj],
-                'primer_orden': len(grupos),
-                'min_punto': num_punto 
-            }
-            grupos.append(nuevo_grupo)
-            puntos_sueltos_idx += 1
+    # Por (Tipo, Contador); cada punto suelto va solo (ver protopo.orden)
+    elementos, lineas = agrupar_lineas(puntos)
+
+    perfil.marca('agrupacion', len(puntos))
 
     # --- 2. ORDENACIÓN ---
-    
-    # A) Ordenar PUNTOS dentro de cada grupo
-    for grp in grupos:
-        if grp['tipo'] == 'linea':
-            grp['puntos'].sort(key=lambda x: x['num'])
-            # El min_punto es el del primero tras ordenar
-            if grp['puntos']:
-                grp['min_punto'] = grp['puntos'][0]['num']
-            else:
-                grp['min_punto'] = float('inf')
-
-    # B) Ordenar GRUPOS entre sí por 'min_punto'
-    grupos.sort(key=lambda x: x['min_punto'])
+    # Puntos dentro de cada línea; luego líneas y sueltos por su número más bajo
+    ordenar_grupos(elementos, lineas)
+
+    perfil.marca('ordenacion', len(puntos))
 
     # --- 3. PROCESAMIENTO SALIDA ---
-    lineas_salida = []
-    
-    for grp in grupos:
-        puntos = grp['puntos']
-        if not puntos: continue
-        
-        # Tipo base del primer punto
-        tipo_base, _, _ = parsear_codigo(puntos[0]['campos'][-1])
-        
-        for i, p in enumerate(puntos):
-            campos_orig = list(p['campos'])
-            
-            nuevo_cod = tipo_base
-            
-            if grp['tipo'] == 'linea':
-                # Regla Fase 4: Inicio -> 00
-                if i == 0:
-                    nuevo_cod += "00"
-                # Resto -> Limpio
-            else:
-                # Puntos sueltos -> Limpio
-                pass
-            
-            campos_orig[-1] = nuevo_cod
-            lineas_salida.append(campos_orig)
+    # Inicio de línea -> Tipo00, resto (y puntos sueltos) -> Tipo limpio
+    salida = (
+        p.prefijo + (tipo_base + "00" if es_inicio else tipo_base)
+        for p, tipo_base, es_inicio in recorrer_grupos(elementos)
+    )
+    if perfil.activo:
+        salida = list(salida) # Medidos aparte de la escritura
+    perfil.marca('codigos', len(puntos))
 
     # Escritura
     try:
-        with open(archivo_salida, 'w', encoding='utf-8') as f_out:
-            for campos in lineas_salida:
-                f_out.write(','.join(campos) + '\n')
+        total = escribir_lineas(archivo_salida, salida)
+        perfil.marca('escritura', total)
         print(f"¡Éxito Fase 5! Generado: {archivo_salida}")
     except Exception as e:
         print(f"Error escritura: {e}")
+        return
+    perfil.contar(p.info for p in puntos)
+    perfil.emitir(total)
+    return total
 
 if __name__ == "__main__":
+    # Ordenación fuera de memoria si se fija un presupuesto (MB)
+    memoria_mb = os.environ.get("PROTOPO_MEMORIA_MB")
+    memoria_mb = float(memoria_mb) if memoria_mb else None
+
+    # Caché de resultados por contenido si se fija PROTOPO_CACHE
+    cache = CacheResultados.desde_entorno()
+
+    def procesar(entrada, salida):
+        if cache is None:
+            return procesar_fase5(entrada, salida, memoria_mb)
+        return procesar_con_cache(cache, 5, VERSION_REGLAS, procesar_fase5, entrada, salida,
+                                  memoria_max_mb=memoria_mb)
+
     if len(sys.argv) > 1:
         ruta_entrada = sys.argv[1]
         folder = os.path.dirname(ruta_entrada)
         nombre_base = os.path.splitext(os.path.basename(ruta_entrada))[0]
         ruta_salida = os.path.join(folder, f"{nombre_base}_fase5.txt")
-        procesar_fase5(ruta_entrada, ruta_salida)
+        procesar(ruta_entrada, ruta_salida)
     else:
         # Default para testing
         entrada = "entrada_fase5.txt"
         salida = "entrada_fase5_fase5.txt" # Forzamos este nombre para coincidir con la prueba
         if os.path.exists(entrada):
-            procesar_fase5(entrada, salida)
+            procesar(entrada, salida)
         else:
             print(f"No encuentro {entrada}")
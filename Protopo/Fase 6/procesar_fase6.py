@@ -1,5 +1,19 @@
 import os
 import sys
+from itertools import chain
+
+# Paquete común 'protopo' (carpeta Protopo/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from protopo import columnar
+from protopo.cache import CacheResultados, procesar_con_cache
+from protopo.flujo import escribir_lineas, leer_lineas, num_punto
+from protopo.perfil import perfil_desde_entorno
+from protopo.orden import Punto, agrupar_lineas, ordenar_grupos, recorrer_grupos
+from protopo.orden_externo import ordenar_por_grupos_externo
+from protopo.codigos import codigo_con_atributos
+
+# Subir al cambiar lo que escribe la fase (invalida la caché de resultados)
+VERSION_REGLAS = 1
 
 # Estructura de campos esperada:
 # 0: Estacion
@@ -10,194 +24,190 @@ import sys
 def parsear_codigo_completo(codigo_raw):
     """
     Descompone el código en:
-    - Base limpia (para lógica de agrupación Tipo&Contador)
-    - Sufijos especiales (todo lo que va con @)
+    - Tipo y Contador de la base limpia (para lógica de agrupación Tipo&Contador)
+    - Atributos (todo lo que va con @, sin la @)
     - Tiene F "clásica" (termina en F sin ser @F)
+    Retorna un Codigo(tipo, contador, tiene_f, atributos).
+    Cada código distinto se parsea una sola vez (tabla compartida).
     """
-    codigo = codigo_raw.strip()
-    
-    # Separar por @
-    # Ejemplo: 59&1@AS@C -> base="59&1", partes_at=["AS", "C"]
-    if '@' in codigo:
-        trozos = codigo.split('@')
-        base = trozos[0]
-        atributos = trozos[1:] # Lista de atributos (sin el @)
-    else:
-        base = codigo
-        atributos = []
-
-    # Analizar la BASE para sacar Tipo, Contador y F "antigua"
-    tiene_f_base = False
-    if base.lower().endswith('f'):
-        # Cuidado: si el tipo es "DEF", termina en F pero es parte del nombre
-        # La F de fin de línea suele ir al final del contador "59&1F"
-        # O si es punto suelto "MuroF"? -> Asumiremos logica anterior:
-        # Si hay &, la F al final es marcador. Si no hay &, ¿es marcador o nombre?
-        # En fases anteriores: "tiene_f = True, codigo = codigo[:-1]"
-        # Mantenemos esa lógica conservadora para la BASE.
-        tiene_f_base = True
-        base_sin_f = base[:-1]
-    else:
-        base_sin_f = base
+    return codigo_con_atributos(codigo_raw)
 
-    # Parsear Tipo y Contador de la base limpia
-    if '&' in base_sin_f:
-        partes = base_sin_f.split('&')
-        contador = partes[-1]
-        tipo = "&".join(partes[:-1])
-    else:
-        tipo = base_sin_f
-        contador = None
+def procesar_fase6_columnar(archivo_entrada, archivo_salida):
+    """
+    Misma regla que procesar_fase6, pero con la tabla de puntos por
+    columnas (NumPy): agrupación y ordenación vectorizadas.
+    """
+    perfil = perfil_desde_entorno(6, archivo_entrada, 'columnar')
+    try:
+        tabla = columnar.TablaPuntos.leer(archivo_entrada, parsear_codigo_completo, campo_punto=0, min_campos=2, perfil=perfil)
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+
+    if not len(tabla):
+        print("Archivo vacío.")
+        return
+
+    orden, es_inicio = columnar.orden_por_grupos(tabla, perfil)
+
+    # Por cada código distinto: Tipo y sufijos (@ cambiadas por espacios)
+    tipos = [info.tipo for info in tabla.info]
+    sufijos = [" " + " ".join(info.atributos) if info.atributos else "" for info in tabla.info]
+    codigos_salida = (
+        tipos[idx] + ("00" if inicio else "") + sufijos[idx]
+        for idx, inicio in zip(tabla.id_codigo[orden].tolist(), es_inicio.tolist())
+    )
+    if perfil.activo:
+        codigos_salida = list(codigos_salida) # Medidos aparte de la escritura
+    perfil.marca('codigos', len(tabla))
+
+    try:
+        tabla.escribir(archivo_salida, orden, codigos_salida)
+        perfil.marca('escritura', len(tabla))
+        print(f"¡Éxito Fase 6! Generado: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    if perfil.activo:
+        perfil.grupos(columnar.cuentas_grupos(tabla))
+    perfil.emitir(len(tabla))
+    return len(tabla)
+
+def procesar_fase6_externo(archivo_entrada, archivo_salida, memoria_max_mb):
+    """
+    Misma regla que procesar_fase6, para ficheros más grandes que la memoria:
+    ordena por tandas de como mucho 'memoria_max_mb' MB en ficheros
+    temporales y las mezcla al escribir (ver protopo.orden_externo).
+    """
+    perfil = perfil_desde_entorno(6, archivo_entrada, 'externo')
+    filas = ordenar_por_grupos_externo(archivo_entrada, parsear_codigo_completo, 0, memoria_max_mb)
+    filas = perfil.contando(filas, 1)
+
+    # La lectura y el reparto en tandas ocurren al pedir la primera fila
+    try:
+        primera = next(filas, None)
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+
+    # En este motor 'ordenacion' incluye la lectura y el reparto en tandas
+    perfil.marca('ordenacion')
+
+    if primera is None:
+        print("Archivo vacío.")
+        return
 
-    return {
-        'tipo': tipo,
-        'contador': contador,
-        'atributos': atributos,
-        'base_original': base # Para depuración si hace falta
-    }
+    # Tipo (+00 al inicio de línea) y atributos con las @ cambiadas por espacios
+    lineas_salida = (
+        prefijo + info.tipo + ("00" if es_inicio else "")
+        + (" " + " ".join(info.atributos) if info.atributos else "")
+        for prefijo, info, es_inicio in chain([primera], filas)
+    )
 
-def procesar_fase6(archivo_entrada, archivo_salida):
+    try:
+        total = escribir_lineas(archivo_salida, lineas_salida)
+        perfil.marca('escritura', total) # Mezcla de tandas, códigos y escritura
+        print(f"¡Éxito Fase 6! Generado: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    perfil.emitir(total)
+    return total
+
+def procesar_fase6(archivo_entrada, archivo_salida, memoria_max_mb=None):
+    """
+    Agrupa, ordena y limpia los códigos.
+    Con 'memoria_max_mb' el fichero se ordena fuera de memoria.
+    """
     print(f"Fase 6 (@) - Leyendo: {archivo_entrada}...")
     
-    lineas = []
+    if memoria_max_mb:
+        return procesar_fase6_externo(archivo_entrada, archivo_salida, memoria_max_mb)
+
+    if columnar.HAY_NUMPY:
+        return procesar_fase6_columnar(archivo_entrada, archivo_salida)
+
+    perfil = perfil_desde_entorno(6, archivo_entrada, 'python')
+
+    # Un Punto (__slots__) por fila: prefijo de texto, número e info del código
+    puntos = []
     try:
-        with open(archivo_entrada, 'r', encoding='utf-8') as f:
-            for raw_linea in f:
-                linea_txt = raw_linea.strip()
-                if not linea_txt: continue
-                campos = linea_txt.split(',')
-                if len(campos) < 2: continue 
-                lineas.append(campos)
+        for linea_txt, corte in leer_lineas(archivo_entrada, min_campos=2):
+            info = parsear_codigo_completo(linea_txt[corte:])
+            puntos.append(Punto(linea_txt[:corte], num_punto(linea_txt, 0), info)) # Campo 0 es el número de punto en este formato
     except Exception as e:
         print(f"Error lectura: {e}")
         return
 
-    if not lineas:
+    if not puntos:
         print("Archivo vacío.")
         return
 
+    perfil.marca('lectura', len(puntos))
+
     # --- 1. AGRUPACIÓN ---
-    grupos = [] 
-    mapa_grupos = {}
-    puntos_sueltos_idx = 0 
-    
-    for campos in lineas:
-        cod_raw = campos[-1]
-        info = parsear_codigo_completo(cod_raw)
-        
-        tipo = info['tipo']
-        contador = info['contador']
-        
-        try:
-            num_punto = float(campos[0]) # Campo 0 es el número de punto en este formato
-        except:
-            num_punto = 0 
-            
-        punto_obj = {
-            'campos': campos,
-            'num': num_punto,
-            'info_codigo': info # Guardamos el parseo para usarlo al escribir
-        }
-
-        if contador is not None:
-            # Línea numerada: Agrupar por (Tipo, Contador) IGNORANDO atributos
-            clave_grupo = (tipo, contador)
-            
-            if clave_grupo in mapa_grupos:
-                idx = mapa_grupos[clave_grupo]
-                grupos[idx]['puntos'].append(punto_obj)
-            else:
-                nuevo_grupo = {
-                    'tipo': 'linea',
-                    'clave': clave_grupo,
-                    'puntos': [punto_obj],
-                    'primer_orden': len(grupos),
-                    'min_punto': float('inf')
-                }
-                grupos.append(nuevo_grupo)
-                mapa_grupos[clave_grupo] = len(grupos) - 1
-        else:
-            # Punto suelto
-            nuevo_grupo = {
-                'tipo': 'suelto',
-                'clave': (tipo, f"suelto_{puntos_sueltos_idx}"),
-                'puntos': [punto_obj],
-                'primer_orden': len(grupos),
-                'min_punto': num_punto
-            }
-            grupos.append(nuevo_grupo)
-            puntos_sueltos_idx += 1
+    # Por (Tipo, Contador) IGNORANDO atributos; cada punto suelto va solo (ver protopo.orden)
+    elementos, lineas = agrupar_lineas(puntos)
+
+    perfil.marca('agrupacion', len(puntos))
 
     # --- 2. ORDENACIÓN ---
-    
-    # A) Ordenar PUNTOS dentro de cada grupo
-    for grp in grupos:
-        if grp['tipo'] == 'linea':
-            grp['puntos'].sort(key=lambda x: x['num'])
-            if grp['puntos']:
-                grp['min_punto'] = grp['puntos'][0]['num']
-            else:
-                grp['min_punto'] = float('inf')
-
-    # B) Ordenar GRUPOS entre sí por 'min_punto'
-    grupos.sort(key=lambda x: x['min_punto'])
+    # Puntos dentro de cada línea; luego líneas y sueltos por su número más bajo
+    ordenar_grupos(elementos, lineas)
+
+    perfil.marca('ordenacion', len(puntos))
 
     # --- 3. PROCESAMIENTO SALIDA ---
-    lineas_salida = []
-    
-    for grp in grupos:
-        puntos = grp['puntos']
-        if not puntos: continue
-        
-        # Tipo base del grupo (lo sacamos del primer punto, aunque todos comparten tipo)
-        tipo_base = puntos[0]['info_codigo']['tipo']
-        
-        for i, p in enumerate(puntos):
-            campos_orig = list(p['campos'])
-            info = p['info_codigo']
-            
-            # 1. Construir Parte Principal (Salida Limpia Fase 4)
-            nuevo_cod_base = tipo_base
-            
-            if grp['tipo'] == 'linea':
-                # Inicio -> 00
-                if i == 0:
-                    nuevo_cod_base += "00"
-            
-            # 2. Construir Sufijos (Fase 6)
-            # "Ingore lo que hay detrás de la @ y que al final acabe cambiando las @ por espacios"
-            sufijos_str = ""
-            if info['atributos']:
-                # Unir atributos con espacios (suplantando la @)
-                # Ej: atributos=['AS', 'C'] -> " AS C"
-                sufijos_str = " " + " ".join(info['atributos'])
-            
-            # Codigo Final = BaseModificada + Sufijos
-            codigo_final = nuevo_cod_base + sufijos_str
-            
-            campos_orig[-1] = codigo_final
-            lineas_salida.append(campos_orig)
+    # Tipo (+00 al inicio de línea) y atributos con las @ cambiadas por espacios
+    # Ej: atributos=['AS', 'C'] -> " AS C"
+    def codigo_final(tipo_base, info, inicio):
+        sufijos = " " + " ".join(info.atributos) if info.atributos else ""
+        return tipo_base + ("00" if inicio else "") + sufijos
+
+    salida = (
+        p.prefijo + codigo_final(tipo_base, p.info, es_inicio)
+        for p, tipo_base, es_inicio in recorrer_grupos(elementos)
+    )
+    if perfil.activo:
+        salida = list(salida) # Medidos aparte de la escritura
+    perfil.marca('codigos', len(puntos))
 
     # Escritura
     try:
-        with open(archivo_salida, 'w', encoding='utf-8') as f_out:
-            for campos in lineas_salida:
-                f_out.write(','.join(campos) + '\n')
+        total = escribir_lineas(archivo_salida, salida)
+        perfil.marca('escritura', total)
         print(f"¡Éxito Fase 6! Generado: {archivo_salida}")
     except Exception as e:
         print(f"Error escritura: {e}")
+        return
+    perfil.contar(p.info for p in puntos)
+    perfil.emitir(total)
+    return total
 
 if __name__ == "__main__":
+    # Ordenación fuera de memoria si se fija un presupuesto (MB)
+    memoria_mb = os.environ.get("PROTOPO_MEMORIA_MB")
+    memoria_mb = float(memoria_mb) if memoria_mb else None
+
+    # Caché de resultados por contenido si se fija PROTOPO_CACHE
+    cache = CacheResultados.desde_entorno()
+
+    def procesar(entrada, salida):
+        if cache is None:
+            return procesar_fase6(entrada, salida, memoria_mb)
+        return procesar_con_cache(cache, 6, VERSION_REGLAS, procesar_fase6, entrada, salida,
+                                  memoria_max_mb=memoria_mb)
+
     if len(sys.argv) > 1:
         ruta_entrada = sys.argv[1]
         folder = os.path.dirname(ruta_entrada)
         nombre_base = os.path.splitext(os.path.basename(ruta_entrada))[0]
         ruta_salida = os.path.join(folder, f"{nombre_base}_00.txt")
-        procesar_fase6(ruta_entrada, ruta_salida)
+        procesar(ruta_entrada, ruta_salida)
     else:
         entrada = "entrada_fase6.txt"
         salida = "entrada_fase6_00.txt"
         if os.path.exists(entrada):
-            procesar_fase6(entrada, salida)
+            procesar(entrada, salida)
         else:
             print(f"No encuentro {entrada}")
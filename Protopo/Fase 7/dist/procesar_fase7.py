@@ -1,64 +1,30 @@
 import os
 import sys
+from itertools import chain
+
+# Paquete común 'protopo' (carpeta Protopo/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from protopo import columnar
+from protopo.cache import CacheResultados, procesar_con_cache
+from protopo.flujo import es_indice, escribir_lineas, leer_lineas
+from protopo.incremental import procesar_incremental
+from protopo.perfil import perfil_desde_entorno
+from protopo.orden_externo import ordenar_fase7_externo
+from protopo.codigos import codigo_fase7
+
+# Subir al cambiar lo que escribe la fase (invalida la caché de resultados)
+VERSION_REGLAS = 1
 
 def parsear_codigo(codigo_raw):
     """
     Parsea el código de la última columna.
-    Retorna un diccionario con:
-    - 'original': el código original completo
-    - 'tipo': la parte antes del '&' (o todo si no hay '&')
-    - 'contador': la parte entre '&' y '@' (o None si no hay '&')
-    - 'es_linea': True si tiene '&', False si no.
+    Retorna un Codigo(tipo, contador, tiene_f, atributos):
+    - tipo: la parte antes del '&' (o todo hasta la '@' si no hay '&')
+    - contador: la parte entre '&' y '@' (o None si no hay '&')
+    Es línea (Grupo B) si tiene contador; si no, es punto suelto (Grupo A).
+    Cada código distinto se parsea una sola vez (tabla compartida).
     """
-    codigo = codigo_raw.strip()
-    
-    if '&' not in codigo:
-        # Grupo A: Puntos sueltos
-        # No tienen '&', por lo tanto el tipo es todo el código (sin atributos si los hubiera, 
-        # pero la definición dice "todo lo que esté antes del &", y si no hay &...)
-        # Si hubiera un @ en un punto suelto, la definición "222 - tipo" parece implicar todo hasta el &
-        # Pero si no hay &, ¿hasta el @?
-        # Revisando reglas: "222&7@F". 
-        # Si es punto suelto (Grupo A), "no tendría & ni nada despues del &".
-        # Asumimos que puede tener atributos con @?
-        # "un punto que no pertenece a una línea ... no tiene base"
-        # Simplificación: Todo lo que hay es el Tipo.
-        # Si tiene @, ¿es parte del tipo o son atributos? 
-        # La regla "222 - tipo (todo lo que esté antes del &)" es clave.
-        # Si no hay &, todo es tipo... ¿o hasta el @?
-        # En fases anteriores se separaba por @.
-        # Asumiremos la separacion standard: Tipo es lo principal.
-        # Si viene "Arbol@D", Tipo="Arbol".
-        if '@' in codigo:
-            tipo = codigo.split('@')[0]
-        else:
-            tipo = codigo
-        return {
-            'original': codigo,
-            'tipo': tipo,
-            'contador': None,
-            'es_linea': False
-        }
-    else:
-        # Grupo B: Líneas
-        # "222&7@F"
-        # Tipo: antes del &
-        partes_amp = codigo.split('&')
-        tipo = partes_amp[0]
-        resto = '&'.join(partes_amp[1:]) # Lo que sigue al primer &
-        
-        # Contador: entre & y @
-        if '@' in resto:
-            contador_str = resto.split('@')[0]
-        else:
-            contador_str = resto
-            
-        return {
-            'original': codigo,
-            'tipo': tipo,
-            'contador': contador_str,
-            'es_linea': True
-        }
+    return codigo_fase7(codigo_raw)
 
 def get_type_sort_key(tipo):
     """
@@ -83,18 +49,147 @@ def get_counter_sort_key(contador_str):
     except ValueError:
         return contador_str
 
-def procesar_fase7(archivo_entrada, archivo_salida):
+def procesar_fase7_columnar(archivo_entrada, archivo_salida):
+    """
+    Misma regla que procesar_fase7, pero con la tabla de puntos por
+    columnas (NumPy): clasificación y ordenación vectorizadas.
+    """
+    perfil = perfil_desde_entorno(7, archivo_entrada, 'columnar')
+    try:
+        tabla = columnar.TablaPuntos.leer(archivo_entrada, parsear_codigo, perfil=perfil)
+    except Exception as e:
+        print(f"Error leyendo archivo de entrada: {e}")
+        return
+
+    if not len(tabla):
+        print("El archivo está vacío.")
+        return
+
+    orden, es_inicio, es_linea = columnar.orden_fase7(tabla, get_type_sort_key, get_counter_sort_key, perfil)
+
+    # Grupo B: Tipo00 / Tipo. Grupo A: código original sin tocar.
+    tipos = [info.tipo for info in tabla.info]
+    codigos_raw = tabla.codigos_raw
+    codigos_salida = (
+        (tipos[idx] + "00" if inicio else tipos[idx]) if linea else codigos_raw[idx]
+        for idx, inicio, linea in zip(tabla.id_codigo[orden].tolist(), es_inicio.tolist(), es_linea.tolist())
+    )
+    if perfil.activo:
+        codigos_salida = list(codigos_salida) # Medidos aparte de la escritura
+    perfil.marca('codigos', len(tabla))
+
+    try:
+        tabla.escribir(archivo_salida, orden, codigos_salida)
+        perfil.marca('escritura', len(tabla))
+        print(f"Generado exitosamente: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escribiendo archivo de salida: {e}")
+        return
+    if perfil.activo:
+        perfil.grupos(columnar.cuentas_grupos(tabla))
+    perfil.emitir(len(tabla))
+    return len(tabla)
+
+def procesar_fase7_externo(archivo_entrada, archivo_salida, memoria_max_mb):
+    """
+    Misma regla que procesar_fase7, para ficheros más grandes que la memoria:
+    ordena por tandas de como mucho 'memoria_max_mb' MB en ficheros
+    temporales y las mezcla al escribir (ver protopo.orden_externo).
+    """
+    perfil = perfil_desde_entorno(7, archivo_entrada, 'externo')
+    filas = ordenar_fase7_externo(archivo_entrada, parsear_codigo, get_type_sort_key,
+                                  get_counter_sort_key, memoria_max_mb)
+    filas = perfil.contando(filas, 2)
+
+    # La lectura y el reparto en tandas ocurren al pedir la primera fila
+    try:
+        primera = next(filas, None)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error leyendo archivo de entrada: {e}")
+        return
+
+    # En este motor 'ordenacion' incluye la lectura y el reparto en tandas
+    perfil.marca('ordenacion')
+
+    if primera is None:
+        print("El archivo está vacío.")
+        return
+
+    # Grupo B: Tipo00 / Tipo. Grupo A: código original sin tocar.
+    lineas_salida = (
+        prefijo + (info.tipo + ("00" if es_inicio else "") if info.contador is not None else codigo_raw)
+        for prefijo, codigo_raw, info, es_inicio in chain([primera], filas)
+    )
+
+    try:
+        total = escribir_lineas(archivo_salida, lineas_salida)
+        perfil.marca('escritura', total) # Mezcla de tandas, códigos y escritura
+        print(f"Generado exitosamente: {archivo_salida}")
+    except Exception as e:
+        print(f"Error escribiendo archivo de salida: {e}")
+        return
+    perfil.emitir(total)
+    return total
+
+def codigo_salida(info, codigo_raw, es_inicio):
+    """Grupo B: Tipo00 / Tipo. Grupo A: código original sin tocar."""
+    if info.contador is None:
+        return codigo_raw
+    return info.tipo + "00" if es_inicio else info.tipo
+
+def procesar_fase7_incremental(archivo_entrada, archivo_salida):
+    """
+    Misma regla que procesar_fase7 para un fichero que crece por el final:
+    solo se leen las filas añadidas desde la última pasada y se reescriben
+    las líneas afectadas (ver protopo.incremental).
+    """
+    perfil = perfil_desde_entorno(7, archivo_entrada, 'incremental')
+    try:
+        total, nuevas = procesar_incremental(archivo_entrada, archivo_salida, parsear_codigo,
+                                             get_type_sort_key, get_counter_sort_key,
+                                             codigo_salida, VERSION_REGLAS)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error leyendo archivo de entrada: {e}")
+        return
+
+    if not total:
+        print("El archivo está vacío.")
+        return
+
+    perfil.marca('incremental', nuevas)
+    if nuevas:
+        print(f"Generado exitosamente: {archivo_salida} ({nuevas} filas nuevas)")
+    else:
+        print(f"Sin filas nuevas: {archivo_salida}")
+    perfil.emitir(total)
+    return total
+
+def procesar_fase7(archivo_entrada, archivo_salida, memoria_max_mb=None, incremental=False):
+    """
+    Clasifica, ordena y limpia los códigos.
+    Con 'memoria_max_mb' el fichero se ordena fuera de memoria.
+    Con 'incremental' solo se procesan las filas añadidas desde la última vez.
+    """
     print(f"Fase 7 - Procesando: {archivo_entrada}")
     
+    # Un índice .ptp no crece: se procesa entero
+    if incremental and not es_indice(archivo_entrada):
+        return procesar_fase7_incremental(archivo_entrada, archivo_salida)
+
+    if memoria_max_mb:
+        return procesar_fase7_externo(archivo_entrada, archivo_salida, memoria_max_mb)
+
+    if columnar.HAY_NUMPY:
+        return procesar_fase7_columnar(archivo_entrada, archivo_salida)
+
+    perfil = perfil_desde_entorno(7, archivo_entrada, 'python')
+
     lineas_datos = []
     try:
-        with open(archivo_entrada, 'r', encoding='utf-8') as f:
-            for linea in f:
-                linea = linea.strip()
-                if not linea: continue
-                campos = linea.split(',')
-                if len(campos) < 1: continue
-                lineas_datos.append(campos)
+        # Texto o índice .ptp (ver protopo.indice)
+        for linea, _ in leer_lineas(archivo_entrada):
+            campos = linea.split(',')
+            lineas_datos.append(campos)
     except Exception as e:
         print(f"Error leyendo archivo de entrada: {e}")
         return
@@ -103,6 +198,8 @@ def procesar_fase7(archivo_entrada, archivo_salida):
         print("El archivo está vacío.")
         return
 
+    perfil.marca('lectura', len(lineas_datos))
+
     grupo_a = [] # Puntos sueltos
     grupo_b = [] # Líneas
 
@@ -116,26 +213,30 @@ def procesar_fase7(archivo_entrada, archivo_salida):
             'info': info
         }
         
-        if info['es_linea']:
+        if info.contador is not None:
             grupo_b.append(item)
         else:
             grupo_a.append(item)
 
+    perfil.marca('clasificacion', len(lineas_datos))
+
     # 2. Procesamiento Grupo A (Puntos sueltos)
     # Ordenar: Tipo (Numérico < Alfabético)
-    grupo_a.sort(key=lambda x: get_type_sort_key(x['info']['tipo']))
+    grupo_a.sort(key=lambda x: get_type_sort_key(x['info'].tipo))
     
     # En Grupo A no se modifican los códigos (según instrucciones implícitas, solo se ordenan)
     # o ¿se limpian atributos? "En el grupo A quiero que los puntos se ordenen...". 
     # No dice nada de cambiar el código. Se dejan tal cual.
 
+    perfil.marca('ordenacion', len(grupo_a))
+
     # 3. Procesamiento Grupo B (Líneas)
     # Estructura: Diccionario[Tipo][Contador] = lista_puntos
     b_dict = {}
     
     for item in grupo_b:
-        tipo = item['info']['tipo']
-        contador = item['info']['contador']
+        tipo = item['info'].tipo
+        contador = item['info'].contador
         
         if tipo not in b_dict:
             b_dict[tipo] = {}
@@ -144,6 +245,8 @@ def procesar_fase7(archivo_entrada, archivo_salida):
             
         b_dict[tipo][contador].append(item)
 
+    perfil.marca('agrupacion', len(grupo_b))
+
     # Ordenar Tipos
     tipos_ordenados = sorted(b_dict.keys(), key=get_type_sort_key)
     
@@ -162,7 +265,7 @@ def procesar_fase7(archivo_entrada, archivo_salida):
             for i, item in enumerate(puntos):
                 # Modificar código (borrar bloque &..., añadir 00 al primero)
                 campos_nuevos = list(item['campos'])
-                tipo_limpio = item['info']['tipo']
+                tipo_limpio = item['info'].tipo
                 
                 if i == 0:
                     nuevo_codigo = f"{tipo_limpio}00"
@@ -173,6 +276,9 @@ def procesar_fase7(archivo_entrada, archivo_salida):
                 campos_nuevos[-1] = nuevo_codigo
                 grupo_b_final.append(campos_nuevos)
 
+    # Incluye ordenar tipos y contadores de las líneas (son pocos)
+    perfil.marca('codigos', len(grupo_b_final))
+
     # 4. Escritura Salida (Grupo B primero, luego Grupo A)
     # Nota: Grupo A mantiene sus campos originales, Grupo B tiene campos modificados.
     
@@ -182,11 +288,34 @@ def procesar_fase7(archivo_entrada, archivo_salida):
         with open(archivo_salida, 'w', encoding='utf-8') as f_out:
             for campos in lineas_salida:
                 f_out.write(','.join(campos) + '\n')
+        perfil.marca('escritura', len(lineas_salida))
         print(f"Generado exitosamente: {archivo_salida}")
     except Exception as e:
         print(f"Error escribiendo archivo de salida: {e}")
+        return
+    perfil.contar(item['info'] for item in chain(grupo_b, grupo_a))
+    perfil.emitir(len(lineas_salida))
+    return len(lineas_salida)
 
 if __name__ == "__main__":
+    # Ordenación fuera de memoria si se fija un presupuesto (MB)
+    memoria_mb = os.environ.get("PROTOPO_MEMORIA_MB")
+    memoria_mb = float(memoria_mb) if memoria_mb else None
+
+    # Caché de resultados por contenido si se fija PROTOPO_CACHE
+    cache = CacheResultados.desde_entorno()
+
+    # Fichero que crece durante el día: solo las filas nuevas
+    incremental = os.environ.get("PROTOPO_INCREMENTAL") == "1"
+
+    def procesar(entrada, salida):
+        if incremental:
+            return procesar_fase7(entrada, salida, incremental=True)
+        if cache is None:
+            return procesar_fase7(entrada, salida, memoria_mb)
+        return procesar_con_cache(cache, 7, VERSION_REGLAS, procesar_fase7, entrada, salida,
+                                  memoria_max_mb=memoria_mb)
+
     if len(sys.argv) > 1:
         entrada = sys.argv[1]
     else:
@@ -195,7 +324,9 @@ if __name__ == "__main__":
     if os.path.exists(entrada):
         # Nombre salida: nombre_original_fase7.txt
         base, ext = os.path.splitext(entrada)
+        if ext.lower() == '.ptp':
+            ext = '.txt' # Índice binario: la salida es texto
         salida = f"{base}_fase7{ext}"
-        procesar_fase7(entrada, salida)
+        procesar(entrada, salida)
     else:
         print(f"No se encuentra el archivo de entrada: {entrada}")
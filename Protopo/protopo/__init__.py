@@ -0,0 +1,7 @@
+"""
+Código común de las fases de Protopo.
+
+Cada 'Fase N/procesar_faseN.py' sigue siendo un script independiente
+(se arrastra el fichero sobre el exe), pero la lectura, escritura y el
+resto de piezas compartidas viven aquí para no copiarlas en cada fase.
+"""
@@ -0,0 +1,6 @@
+"""python -m protopo: cadena de etapas (ver protopo.cadena)."""
+import sys
+
+from protopo.cadena import main
+
+sys.exit(main())
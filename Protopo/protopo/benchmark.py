@@ -0,0 +1,201 @@
+"""
+Banco de pruebas de rendimiento de las fases con datos sintéticos.
+
+Genera (una vez) ficheros de protopo.sintetico de distintos tamaños y
+ejecuta sobre ellos cada procesar_faseN, cada medida en un proceso nuevo
+para que el pico de memoria (RSS) sea solo el de esa fase. Guarda filas/s
+y pico de memoria en un JSON; con --comparar se muestra la diferencia con
+un JSON anterior para ver regresiones.
+
+Uso:
+    python -m protopo.benchmark [--filas 1000,100000,1000000] [--fases 5,6,7]
+                                [--salida resultados.json] [--comparar anterior.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from protopo import fases, sintetico
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+FILAS_POR_DEFECTO = (1000, 10000, 100000, 1000000)
+
+# La fase 6 toma el número de punto del primer campo (ficheros de coordenadas)
+FORMATO_FASE = {6: 'coordenadas'}
+
+
+def pico_rss_mb():
+    """Pico de memoria del proceso actual en MB (None si no se puede medir)."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux da KB; macOS, bytes
+        return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+
+
+def medir(fase, entrada, salida, opciones, sin_numpy=False):
+    """
+    Ejecuta la fase una vez (en el proceso actual) y retorna un dict con
+    filas, segundos, pico de memoria antes y después.
+    """
+    funcion = fases.cargar(fase)
+    if sin_numpy:
+        from protopo import columnar
+        columnar.HAY_NUMPY = False
+
+    rss_base = pico_rss_mb()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        filas = funcion(entrada, salida, **opciones)
+    segundos = time.perf_counter() - inicio
+    return {'filas': filas, 'segundos': segundos, 'rss_base_mb': rss_base, 'pico_rss_mb': pico_rss_mb()}
+
+
+def medir_en_proceso(fase, entrada, salida, opciones, sin_numpy=False):
+    """Como medir(), pero en un proceso nuevo (pico de memoria limpio)."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(medir, fase, entrada, salida, opciones, sin_numpy).result()
+
+
+def ejecutar(tamanos, lista_fases, carpeta, repeticiones=1, memoria_max_mb=None, sin_numpy=False):
+    """
+    Mide cada fase con cada tamaño (mejor tiempo de 'repeticiones').
+    Retorna la lista de resultados (un dict por fase y tamaño).
+    """
+    resultados = []
+    for filas in tamanos:
+        for fase in lista_fases:
+            formato = FORMATO_FASE.get(fase, 'radiacion')
+            # Con la versión en el nombre no se reutilizan ficheros de un generador anterior
+            entrada = os.path.join(carpeta, f"sintetico_v{sintetico.VERSION}_{formato}_{filas}.txt")
+            if not os.path.exists(entrada):
+                print(f"Generando {entrada}...")
+                sintetico.generar(entrada, filas, formato)
+            salida = fases.ruta_salida(fase, entrada)
+
+            opciones = {}
+            if memoria_max_mb and fase in fases.FASES_CON_ORDEN:
+                opciones['memoria_max_mb'] = memoria_max_mb
+
+            medidas = [medir_en_proceso(fase, entrada, salida, opciones, sin_numpy) for _ in range(repeticiones)]
+            mejor = min(medidas, key=lambda m: m['segundos'])
+            if os.path.exists(salida):
+                os.remove(salida)
+
+            resultado = {
+                'fase': fase,
+                'filas_entrada': filas,
+                'formato': formato,
+                'filas': mejor['filas'],
+                'segundos': round(mejor['segundos'], 4),
+                'filas_s': round(filas / mejor['segundos']) if mejor['segundos'] > 0 else None,
+                'rss_base_mb': _redondear(mejor['rss_base_mb']),
+                'pico_rss_mb': _redondear(mejor['pico_rss_mb']),
+            }
+            resultados.append(resultado)
+            print(f"Fase {fase} {filas:>10} filas: {resultado['segundos']:8.3f} s  "
+                  f"{resultado['filas_s'] or 0:>12,} filas/s  pico {resultado['pico_rss_mb']} MB")
+    return resultados
+
+
+def _redondear(valor):
+    return round(valor, 1) if valor is not None else None
+
+
+def entorno(memoria_max_mb, sin_numpy):
+    """Datos de la máquina y de la configuración para el JSON."""
+    try:
+        import numpy
+        version_numpy = None if sin_numpy else numpy.__version__
+    except ImportError:
+        version_numpy = None
+    return {
+        'fecha': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'numpy': version_numpy,
+        'memoria_max_mb': memoria_max_mb,
+    }
+
+
+def comparar(resultados, ruta_anterior):
+    """Imprime el cambio de filas/s respecto a un JSON anterior."""
+    with open(ruta_anterior, 'r', encoding='utf-8') as f:
+        anterior = {(r['fase'], r['filas_entrada']): r for r in json.load(f)['resultados']}
+
+    print()
+    print(f"COMPARACIÓN CON {ruta_anterior}")
+    for r in resultados:
+        previo = anterior.get((r['fase'], r['filas_entrada']))
+        if not previo or not previo.get('filas_s') or not r['filas_s']:
+            continue
+        cambio = (r['filas_s'] / previo['filas_s'] - 1) * 100
+        aviso = "  <-- MÁS LENTO" if cambio < -10 else ""
+        print(f"Fase {r['fase']} {r['filas_entrada']:>10} filas: {previo['filas_s']:>12,} -> "
+              f"{r['filas_s']:>12,} filas/s ({cambio:+.1f}%){aviso}")
+
+
+def _lista_enteros(texto):
+    return [int(float(x)) for x in texto.split(',') if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mide filas/s y pico de memoria de las fases con datos sintéticos.")
+    parser.add_argument('--filas', type=_lista_enteros, default=list(FILAS_POR_DEFECTO),
+                        help="Tamaños separados por comas (por defecto 1000,10000,100000,1000000; hasta 10000000)")
+    parser.add_argument('--fases', type=_lista_enteros, default=sorted(fases.FASES),
+                        help="Fases a medir separadas por comas (por defecto todas)")
+    parser.add_argument('--carpeta', default=None,
+                        help="Carpeta para los ficheros sintéticos (se reutilizan entre ejecuciones)")
+    parser.add_argument('--salida', default='benchmark_protopo.json', help="JSON de resultados")
+    parser.add_argument('--comparar', default=None, metavar='JSON', help="JSON anterior con el que comparar")
+    parser.add_argument('--repeticiones', type=int, default=1, help="Repeticiones por medida (se toma la mejor)")
+    parser.add_argument('--memoria-mb', type=float, default=None,
+                        help="Fases 5-7: medir la ordenación fuera de memoria con este presupuesto")
+    parser.add_argument('--perfil', nargs='?', const='1', default=None, metavar='FICHERO',
+                        help="Medir cada etapa de la fase (líneas JSON a stderr o añadidas a FICHERO)")
+    parser.add_argument('--sin-numpy', action='store_true', help="Fases 5-7: medir el motor en Python puro")
+    args = parser.parse_args(argv)
+
+    # Los procesos hijos heredan la variable (ver protopo.perfil)
+    if args.perfil:
+        os.environ["PROTOPO_PERFIL"] = os.path.abspath(args.perfil) if args.perfil != '1' else '1'
+
+    for fase in args.fases:
+        if fase not in fases.FASES:
+            parser.error(f"Fase desconocida: {fase}")
+
+    carpeta = args.carpeta or os.path.join(tempfile.gettempdir(), 'protopo_benchmark')
+    os.makedirs(carpeta, exist_ok=True)
+
+    resultados = ejecutar(args.filas, args.fases, carpeta, args.repeticiones, args.memoria_mb, args.sin_numpy)
+
+    with open(args.salida, 'w', encoding='utf-8') as f:
+        json.dump({'entorno': entorno(args.memoria_mb, args.sin_numpy), 'resultados': resultados},
+                  f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        comparar(resultados, args.comparar)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Caché de resultados por contenido para las fases 5, 6 y 7.
+
+La clave es (hash del fichero de entrada, fase, versión de reglas). Si un
+fichero no ha cambiado desde la última vez, en vez de leer, agrupar,
+ordenar y escribir se copia (o se enlaza) la salida guardada: calcular el
+hash es mucho más barato que procesar.
+
+Las entradas se guardan como ficheros en una carpeta ('ab/abcdef...txt').
+Cada uso se apunta en 'usos.log' (no se toca la fecha de la entrada, que con
+--enlazar es la misma que la de la salida del usuario) y, cuando la carpeta
+pasa del tamaño máximo, se borran las menos usadas (LRU). La poda recorre la
+carpeta entera: se hace una vez por fichero suelto o una vez al final del lote.
+
+Carpeta por defecto: variable de entorno PROTOPO_CACHE, o ~/.protopo/cache.
+"""
+import hashlib
+import os
+import shutil
+import time
+
+CARPETA_POR_DEFECTO = os.path.join(os.path.expanduser('~'), '.protopo', 'cache')
+MAX_MB_POR_DEFECTO = 2048
+USOS = 'usos.log'
+
+
+def hash_fichero(ruta, tam_bloque=1 << 20):
+    """SHA-256 del contenido del fichero (hex)."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def contar_lineas(ruta, tam_bloque=1 << 20):
+    total = 0
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            total += bloque.count(b'\n')
+    return total
+
+
+class CacheResultados:
+    """
+    Caché en disco de salidas de fase.
+    'enlazar=True' crea la salida como enlace duro a la entrada de la caché
+    (sin copiar); en ese caso NO hay que editar la salida a mano, porque se
+    editaría también la copia guardada.
+    """
+
+    def __init__(self, carpeta=None, max_mb=MAX_MB_POR_DEFECTO, enlazar=False):
+        self.carpeta = carpeta or CARPETA_POR_DEFECTO
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.enlazar = enlazar
+        os.makedirs(self.carpeta, exist_ok=True)
+
+    @classmethod
+    def desde_entorno(cls):
+        """Caché en PROTOPO_CACHE, o None si la variable no está definida."""
+        carpeta = os.environ.get("PROTOPO_CACHE")
+        if not carpeta:
+            return None
+        max_mb = os.environ.get("PROTOPO_CACHE_MB")
+        return cls(carpeta, float(max_mb) if max_mb else MAX_MB_POR_DEFECTO)
+
+    def clave(self, ruta_entrada, fase, version_reglas):
+        return f"{hash_fichero(ruta_entrada)}_f{fase}_v{version_reglas}"
+
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta, clave[:2], clave + '.txt')
+
+    def obtener(self, clave, ruta_salida):
+        """Si la clave está en la caché deja su salida en 'ruta_salida' y retorna True."""
+        entrada = self._ruta(clave)
+        if not os.path.exists(entrada):
+            return False
+
+        self._anotar_uso(clave)
+        if os.path.exists(ruta_salida):
+            os.remove(ruta_salida)
+        if self.enlazar:
+            try:
+                os.link(entrada, ruta_salida)
+                return True
+            except OSError:
+                pass # Otro disco o sistema sin enlaces: se copia
+        shutil.copyfile(entrada, ruta_salida)
+        return True
+
+    def _anotar_uso(self, clave):
+        """Último uso de la entrada (para la poda LRU). Líneas cortas en modo 'a': no se mezclan entre procesos."""
+        try:
+            with open(os.path.join(self.carpeta, USOS), 'a', encoding='ascii') as f:
+                f.write(f"{time.time():.3f} {clave}\n")
+        except OSError:
+            pass # Sin registro la entrada cuenta desde su creación
+
+    def _leer_usos(self):
+        """{clave: último uso} del registro."""
+        usos = {}
+        try:
+            with open(os.path.join(self.carpeta, USOS), 'r', encoding='ascii', errors='replace') as f:
+                for linea in f:
+                    momento, _, clave = linea.strip().partition(' ')
+                    try:
+                        usos[clave] = max(usos.get(clave, 0.0), float(momento))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return usos
+
+    def guardar(self, clave, ruta_salida, podar=True):
+        """Guarda una copia de 'ruta_salida' bajo la clave y, con 'podar', poda si hace falta."""
+        destino = self._ruta(clave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+        # Copia a temporal + rename: nunca queda una entrada a medias
+        temporal = f"{destino}.{os.getpid()}.tmp"
+        try:
+            shutil.copyfile(ruta_salida, temporal)
+            os.replace(temporal, destino)
+        except Exception:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+        self._anotar_uso(clave)
+        if podar:
+            self.podar()
+
+    def podar(self):
+        """
+        Borra las entradas menos usadas hasta quedar por debajo del tamaño
+        máximo y compacta el registro de usos (una línea por entrada que queda).
+        """
+        usos = self._leer_usos()
+        entradas = []
+        total = 0
+        for root, _, files in os.walk(self.carpeta):
+            for nombre in files:
+                if not nombre.endswith('.txt'):
+                    continue
+                ruta = os.path.join(root, nombre)
+                try:
+                    st = os.stat(ruta)
+                except OSError:
+                    continue
+                clave = nombre[:-4]
+                entradas.append((max(st.st_mtime, usos.get(clave, 0.0)), st.st_size, ruta, clave))
+                total += st.st_size
+
+        entradas.sort()
+        quedan = []
+        for uso, tam, ruta, clave in entradas:
+            if total > self.max_bytes:
+                try:
+                    os.remove(ruta)
+                    total -= tam
+                    continue
+                except OSError:
+                    pass
+            quedan.append((uso, clave))
+
+        registro = os.path.join(self.carpeta, USOS)
+        temporal = f"{registro}.{os.getpid()}.tmp"
+        try:
+            with open(temporal, 'w', encoding='ascii') as f:
+                f.writelines(f"{uso:.3f} {clave}\n" for uso, clave in quedan)
+            os.replace(temporal, registro)
+        except OSError:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+
+def procesar_con_cache(cache, fase, version_reglas, funcion, entrada, salida, podar=True, **opciones):
+    """
+    Ejecuta 'funcion(entrada, salida, **opciones)' salvo que la caché ya
+    tenga el resultado para este contenido, fase y versión de reglas.
+    Con 'podar=False' no se poda al guardar (por lotes: se poda al final).
+    Retorna lo mismo que la fase (número de filas, o None si falló).
+    """
+    try:
+        clave = cache.clave(entrada, fase, version_reglas)
+    except OSError:
+        clave = None # Entrada ilegible: que la fase dé su propio error
+
+    if clave is not None and cache.obtener(clave, salida):
+        print(f"Sin cambios, copiado desde la caché: {salida}")
+        return contar_lineas(salida)
+
+    # Una salida enlazada a la caché no se puede sobrescribir en el sitio
+    if os.path.exists(salida) and os.stat(salida).st_nlink > 1:
+        os.remove(salida)
+
+    filas = funcion(entrada, salida, **opciones)
+    if filas is not None and clave is not None:
+        cache.guardar(clave, salida, podar)
+    return filas
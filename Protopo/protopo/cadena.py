@@ -0,0 +1,375 @@
+"""
+Cadena de etapas: varias reglas de fase sobre el mismo fichero, leyéndolo
+y escribiéndolo una sola vez.
+
+Lanzar los exe uno detrás de otro (fase 5 y luego fase 6, o de la 1 a la 4)
+escribe y vuelve a leer un fichero intermedio por cada fase. Aquí las filas
+pasan de una etapa a la siguiente en memoria como (prefijo, código): el
+prefijo (todo hasta la última coma) se copia tal cual y cada etapa solo
+reescribe el código. El resultado es el mismo que encadenar los exe.
+
+Etapas:
+    fase1 .. fase4   Regla de esa fase (mira el punto anterior y el siguiente).
+                     Van en flujo: no cargan el fichero en memoria.
+    fase7            Regla completa de la fase 7 (líneas y puntos sueltos).
+    caras            Una fila por visual con círculo directo e inverso
+                     promediados (ver protopo.caras). Necesita NumPy.
+                     También 'pair-faces'.
+    simplificar      Quita vértices casi alineados de las líneas ya
+                     agrupadas, con '--tolerancia' (ver protopo.simplificar).
+                     Filas 'punto,X,Y,Z,código'. Necesita NumPy. También
+                     'simplify'.
+    classify         Separa tipo, contador y atributos del código. Se queda
+                     solo con el tipo (como las fases 5 y 6).
+    group            Agrupa por (tipo, contador); cada punto suelto va solo.
+    sort             Ordena puntos dentro de cada línea y las líneas entre sí
+                     por número de punto (--campo-punto).
+    mark00           '00' al primer punto de cada línea.
+    attrs-to-spaces  Añade los atributos con las @ cambiadas por espacios.
+    fase5            = classify,group,sort,mark00 con el punto en el campo 1.
+    fase6            = classify,group,sort,mark00,attrs-to-spaces, campo 0.
+
+Las etapas classify..attrs-to-spaces seguidas forman un solo bloque que
+empieza por classify. Igual que en las fases 5 y 6, en ese bloque se
+descartan las filas de un solo campo.
+
+Uso:
+    python -m protopo ENTRADA [ENTRADA...] --etapas fase1,fase2,fase3,fase4
+    python -m protopo ENTRADA --stages classify,group,sort,mark00,attrs-to-spaces [--salida SALIDA]
+    python -m protopo campo_xyz.txt --etapas fase6,simplificar --tolerancia 0.02 --tolerancia 59=0.05
+"""
+import argparse
+import os
+import sys
+from itertools import chain
+
+from protopo import columnar, fases
+from protopo.codigos import codigo_con_atributos, codigo_tipo_contador
+from protopo.flujo import ErrorLectura, escribir_lineas, filas_con_codigo, num_punto, ventana_triple
+from protopo.orden import Punto, agrupar_lineas, ordenar_grupos, rango_fase7, rangos_fase7, recorrer_grupos
+from protopo.perfil import perfil_desde_entorno
+
+ETAPAS_FLUJO = {'fase1': 1, 'fase2': 2, 'fase3': 3, 'fase4': 4}
+ETAPAS_GRUPO = ('classify', 'group', 'sort', 'mark00', 'attrs-to-spaces')
+ETAPAS_CARAS = ('caras', 'pair-faces')
+ETAPAS_SIMPLIFICAR = ('simplificar', 'simplify')
+
+# Fases completas equivalentes a un bloque de etapas (y su campo de punto)
+ALIAS = {
+    'fase5': (('classify', 'group', 'sort', 'mark00'), 1),
+    'fase6': (('classify', 'group', 'sort', 'mark00', 'attrs-to-spaces'), 0),
+}
+
+CAMPO_PUNTO_POR_DEFECTO = 1
+
+
+class ErrorEtapas(ValueError):
+    """Lista de etapas que no se puede encadenar."""
+
+
+def preparar(etapas, campo_punto=None, tolerancias=None):
+    """
+    Convierte la lista de nombres de etapa en una lista de pasos:
+        ('flujo', N)                       regla de la fase N (1-4)
+        ('fase7', None)
+        ('caras', None)                    emparejado CD/CI
+        ('simplificar', (tol, por_tipo))   Douglas-Peucker ('tolerancias' como
+                                           las da simplificar.leer_tolerancias)
+        ('grupo', (etapas, campo_punto))   bloque classify..attrs-to-spaces
+    Lanza ErrorEtapas si la combinación no tiene sentido.
+    """
+    pasos = []
+    bloque = None
+    for nombre in etapas:
+        nombre = nombre.strip().lower()
+        if nombre in ETAPAS_GRUPO:
+            if bloque is None:
+                if nombre != 'classify':
+                    raise ErrorEtapas(f"'{nombre}' necesita 'classify' antes")
+                bloque = []
+            elif nombre in bloque:
+                raise ErrorEtapas(f"'{nombre}' repetida en el mismo bloque")
+            if nombre in ('sort', 'mark00') and 'group' not in bloque:
+                raise ErrorEtapas(f"'{nombre}' necesita 'group' antes")
+            bloque.append(nombre)
+            continue
+
+        if bloque is not None:
+            pasos.append(('grupo', (tuple(bloque), _campo(campo_punto, CAMPO_PUNTO_POR_DEFECTO))))
+            bloque = None
+
+        if nombre in ETAPAS_FLUJO:
+            pasos.append(('flujo', ETAPAS_FLUJO[nombre]))
+        elif nombre == 'fase7':
+            pasos.append(('fase7', None))
+        elif nombre in ETAPAS_CARAS:
+            pasos.append(('caras', None))
+        elif nombre in ETAPAS_SIMPLIFICAR:
+            pasos.append(('simplificar', tolerancias or (None, None)))
+        elif nombre in ALIAS:
+            etapas_alias, campo_alias = ALIAS[nombre]
+            pasos.append(('grupo', (etapas_alias, _campo(campo_punto, campo_alias))))
+        else:
+            validas = list(ETAPAS_FLUJO) + ['fase5', 'fase6', 'fase7', 'caras', 'simplificar'] + list(ETAPAS_GRUPO)
+            raise ErrorEtapas(f"Etapa desconocida: '{nombre}' (válidas: {', '.join(validas)})")
+
+    if bloque is not None:
+        pasos.append(('grupo', (tuple(bloque), _campo(campo_punto, CAMPO_PUNTO_POR_DEFECTO))))
+    if not pasos:
+        raise ErrorEtapas("No se ha indicado ninguna etapa")
+    return pasos
+
+
+def _campo(campo_punto, por_defecto):
+    return campo_punto if campo_punto is not None else por_defecto
+
+
+def encadenar(filas, pasos, normalizar=False):
+    """
+    Aplica los pasos a un iterable de (prefijo, código). Retorna otro iterable.
+    'normalizar' si 'filas' viene de otra etapa y no de leer el fichero.
+    """
+    for i, (tipo, argumento) in enumerate(pasos):
+        if i or normalizar:
+            filas = _normalizar(filas) # Entre etapas; la salida final va tal cual
+        if tipo == 'flujo':
+            filas = _etapa_flujo(filas, fases.cargar_modulo(argumento).marcar_codigo)
+        elif tipo == 'fase7':
+            filas = _etapa_fase7(filas, fases.cargar_modulo(7))
+        elif tipo == 'caras':
+            filas = _etapa_caras(filas)
+        elif tipo == 'simplificar':
+            filas = _etapa_simplificar(filas, *argumento)
+        else:
+            filas = _etapa_grupo(filas, *argumento)
+    return filas
+
+
+def _normalizar(filas):
+    """
+    Deja cada fila como quedaría al escribirla y volver a leerla (espacios
+    de los extremos fuera, líneas vacías fuera), para que encadenar en
+    memoria dé lo mismo que pasar por un fichero intermedio.
+    """
+    for prefijo, codigo in filas:
+        if codigo and not codigo[-1].isspace():
+            yield prefijo, codigo
+            continue
+        linea_txt = (prefijo + codigo).strip()
+        if not linea_txt: continue
+        corte = linea_txt.rfind(',') + 1
+        yield linea_txt[:corte], linea_txt[corte:]
+
+
+def _etapa_flujo(filas, marcar):
+    """Regla de las fases 1-4: ventana de tres filas, sin cargar el fichero."""
+    for anterior, (prefijo, codigo), siguiente in ventana_triple(filas):
+        codigo_anterior = anterior[1] if anterior is not None else None
+        codigo_siguiente = siguiente[1] if siguiente is not None else None
+        yield prefijo, marcar(codigo_anterior, codigo, codigo_siguiente)
+
+
+def _etapa_grupo(filas, etapas, campo_punto):
+    """Bloque classify..attrs-to-spaces (reglas de las fases 5 y 6)."""
+    con_atributos = 'attrs-to-spaces' in etapas
+    # Con atributos se separan las @ antes de agrupar, como en la fase 6
+    parsear = codigo_con_atributos if con_atributos else codigo_tipo_contador
+    marcar_inicio = 'mark00' in etapas
+
+    def codigo_final(tipo_base, info, inicio):
+        sufijos = " " + " ".join(info.atributos) if con_atributos and info.atributos else ""
+        return tipo_base + ("00" if inicio and marcar_inicio else "") + sufijos
+
+    # Solo filas de al menos dos campos, como en las fases 5 y 6
+    puntos = (
+        Punto(prefijo, num_punto(prefijo + codigo, campo_punto), parsear(codigo))
+        for prefijo, codigo in filas if prefijo
+    )
+
+    if 'group' not in etapas:
+        for p in puntos:
+            yield p.prefijo, codigo_final(p.info.tipo, p.info, False)
+        return
+
+    elementos, lineas = agrupar_lineas(puntos)
+    if 'sort' in etapas:
+        ordenar_grupos(elementos, lineas)
+    for p, tipo_base, es_inicio in recorrer_grupos(elementos):
+        yield p.prefijo, codigo_final(tipo_base, p.info, es_inicio)
+
+
+def _etapa_fase7(filas, modulo):
+    """Regla de la fase 7: líneas ordenadas por tipo y contador, luego sueltos por tipo."""
+    filas = [(prefijo, codigo, modulo.parsear_codigo(codigo)) for prefijo, codigo in filas]
+    codigos = list(dict.fromkeys(info for _, _, info in filas))
+    rango_linea, rango_suelto = rangos_fase7(codigos, modulo.get_type_sort_key, modulo.get_counter_sort_key)
+
+    rangos = [rango_fase7(info, rango_linea, rango_suelto) for _, _, info in filas]
+    anterior = None
+    for i in sorted(range(len(filas)), key=rangos.__getitem__):
+        prefijo, codigo, info = filas[i]
+        yield prefijo, modulo.codigo_salida(info, codigo, rangos[i] != anterior)
+        anterior = rangos[i]
+
+
+def _etapa_caras(filas):
+    """Emparejado CD/CI (protopo.caras): una fila por visual, el resto tal cual."""
+    from protopo import caras, reduccion
+    obs = reduccion.observaciones((prefijo + codigo, len(prefijo)) for prefijo, codigo in filas)
+    if not len(obs.hz):
+        lineas = (linea for _, linea in obs.otras)
+    else:
+        lineas = caras.filas_reducidas(obs, caras.emparejar(obs))
+    for linea in lineas:
+        corte = linea.rfind(',') + 1
+        yield linea[:corte], linea[corte:]
+
+
+def _etapa_simplificar(filas, tolerancia, por_tipo):
+    """Douglas-Peucker sobre las líneas ya agrupadas (protopo.simplificar)."""
+    from protopo import simplificar
+    if tolerancia is None:
+        tolerancia = simplificar.TOLERANCIA
+    lineas, _ = simplificar.simplificar(((prefijo + codigo, len(prefijo)) for prefijo, codigo in filas),
+                                        tolerancia, por_tipo)
+    for linea in lineas:
+        corte = linea.rfind(',') + 1
+        yield linea[:corte], linea[corte:]
+
+
+def _grupo_columnar(archivo_entrada, etapas, campo_punto):
+    """
+    Bloque con group y sort al principio de la cadena, con NumPy: el mismo
+    motor por columnas que las fases 5 y 6. Retorna (tabla, orden, códigos).
+    """
+    con_atributos = 'attrs-to-spaces' in etapas
+    parsear = codigo_con_atributos if con_atributos else codigo_tipo_contador
+    marcar_inicio = 'mark00' in etapas
+    try:
+        tabla = columnar.TablaPuntos.leer(archivo_entrada, parsear, campo_punto=campo_punto, min_campos=2)
+    except (OSError, UnicodeDecodeError) as e:
+        raise ErrorLectura(e) from e
+
+    orden, es_inicio = columnar.orden_por_grupos(tabla)
+    tipos = [info.tipo for info in tabla.info]
+    sufijos = [" " + " ".join(info.atributos) if con_atributos and info.atributos else ""
+               for info in tabla.info]
+    codigos = (
+        tipos[idx] + ("00" if inicio and marcar_inicio else "") + sufijos[idx]
+        for idx, inicio in zip(tabla.id_codigo[orden].tolist(), es_inicio.tolist())
+    )
+    return tabla, orden, codigos
+
+
+def _usa_columnar(pasos):
+    tipo, argumento = pasos[0]
+    return columnar.HAY_NUMPY and tipo == 'grupo' and {'group', 'sort'} <= set(argumento[0])
+
+
+def ejecutar(archivo_entrada, archivo_salida, pasos):
+    """
+    Lee 'archivo_entrada', aplica los pasos y escribe 'archivo_salida'.
+    Retorna el número de filas escritas (None si hay error o no hay filas).
+    """
+    perfil = perfil_desde_entorno('cadena', archivo_entrada, 'cadena')
+    tabla = None
+    try:
+        if _usa_columnar(pasos):
+            tabla, orden, codigos = _grupo_columnar(archivo_entrada, *pasos[0][1])
+            if len(pasos) == 1:
+                filas = iter(range(len(tabla))) # Se escribe directamente desde la tabla
+            else:
+                mapa = tabla.mapa
+                prefijos = (mapa[i:c].decode('utf-8')
+                            for i, c in zip(tabla.inicio[orden].tolist(), tabla.corte[orden].tolist()))
+                filas = encadenar(zip(prefijos, codigos), pasos[1:], normalizar=True)
+                tabla = None
+        else:
+            filas = encadenar(filas_con_codigo(archivo_entrada), pasos)
+
+        # Las etapas que ordenan leen todo el fichero al pedir la primera fila
+        primera = next(filas, None)
+    except ErrorLectura as e:
+        print(f"Error lectura: {e}")
+        return
+    except Exception as e:
+        print(f"Error: {e}")
+        return
+
+    if primera is None:
+        print("Archivo vacío.")
+        return
+
+    try:
+        if tabla is not None:
+            tabla.escribir(archivo_salida, orden, codigos)
+            total = len(tabla)
+        else:
+            total = escribir_lineas(archivo_salida, (prefijo + codigo for prefijo, codigo in chain([primera], filas)))
+    except Exception as e:
+        # Las etapas en flujo siguen leyendo mientras se escribe
+        if os.path.exists(archivo_salida):
+            os.remove(archivo_salida)
+        if isinstance(e, ErrorLectura):
+            print(f"Error lectura: {e}")
+        else:
+            print(f"Error escritura: {e}")
+        return
+
+    perfil.marca('cadena', total)
+    perfil.emitir(total)
+    print(f"Generado: {archivo_salida} ({total} filas)")
+    return total
+
+
+def ruta_salida(ruta_entrada):
+    """Nombre de salida por defecto: nombre_cadena.txt junto a la entrada."""
+    nombre_base = os.path.splitext(ruta_entrada)[0]
+    return f"{nombre_base}_cadena.txt"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m protopo',
+        description="Aplica varias reglas de fase seguidas leyendo y escribiendo el fichero una sola vez.")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) de entrada")
+    parser.add_argument('--etapas', '--stages', required=True,
+                        help="Etapas separadas por comas (ej: fase1,fase2,fase3,fase4 o "
+                             "classify,group,sort,mark00,attrs-to-spaces)")
+    parser.add_argument('--salida', '-o', default=None,
+                        help="Fichero de salida (solo con una entrada; por defecto ENTRADA_cadena.txt)")
+    parser.add_argument('--campo-punto', type=int, default=None,
+                        help="Columna con el número de punto para 'sort' (por defecto 1; fase6 usa 0)")
+    parser.add_argument('--tolerancia', action='append', metavar='[TIPO=]METROS',
+                        help="Para 'simplificar': tolerancia por defecto o de un tipo (59=0.05); se puede repetir")
+    args = parser.parse_args(argv)
+
+    if args.salida and len(args.entradas) > 1:
+        parser.error("--salida solo se puede usar con una entrada")
+    try:
+        tolerancias = None
+        if args.tolerancia:
+            from protopo.simplificar import ErrorSimplificar, leer_tolerancias
+            try:
+                tolerancias = leer_tolerancias(args.tolerancia)
+            except ErrorSimplificar as e:
+                raise ErrorEtapas(str(e)) from None
+        pasos = preparar(args.etapas.split(','), args.campo_punto, tolerancias)
+    except ErrorEtapas as e:
+        parser.error(str(e))
+
+    fallos = 0
+    for entrada in args.entradas:
+        if not os.path.exists(entrada):
+            print(f"No se encuentra el archivo de entrada: {entrada}")
+            fallos += 1
+            continue
+        salida = args.salida or ruta_salida(entrada)
+        print(f"Cadena ({args.etapas}) - Leyendo: {entrada}...")
+        if ejecutar(entrada, salida, pasos) is None:
+            fallos += 1
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
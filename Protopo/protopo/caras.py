@@ -0,0 +1,256 @@
+"""
+Emparejado de círculo directo e inverso (CD/CI).
+
+El mismo punto se mide varias veces desde un estacionamiento: en círculo
+directo y en inverso ('9002' a Hz 0.0034 / V 103.78 y a Hz 200.0103 /
+V 296.21 en 'Fase 7/dist/prueba.txt'), a veces repetido. Aquí todas las
+filas de un fichero se juntan por (estacionamiento, punto, altura de prisma)
+de una vez, con NumPy, y cada grupo se reduce a una sola visual:
+- Círculo inverso (V > 200 gon, 180°) pasado a directo: Hz - 200, 400 - V.
+- Hz y V medios (Hz sin saltar por el cero), distancia media de las filas
+  que la traen.
+- Colimación, (Hz CD - Hz CI reducido) / 2, y error de índice,
+  (V CD + V CI - 400) / 2, de las visuales con las dos caras, y su media
+  por estacionamiento.
+- Visual inconsistente: alguna fila se aparta de la media más que la
+  tolerancia (en ángulos, además de la colimación o el índice medios del
+  estacionamiento, que son del aparato).
+
+Estacionamiento: filas seguidas con la misma estación y altura de
+instrumento (ver protopo.reduccion).
+
+La salida tiene el mismo formato que la entrada con una fila por visual, en
+la posición de su primera fila; las filas que no son observaciones y las
+visuales de una sola fila en círculo directo se copian tal cual. Es la
+entrada para las fases 5, 6 y 7 (o la etapa 'caras' de la cadena).
+
+Uso:
+    python -m protopo.caras campo.txt [--unidades grados]    -> campo_caras.txt
+"""
+import argparse
+import heapq
+import math
+import os
+import sys
+from collections import namedtuple
+
+from protopo import columnar
+from protopo.flujo import escribir_lineas
+from protopo.reduccion import ErrorReduccion, _ids, _requiere_numpy, leer_observaciones, vuelta_de
+
+np = columnar.np
+
+# Tolerancias por defecto: 100cc en gon (su equivalente en grados) y 1 cm
+TOLERANCIA_ANGULO = {'gon': 0.0100, 'grados': 0.0090}
+TOLERANCIA_DISTANCIA = 0.010
+
+Parejas = namedtuple('Parejas', [
+    'primera',                # fila de cada visual (la primera de su grupo)
+    'grupo',                  # visual de cada fila
+    'inverso',                # fila en círculo inverso
+    'estacionamiento',        # estacionamiento de cada visual
+    'inicio_estacionamiento', # primera fila de cada estacionamiento
+    'directas', 'inversas',   # filas de cada cara por visual
+    'hz', 'v', 'distancia',   # visual reducida (distancia nan si ninguna fila la trae)
+    'con_distancia',          # filas con distancia por visual
+    'colimacion', 'indice',   # nan si la visual no tiene las dos caras
+    'colimacion_media', 'indice_medio', # por estacionamiento
+    'dispersion_hz', 'dispersion_v', 'dispersion_d',
+    'inconsistente',
+])
+
+
+def emparejar(obs, unidades='gon', tolerancia_angulo=None, tolerancia_distancia=TOLERANCIA_DISTANCIA):
+    """Junta y promedia las filas de cada visual de 'obs' (ver reduccion.observaciones). Retorna Parejas."""
+    _requiere_numpy()
+    vuelta = vuelta_de(unidades)
+    media = vuelta / 2
+    if tolerancia_angulo is None:
+        tolerancia_angulo = TOLERANCIA_ANGULO[unidades]
+    n = len(obs.hz)
+
+    inverso = obs.v > media
+    directo = ~inverso
+    hz = np.where(inverso, (obs.hz - media) % vuelta, obs.hz)
+    v = np.where(inverso, vuelta - obs.v, obs.v)
+
+    # Estacionamiento de cada fila
+    id_estacion = _ids(obs.estacion)
+    nuevo = np.ones(n, dtype=bool)
+    nuevo[1:] = (id_estacion[1:] != id_estacion[:-1]) | (obs.altura_instrumento[1:] != obs.altura_instrumento[:-1])
+    inicio_est = np.flatnonzero(nuevo)
+    est_fila = np.cumsum(nuevo) - 1
+
+    # Clave (estacionamiento, punto, altura de prisma) -> visual, numeradas por primera aparición
+    id_punto = _ids(obs.punto)
+    _, id_prisma = np.unique(obs.altura_prisma, return_inverse=True)
+    id_prisma = id_prisma.reshape(-1)
+    n_puntos, n_prismas = int(id_punto.max(initial=0)) + 1, int(id_prisma.max(initial=0)) + 1
+    clave = (est_fila * n_puntos + id_punto) * n_prismas + id_prisma
+    _, primera, inverso_clave = np.unique(clave, return_index=True, return_inverse=True)
+    orden = np.argsort(primera, kind='stable')
+    rango = np.empty_like(orden)
+    rango[orden] = np.arange(len(orden))
+    primera = primera[orden]
+    grupo = rango[inverso_clave.reshape(-1)]
+    m = len(primera)
+
+    def suma(pesos):
+        return np.bincount(grupo, pesos, minlength=m)
+
+    filas = suma(None)
+    directas = suma(directo)
+    inversas = filas - directas
+    dos_caras = (directas > 0) & (inversas > 0)
+
+    # Hz relativo a la primera fila de la visual: sin saltos por el cero
+    ref = hz[primera]
+    dif = (hz - ref[grupo] + media) % vuelta - media
+    desvio = suma(dif) / filas
+    hz_v = (ref + desvio) % vuelta
+    v_v = suma(v) / filas
+
+    tiene_d = ~np.isnan(obs.distancia)
+    con_distancia = suma(tiene_d)
+    d = np.where(tiene_d, obs.distancia, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dist_v = np.where(con_distancia > 0, suma(d) / con_distancia, np.nan)
+        colimacion = np.where(dos_caras, (suma(dif * directo) / directas - suma(dif * inverso) / inversas) / 2, np.nan)
+        indice = np.where(dos_caras, (suma(v * directo) / directas - suma(v * inverso) / inversas) / 2, np.nan)
+
+    # Media por estacionamiento de las visuales con las dos caras, sin las
+    # que se pasan de 10 veces la tolerancia (error grosero, no del aparato)
+    est_visual = est_fila[primera]
+    n_est = len(inicio_est)
+    valida = dos_caras & (np.abs(np.nan_to_num(colimacion)) <= 10 * tolerancia_angulo) \
+        & (np.abs(np.nan_to_num(indice)) <= 10 * tolerancia_angulo)
+    n_validas = np.bincount(est_visual, valida, minlength=n_est)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        colimacion_media = np.bincount(est_visual, np.where(valida, colimacion, 0), minlength=n_est) / n_validas
+        indice_medio = np.bincount(est_visual, np.where(valida, indice, 0), minlength=n_est) / n_validas
+
+    # Mayor separación de una fila respecto a la media de su visual
+    dispersion_hz = np.zeros(m)
+    dispersion_v = np.zeros(m)
+    dispersion_d = np.zeros(m)
+    np.maximum.at(dispersion_hz, grupo, np.abs(dif - desvio[grupo]))
+    np.maximum.at(dispersion_v, grupo, np.abs(v - v_v[grupo]))
+    np.maximum.at(dispersion_d, grupo, np.where(tiene_d, np.abs(d - np.nan_to_num(dist_v)[grupo]), 0))
+
+    inconsistente = (
+        (dispersion_hz > tolerancia_angulo + np.abs(np.nan_to_num(colimacion_media))[est_visual])
+        | (dispersion_v > tolerancia_angulo + np.abs(np.nan_to_num(indice_medio))[est_visual])
+        | (dispersion_d > tolerancia_distancia)
+    )
+    return Parejas(primera, grupo, inverso, est_visual, inicio_est, directas, inversas, hz_v, v_v, dist_v,
+                   con_distancia, colimacion, indice, colimacion_media, indice_medio,
+                   dispersion_hz, dispersion_v, dispersion_d, inconsistente)
+
+
+def filas_reducidas(obs, parejas, decimales_angulo=10, decimales_distancia=4):
+    """
+    Líneas de salida: una por visual en la posición de su primera fila (con
+    Hz, V y distancia reducidos) y las filas que no son observaciones tal cual.
+    """
+    def visuales():
+        primera = parejas.primera.tolist()
+        posiciones = obs.posicion[parejas.primera].tolist()
+        unica = ((parejas.directas == 1) & (parejas.inversas == 0)).tolist()
+        for j, fila in enumerate(primera):
+            linea = obs.linea[fila]
+            if unica[j]:
+                yield posiciones[j], linea # Una sola fila en círculo directo: tal cual
+                continue
+            corte = linea.rfind(',') + 1
+            campos = linea[:corte].split(',')
+            campos[2] = f"{parejas.hz[j]:.{decimales_angulo}f}"
+            campos[3] = f"{parejas.v[j]:.{decimales_angulo}f}"
+            distancia = parejas.distancia[j]
+            campos[4] = "" if math.isnan(distancia) else f"{distancia:.{decimales_distancia}f}"
+            yield posiciones[j], ",".join(campos) + linea[corte:]
+
+    for _, linea in heapq.merge(visuales(), obs.otras):
+        yield linea
+
+
+def ruta_salida(ruta_entrada):
+    """Salida junto a la entrada: 'campo.txt' -> 'campo_caras.txt'."""
+    return os.path.splitext(ruta_entrada)[0] + "_caras.txt"
+
+
+def procesar_caras(archivo_entrada, archivo_salida, unidades='gon', tolerancia_angulo=None,
+                   tolerancia_distancia=TOLERANCIA_DISTANCIA, max_avisos=20):
+    """Empareja las caras de 'archivo_entrada' y escribe las visuales reducidas. Retorna las filas escritas."""
+    print(f"Caras CD/CI - Leyendo: {archivo_entrada}...")
+    try:
+        obs = leer_observaciones(archivo_entrada)
+    except ErrorReduccion as e:
+        print(f"Error: {e}")
+        return
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+    if not len(obs.hz):
+        print("Archivo sin observaciones.")
+        return
+
+    try:
+        parejas = emparejar(obs, unidades, tolerancia_angulo, tolerancia_distancia)
+    except ErrorReduccion as e:
+        print(f"Error: {e}")
+        return
+
+    # Resumen por estacionamiento
+    est_visual = parejas.estacionamiento
+    visuales = np.bincount(est_visual, minlength=len(parejas.inicio_estacionamiento)).tolist()
+    dobles = np.bincount(est_visual, (parejas.directas > 0) & (parejas.inversas > 0),
+                         minlength=len(visuales)).astype(int).tolist()
+    for k, fila in enumerate(parejas.inicio_estacionamiento.tolist()):
+        texto = (f"  Estación {obs.estacion[fila]} (hi {obs.altura_instrumento[fila]:.3f}): "
+                 f"{visuales[k]} visuales, {dobles[k]} con CD y CI")
+        if not math.isnan(parejas.colimacion_media[k]):
+            texto += (f", colimación media {parejas.colimacion_media[k]:+.4f}, "
+                      f"error de índice medio {parejas.indice_medio[k]:+.4f}")
+        print(texto)
+
+    malas = np.flatnonzero(parejas.inconsistente).tolist()
+    for j in malas[:max_avisos]:
+        fila = parejas.primera[j]
+        print(f"  Aviso: visual inconsistente: estación {obs.estacion[fila]}, punto {obs.punto[fila]} "
+              f"(fila {obs.posicion[fila] + 1}): Hz ±{parejas.dispersion_hz[j]:.4f}, "
+              f"V ±{parejas.dispersion_v[j]:.4f}, D ±{parejas.dispersion_d[j]:.3f}")
+    if len(malas) > max_avisos:
+        print(f"  ... y {len(malas) - max_avisos} visuales inconsistentes más")
+
+    try:
+        total = escribir_lineas(archivo_salida, filas_reducidas(obs, parejas))
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    print(f"¡Éxito Caras! {len(obs.hz)} observaciones -> {len(parejas.primera)} visuales. Generado: {archivo_salida}")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Empareja y promedia círculo directo e inverso.")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) de campo")
+    parser.add_argument('--unidades', choices=('gon', 'grados'), default='gon', help="Unidades de Hz y V (gon)")
+    parser.add_argument('--tolerancia-angulo', type=float, default=None,
+                        help="Separación máxima de una fila a la media de su visual (0.0100 gon / 0.0090°)")
+    parser.add_argument('--tolerancia-distancia', type=float, default=TOLERANCIA_DISTANCIA,
+                        help="Lo mismo en distancia, metros (0.010)")
+    parser.add_argument('-o', '--salida', help="Fichero de salida (solo con una entrada)")
+    args = parser.parse_args(argv)
+    if args.salida and len(args.entradas) > 1:
+        parser.error("--salida solo con un fichero de entrada")
+
+    fallos = 0
+    for entrada in args.entradas:
+        salida = args.salida or ruta_salida(entrada)
+        if procesar_caras(entrada, salida, args.unidades, args.tolerancia_angulo, args.tolerancia_distancia) is None:
+            fallos += 1
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Tabla de códigos parseados una sola vez.
+
+Un fichero de campo repite unos pocos cientos de códigos ('59&1', 'Muro&2@F'...)
+a lo largo de millones de filas. En vez de parsear el mismo texto en cada
+fila (y en las fases 1-4 tres veces por fila: anterior, actual y siguiente)
+se parsea cada código distinto una vez y se guarda el resultado.
+
+Cada fase tiene su propia forma de leer el código, así que hay una tabla
+por "dialecto". Todas devuelven el mismo registro Codigo:
+    (tipo, contador, tiene_f, atributos)
+"""
+import sys
+from collections import namedtuple
+
+Codigo = namedtuple('Codigo', ['tipo', 'contador', 'tiene_f', 'atributos'])
+
+# Por encima de este número de códigos distintos la tabla se vacía y vuelve
+# a empezar (p.ej. en fase 1 el número de delante del '&' cambia cada punto)
+MAX_CODIGOS = 1 << 16
+
+
+class TablaCodigos:
+    """
+    Cache texto del código -> Codigo.
+    Se usa como una función: tabla('59&1F') -> Codigo('59', '1', True, ()).
+    Los textos y los registros iguales se comparten (misma instancia).
+    """
+
+    def __init__(self, parsear, max_codigos=MAX_CODIGOS):
+        self.parsear = parsear
+        self.max_codigos = max_codigos
+        self._por_texto = {}
+        self._registros = {}
+
+    def __call__(self, codigo_raw):
+        try:
+            return self._por_texto[codigo_raw]
+        except KeyError:
+            pass
+
+        if len(self._por_texto) >= self.max_codigos:
+            self._por_texto.clear()
+            self._registros.clear()
+
+        registro = _internar(self.parsear(codigo_raw))
+        registro = self._registros.setdefault(registro, registro)
+        self._por_texto[codigo_raw] = registro
+        return registro
+
+    def __len__(self):
+        return len(self._por_texto)
+
+
+def _internar(registro):
+    tipo, contador, tiene_f, atributos = registro
+    return Codigo(
+        sys.intern(tipo),
+        sys.intern(contador) if contador is not None else None,
+        tiene_f,
+        tuple(sys.intern(a) for a in atributos),
+    )
+
+
+def _quitar_f(codigo):
+    """
+    Detecta y quita la F final (mayús/minús). Retorna (codigo, tiene_f).
+    Lógica conservadora heredada: un tipo sin '&' acabado en F ('DEF')
+    también pierde la F.
+    """
+    if codigo.lower().endswith('f'):
+        return codigo[:-1], True
+    return codigo, False
+
+
+def parsear_id_linea(codigo_raw):
+    """
+    Dialecto fases 1 y 2: 'Contador & Código [F]' (ej: '3&17F').
+    El ID de línea es la parte derecha del último '&' y va en 'contador';
+    lo de la izquierda va en 'tipo'. Sin '&' todo el código es el ID.
+    """
+    codigo, tiene_f = _quitar_f(codigo_raw.strip())
+
+    if '&' in codigo:
+        partes = codigo.split('&')
+        return Codigo("&".join(partes[:-1]), partes[-1], tiene_f, ())
+    return Codigo('', codigo, tiene_f, ())
+
+
+def parsear_tipo_contador(codigo_raw):
+    """
+    Dialecto fases 3, 4 y 5: 'TIPO & CONTADOR [F]' (ej: '59&1F').
+    Si hay más de un '&', el último separa el contador.
+    Sin '&' (punto suelto) el contador es None.
+    """
+    return _separar_tipo_contador(codigo_raw.strip())
+
+
+def _separar_tipo_contador(codigo, atributos=()):
+    codigo, tiene_f = _quitar_f(codigo)
+
+    if '&' in codigo:
+        partes = codigo.split('&')
+        return Codigo("&".join(partes[:-1]), partes[-1], tiene_f, atributos)
+    return Codigo(codigo, None, tiene_f, atributos)
+
+
+def parsear_con_atributos(codigo_raw):
+    """
+    Dialecto fase 6: 'TIPO & CONTADOR [F] @ATRIB @ATRIB...' (ej: '59&1@AS@C').
+    Primero se separan los atributos (@) y luego se parsea la base
+    igual que en la fase 5.
+    """
+    codigo = codigo_raw.strip()
+
+    if '@' in codigo:
+        trozos = codigo.split('@')
+        base = trozos[0]
+        atributos = trozos[1:]
+    else:
+        base = codigo
+        atributos = ()
+
+    return _separar_tipo_contador(base, atributos)
+
+
+def parsear_fase7(codigo_raw):
+    """
+    Dialecto fase 7: 'TIPO & CONTADOR @ATRIB' (ej: '222&7@F').
+    Tipo es lo que hay antes del PRIMER '&' (o antes del '@' si no hay '&'),
+    contador lo que hay entre el '&' y el '@'. Aquí la F no se trata aparte.
+    Sin '&' es un punto suelto (contador None).
+    """
+    codigo = codigo_raw.strip()
+
+    if '&' not in codigo:
+        trozos = codigo.split('@')
+        return Codigo(trozos[0], None, False, trozos[1:])
+
+    partes_amp = codigo.split('&')
+    resto = '&'.join(partes_amp[1:])
+    trozos = resto.split('@')
+    return Codigo(partes_amp[0], trozos[0], False, trozos[1:])
+
+
+# Tablas compartidas por todas las fases del mismo proceso
+codigo_id_linea = TablaCodigos(parsear_id_linea)
+codigo_tipo_contador = TablaCodigos(parsear_tipo_contador)
+codigo_con_atributos = TablaCodigos(parsear_con_atributos)
+codigo_fase7 = TablaCodigos(parsear_fase7)
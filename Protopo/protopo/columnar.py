@@ -0,0 +1,330 @@
+"""
+Tabla de puntos por columnas (NumPy) para las fases que ordenan (5, 6 y 7).
+
+En vez de un diccionario por punto ({'campos', 'num', 'info_codigo'}) y otro
+por grupo, cada columna es un array:
+    num        -> número de punto (float64)
+    id_codigo  -> índice en la tabla de códigos distintos (int32)
+y el texto de cada fila no se copia: el fichero se proyecta en memoria
+(mmap) y de cada fila se guardan las posiciones en bytes de su inicio y de
+su código. Al escribir, el prefijo se copia en bytes desde el fichero.
+
+La agrupación por (tipo, contador), la ordenación de puntos dentro de cada
+grupo y la de grupos por 'min_punto' se hacen con unique/lexsort/argsort.
+Las listas pequeñas (códigos y tipos distintos) se siguen ordenando en
+Python con las mismas claves de siempre, así el resultado es idéntico.
+
+NumPy es opcional: si no está instalado HAY_NUMPY es False y las fases
+usan su camino de siempre en Python puro.
+"""
+import os
+from array import array
+
+from protopo.flujo import ESPACIOS, es_indice, indice_lineas, proyectar, validar_utf8
+from protopo.indice import Indice
+from protopo.orden import rango_fase7, rangos_fase7
+from protopo.perfil import INACTIVO, cuentas_por_codigo
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende de la instalación
+    np = None
+
+HAY_NUMPY = np is not None
+
+
+class TablaPuntos:
+    """
+    Puntos de un fichero en columnas.
+    El fichero queda proyectado en memoria ('mapa', mmap) y de cada fila solo
+    se guardan posiciones en bytes:
+    - inicio[i], corte[i]: la fila i empieza en 'inicio' y su código en 'corte'
+      (mapa[inicio:corte] es el prefijo, que se copia tal cual a la salida)
+    - num[i]: número de punto de la fila i (0 si no es numérico)
+    - id_codigo[i]: índice del código de la fila en 'codigos_raw' / 'info'
+    """
+
+    def __init__(self, mapa, inicio, corte, num, id_codigo, codigos_raw, info):
+        self.mapa = mapa
+        self.inicio = inicio
+        self.corte = corte
+        self.num = num
+        self.id_codigo = id_codigo
+        self.codigos_raw = codigos_raw
+        self.info = info
+
+    def __len__(self):
+        return len(self.inicio)
+
+    @classmethod
+    def leer(cls, archivo_entrada, parsear, campo_punto=None, min_campos=1, perfil=INACTIVO):
+        """
+        Lee el fichero y construye la tabla.
+        'parsear' es la tabla de códigos de la fase (ver protopo.codigos).
+        'campo_punto' es la columna con el número de punto (None si no se usa).
+        Las filas con menos de 'min_campos' campos se ignoran, igual que antes.
+        'archivo_entrada' puede ser también un índice .ptp (ver protopo.indice).
+        """
+        if es_indice(archivo_entrada):
+            return cls._desde_indice(archivo_entrada, parsear, campo_punto, min_campos, perfil)
+
+        with perfil.etapa('lectura') as etapa:
+            # La tabla se queda con la proyección: los prefijos se copian de ella al escribir
+            mapa = proyectar(archivo_entrada)
+            validar_utf8(mapa)
+            inicio, corte, fin = indice_mapa(mapa, min_campos)
+
+            # Códigos distintos (en bytes) en orden de primera aparición
+            ids = {}
+            id_codigo = array('i')
+            for c, f in zip(corte.tolist(), fin.tolist()):
+                codigo = mapa[c:f]
+                idx = ids.get(codigo)
+                if idx is None:
+                    idx = ids[codigo] = len(ids)
+                id_codigo.append(idx)
+
+            num = _numeros(mapa, inicio, fin, campo_punto) if campo_punto is not None else None
+            etapa['filas'] = len(inicio)
+
+        # Cada código distinto se decodifica y se parsea una sola vez
+        with perfil.etapa('clasificacion', len(ids)):
+            codigos_raw = [codigo.decode('utf-8') for codigo in ids]
+            info = [parsear(codigo) for codigo in codigos_raw]
+
+        return cls(mapa, inicio, corte, num, np.frombuffer(id_codigo, dtype=np.int32), codigos_raw, info)
+
+    @classmethod
+    def _desde_indice(cls, ruta, parsear, campo_punto, min_campos, perfil):
+        """Tabla a partir de un índice .ptp: las columnas ya están hechas."""
+        with perfil.etapa('lectura') as etapa:
+            indice = Indice(ruta)
+            columnas = indice.columnas
+            inicio, corte, id_codigo = columnas['inicio'], columnas['corte'], columnas['id_codigo']
+            num = indice.num(campo_punto) if campo_punto is not None else None
+            codigos_raw = indice.codigos
+
+            if min_campos > 1:
+                if min_campos == 2:
+                    validas = corte > inicio # Hay al menos una coma
+                else:
+                    validas = np.array([indice.mapa[i:c].count(b',') >= min_campos - 1
+                                        for i, c in zip(inicio.tolist(), corte.tolist())], dtype=bool)
+                if not validas.all():
+                    inicio, corte, id_codigo = inicio[validas], corte[validas], id_codigo[validas]
+                    num = num[validas] if num is not None else None
+                    # Solo los códigos que quedan, en orden de primera aparición
+                    usados, primera = np.unique(id_codigo, return_index=True)
+                    usados = usados[np.argsort(primera)]
+                    nuevo_id = np.zeros(len(codigos_raw), dtype=np.int32)
+                    nuevo_id[usados] = np.arange(len(usados), dtype=np.int32)
+                    id_codigo = nuevo_id[id_codigo]
+                    codigos_raw = [codigos_raw[i] for i in usados.tolist()]
+            etapa['filas'] = len(inicio)
+
+        with perfil.etapa('clasificacion', len(codigos_raw)):
+            info = [parsear(codigo) for codigo in codigos_raw]
+
+        return cls(indice.mapa, inicio, corte, num, id_codigo, codigos_raw, info)
+
+    def escribir(self, archivo_salida, orden, codigos_salida, filas_por_bloque=8192):
+        """
+        Escribe las filas en el 'orden' dado. 'codigos_salida[k]' es el nuevo
+        código (texto) de la fila orden[k]. El prefijo de cada fila se copia
+        en bytes desde el fichero original.
+        """
+        mapa = self.mapa
+        salto = os.linesep.encode()
+        # Cada código de salida distinto se codifica una vez
+        codificados = {}
+        with open(archivo_salida, 'wb') as f_out:
+            bloque = []
+            for ini, cor, codigo in zip(self.inicio[orden].tolist(), self.corte[orden].tolist(), codigos_salida):
+                cod = codificados.get(codigo)
+                if cod is None:
+                    cod = codificados[codigo] = codigo.encode('utf-8') + salto
+                bloque.append(mapa[ini:cor])
+                bloque.append(cod)
+                if len(bloque) >= filas_por_bloque:
+                    f_out.write(b''.join(bloque))
+                    bloque.clear()
+            f_out.write(b''.join(bloque))
+
+
+# Bytes que str.strip() quita en los extremos de una línea
+_ES_ESPACIO = None
+
+
+def indice_mapa(mapa, min_campos=1):
+    """
+    Versión vectorizada de flujo.indice_lineas: arrays (inicio, corte, fin)
+    de las filas de 'mapa'. Para los casos raros (\\r suelto en medio de una
+    línea, bytes no ASCII en los extremos) usa flujo.indice_lineas.
+    """
+    global _ES_ESPACIO
+    if _ES_ESPACIO is None:
+        _ES_ESPACIO = np.zeros(256, dtype=bool)
+        _ES_ESPACIO[list(ESPACIOS)] = True
+
+    a = np.frombuffer(mapa, dtype=np.uint8)
+    n = len(a)
+    if not n:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    saltos = np.flatnonzero(a == 10)
+    inicio = np.concatenate(([0], saltos + 1)).astype(np.int64)
+    fin = np.concatenate((saltos, [n])).astype(np.int64)
+
+    # \r que no va seguido de \n: en modo texto también es salto de línea
+    retornos = np.flatnonzero(a == 13)
+    if len(retornos) and np.any(a[np.minimum(retornos + 1, n - 1)] != 10):
+        return _indice_lento(mapa, min_campos)
+
+    # Espacios en los extremos (normalmente solo el \r de los ficheros de Windows)
+    pendientes = np.flatnonzero((fin > inicio) & _ES_ESPACIO[a[np.maximum(fin - 1, 0)]])
+    while len(pendientes):
+        fin[pendientes] -= 1
+        p = pendientes[fin[pendientes] > inicio[pendientes]]
+        pendientes = p[_ES_ESPACIO[a[fin[p] - 1]]]
+    pendientes = np.flatnonzero((fin > inicio) & _ES_ESPACIO[a[np.minimum(inicio, n - 1)]])
+    while len(pendientes):
+        inicio[pendientes] += 1
+        p = pendientes[inicio[pendientes] < fin[pendientes]]
+        pendientes = p[_ES_ESPACIO[a[inicio[p]]]]
+
+    con_texto = fin > inicio
+    inicio, fin = inicio[con_texto], fin[con_texto]
+    if len(inicio) and (np.any(a[inicio] >= 0x80) or np.any(a[fin - 1] >= 0x80)):
+        return _indice_lento(mapa, min_campos) # Puede haber espacios no ASCII
+
+    # Última coma de cada línea
+    comas = np.flatnonzero(a == 44)
+    hasta_fin = np.searchsorted(comas, fin)
+    ultima = comas[np.maximum(hasta_fin - 1, 0)] if len(comas) else np.zeros(len(fin), dtype=np.int64)
+    tiene_coma = (hasta_fin > 0) & (ultima >= inicio) if len(comas) else np.zeros(len(fin), dtype=bool)
+    corte = np.where(tiene_coma, ultima + 1, inicio)
+
+    if min_campos > 1:
+        n_comas = hasta_fin - np.searchsorted(comas, inicio)
+        validas = n_comas >= min_campos - 1
+        inicio, corte, fin = inicio[validas], corte[validas], fin[validas]
+
+    return inicio, corte, fin
+
+
+def _indice_lento(mapa, min_campos):
+    filas = list(indice_lineas(mapa, min_campos))
+    if not filas:
+        vacio = np.zeros(0, dtype=np.int64)
+        return vacio, vacio, vacio
+    inicio, corte, fin = (np.array(col, dtype=np.int64) for col in zip(*filas))
+    return inicio, corte, fin
+
+
+def _numeros(mapa, inicio, fin, campo_punto):
+    """Número de punto (columna 'campo_punto') de cada fila; 0 si no es numérico."""
+    num = array('d')
+    for ini, f in zip(inicio.tolist(), fin.tolist()):
+        campo = mapa[ini:f].split(b',', campo_punto + 1)
+        try:
+            num.append(float(campo[campo_punto]))
+        except IndexError:
+            num.append(0)
+        except ValueError:
+            # float() de bytes solo entiende ASCII; en texto admite más
+            try:
+                num.append(float(campo[campo_punto].decode('utf-8')))
+            except ValueError:
+                num.append(0)
+    return np.frombuffer(num, dtype=np.float64)
+
+
+def orden_por_grupos(tabla, perfil=INACTIVO):
+    """
+    Orden de las fases 5 y 6.
+    - Líneas (con contador): se agrupan por (tipo, contador) y sus puntos se
+      ordenan por número (empates: orden de lectura).
+    - Puntos sueltos: cada uno es su propio grupo.
+    - Los grupos se ordenan por su menor número de punto (empates: orden en
+      que apareció el grupo).
+
+    Retorna (orden, es_inicio): 'orden' son los índices de fila en el orden
+    de salida y 'es_inicio[k]' indica si orden[k] es el primer punto de
+    una línea (el que lleva '00').
+    """
+    n = len(tabla)
+    filas = np.arange(n, dtype=np.int64)
+
+    with perfil.etapa('agrupacion', n):
+        # Clave de grupo por código: id de (tipo, contador), o -1 si es suelto
+        claves = {}
+        clave_por_codigo = np.empty(len(tabla.info), dtype=np.int64)
+        for idx, info in enumerate(tabla.info):
+            if info.contador is None:
+                clave_por_codigo[idx] = -1
+            else:
+                clave_por_codigo[idx] = claves.setdefault((info.tipo, info.contador), len(claves))
+
+        clave = clave_por_codigo[tabla.id_codigo]
+        es_linea = clave >= 0
+
+        # Cada punto suelto es un grupo aparte
+        grupo = np.where(es_linea, clave, len(claves) + filas)
+        _, primera_fila, inverso = np.unique(grupo, return_index=True, return_inverse=True)
+        inverso = inverso.reshape(-1)
+
+        min_punto = np.full(len(primera_fila), np.inf)
+        np.minimum.at(min_punto, inverso, tabla.num)
+
+    with perfil.etapa('ordenacion', n):
+        orden = np.lexsort((filas, tabla.num, primera_fila[inverso], min_punto[inverso]))
+
+        grupo_ordenado = inverso[orden]
+        es_inicio = np.empty(n, dtype=bool)
+        if n:
+            es_inicio[0] = True
+            es_inicio[1:] = grupo_ordenado[1:] != grupo_ordenado[:-1]
+        es_inicio &= es_linea[orden]
+
+    return orden, es_inicio
+
+
+def orden_fase7(tabla, clave_tipo, clave_contador, perfil=INACTIVO):
+    """
+    Orden de la fase 7: primero las líneas (Grupo B) por tipo y contador,
+    manteniendo el orden de lectura dentro de cada línea; después los
+    puntos sueltos (Grupo A) ordenados solo por tipo.
+
+    'clave_tipo' y 'clave_contador' son las funciones de ordenación de la
+    fase (get_type_sort_key / get_counter_sort_key).
+
+    Retorna (orden, es_inicio, es_linea) con los índices de fila en el orden
+    de salida, si cada una es el primer punto de su línea y si es línea.
+    """
+    with perfil.etapa('agrupacion', len(tabla)):
+        # La tabla de códigos ya está en orden de primera aparición
+        rango_linea, rango_suelto = rangos_fase7(tabla.info, clave_tipo, clave_contador)
+        n_lineas = len(rango_linea)
+
+        rango_por_codigo = np.array(
+            [rango_fase7(cod, rango_linea, rango_suelto) for cod in tabla.info], dtype=np.int64
+        )
+        rango = rango_por_codigo[tabla.id_codigo]
+
+    with perfil.etapa('ordenacion', len(tabla)):
+        orden = np.argsort(rango, kind='stable')
+
+        rango_ordenado = rango[orden]
+        es_linea = rango_ordenado < n_lineas
+        es_inicio = np.empty(len(tabla), dtype=bool)
+        if len(tabla):
+            es_inicio[0] = True
+            es_inicio[1:] = rango_ordenado[1:] != rango_ordenado[:-1]
+        es_inicio &= es_linea
+
+    return orden, es_inicio, es_linea
+
+
+def cuentas_grupos(tabla):
+    """Filas por (tipo, contador), para protopo.perfil."""
+    return cuentas_por_codigo(tabla.info, np.bincount(tabla.id_codigo, minlength=len(tabla.info)).tolist())
@@ -0,0 +1,276 @@
+"""
+DXF directo desde los puntos con coordenadas, sin pasar por el Lisp.
+
+La salida de la fase 7 es un paso intermedio: luego otro programa rehace
+las líneas a partir de los 'TIPO00' y el Lisp de AutoCAD inserta las
+entidades una a una, muy lento con trabajos grandes. Aquí se recorre el
+fichero 'punto,X,Y,Z,código' (el '_xyz.txt' de protopo.reduccion) en el
+orden de la fase 7 y se escribe un DXF (R12, el más sencillo de leer):
+- Cada línea (TIPO, CONTADOR) es una polilínea 3D en la capa TIPO.
+- Cada punto suelto es un POINT (o un INSERT del bloque '--bloque') en la
+  capa de su tipo.
+
+El DXF se escribe en flujo, entidad a entidad, sin montar el dibujo en
+memoria. Si la entrada ya está agrupada (salida de la fase 7 sobre el
+'_xyz.txt', con 'TIPO00' / 'TIPO') no se carga ni se ordena nada; con los
+códigos sin agrupar ('TIPO&CONTADOR') se ordenan las filas como la fase 7
+(protopo.orden.rangos_fase7) antes de escribir.
+
+Uso:
+    python -m protopo.dxf campo_xyz.txt [--bloque PUNTO_TOPO]    -> campo_xyz.dxf
+"""
+import argparse
+import os
+import re
+import sys
+from collections import namedtuple
+
+from protopo import fases
+from protopo.codigos import codigo_fase7
+from protopo.espacial import ATRIBUTOS_FASE6, atributos_conocidos, bases_de_inicio, sigue_linea, tipo_agrupado
+from protopo.flujo import leer_lineas
+from protopo.orden import rango_fase7, rangos_fase7
+
+FilaXYZ = namedtuple('FilaXYZ', ['punto', 'x', 'y', 'z', 'codigo'])
+
+# Caracteres que no admite un nombre de capa
+_NO_VALIDOS_CAPA = re.compile(r'[<>/\\":;?*|=,\'\x00-\x1f]')
+
+# Entidades acumuladas antes de escribir en disco
+ENTIDADES_POR_ESCRITURA = 4096
+
+
+def nombre_capa(tipo):
+    """Nombre de capa válido para un tipo ('' -> '0')."""
+    return _NO_VALIDOS_CAPA.sub('_', tipo.strip()) or '0'
+
+
+class EscritorDXF:
+    """
+    DXF R12 escrito en flujo. Se usa con 'with': al salir sin error se
+    cierra la sección de entidades y el fichero temporal pasa a 'ruta'.
+    """
+
+    def __init__(self, ruta, bloque=None, decimales=4):
+        self.ruta = ruta
+        self.bloque = nombre_capa(bloque) if bloque else None
+        self.temporal = f"{ruta}.{os.getpid()}.tmp"
+        self.polilineas = 0
+        self.puntos = 0
+        self._f = None
+        self._trozos = []
+        self._en_polilinea = False
+        self._capa_polilinea = '0'
+        # Cada entidad sale de una sola plantilla: formatear valor a valor cuesta el doble
+        xyz = f" 10\n{{:.{decimales}f}}\n 20\n{{:.{decimales}f}}\n 30\n{{:.{decimales}f}}\n"
+        self._vertice = "  0\nVERTEX\n  8\n{}\n" + xyz + " 70\n32\n"
+        if self.bloque:
+            bloque_plantilla = self.bloque.replace('{', '{{').replace('}', '}}')
+            self._punto = "  0\nINSERT\n  8\n{}\n  2\n" + bloque_plantilla + "\n" + xyz
+        else:
+            self._punto = "  0\nPOINT\n  8\n{}\n" + xyz
+
+    def __enter__(self):
+        # Códigos de página de Windows, como espera AutoCAD en un R12
+        self._f = open(self.temporal, 'w', encoding='cp1252', errors='replace')
+        self._pares(0, 'SECTION', 2, 'HEADER', 9, '$ACADVER', 1, 'AC1009', 9, '$DWGCODEPAGE', 3, 'ANSI_1252',
+                    0, 'ENDSEC')
+        if self.bloque:
+            # Definición mínima (un punto); si el dibujo ya tiene el bloque, manda la suya
+            self._pares(0, 'SECTION', 2, 'BLOCKS', 0, 'BLOCK', 8, '0', 2, self.bloque, 70, 0,
+                        10, '0.0', 20, '0.0', 30, '0.0', 3, self.bloque,
+                        0, 'POINT', 8, '0', 10, '0.0', 20, '0.0', 30, '0.0', 0, 'ENDBLK', 8, '0', 0, 'ENDSEC')
+        self._pares(0, 'SECTION', 2, 'ENTITIES')
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        try:
+            if tipo_error is None:
+                if self._en_polilinea:
+                    self.terminar_polilinea()
+                self._pares(0, 'ENDSEC', 0, 'EOF')
+                self._volcar()
+        finally:
+            self._f.close()
+        if tipo_error is None:
+            os.replace(self.temporal, self.ruta)
+        elif os.path.exists(self.temporal):
+            os.remove(self.temporal)
+        return False
+
+    def _pares(self, *pares):
+        """Pares (código de grupo, valor) sueltos: cabecera, bloques y cierres."""
+        self._emitir(''.join(f"{codigo:>3}\n{valor}\n" for codigo, valor in zip(pares[::2], pares[1::2])))
+
+    def _emitir(self, texto):
+        self._trozos.append(texto)
+        if len(self._trozos) >= ENTIDADES_POR_ESCRITURA:
+            self._volcar()
+
+    def _volcar(self):
+        if self._trozos:
+            self._f.write(''.join(self._trozos))
+            self._trozos.clear()
+
+    def empezar_polilinea(self, capa):
+        """Polilínea 3D en 'capa'; los vértices van con vertice() y se cierra con terminar_polilinea()."""
+        if self._en_polilinea:
+            self.terminar_polilinea()
+        self._pares(0, 'POLYLINE', 8, capa, 66, 1, 10, '0.0', 20, '0.0', 30, '0.0', 70, 8)
+        self._en_polilinea = True
+        self._capa_polilinea = capa
+        self.polilineas += 1
+
+    def vertice(self, x, y, z):
+        self._emitir(self._vertice.format(self._capa_polilinea, x, y, z))
+
+    def terminar_polilinea(self):
+        self._pares(0, 'SEQEND', 8, self._capa_polilinea)
+        self._en_polilinea = False
+
+    def punto(self, capa, x, y, z):
+        """POINT (o INSERT del bloque) en 'capa'."""
+        if self._en_polilinea:
+            self.terminar_polilinea()
+        self._emitir(self._punto.format(capa, x, y, z))
+        self.puntos += 1
+
+
+def filas_xyz(archivo_entrada):
+    """Filas 'punto,X,Y[,Z],código' (Z vacía -> 0). Las que no tienen X e Y numéricas se saltan."""
+    for linea_txt, corte in leer_lineas(archivo_entrada, min_campos=4):
+        punto, x, y, z = linea_txt[:corte].split(',', 4)[:4]
+        try:
+            x, y = float(x), float(y)
+            z = float(z) if z.strip() else 0.0
+        except ValueError:
+            continue
+        yield FilaXYZ(punto.strip(), x, y, 0.0 if z != z else z, linea_txt[corte:])
+
+
+def _analizar(archivo_entrada):
+    """(agrupada, atributos): True si ningún código lleva '&' y los atributos de la fase 6 del fichero."""
+    codigos = {linea_txt[corte:] for linea_txt, corte in leer_lineas(archivo_entrada, min_campos=4)}
+    return not any('&' in codigo for codigo in codigos), atributos_conocidos(codigos)
+
+
+def escribir_agrupado(dxf, filas, atributos=ATRIBUTOS_FASE6):
+    """
+    Entrada ya en el orden de la fase 6/7: 'TIPO00' (con atributos detrás en
+    la fase 6, 'FE00 CE') empieza una línea que siguen las filas 'TIPO' o
+    'TIPO ATRIB...', con ATRIB en 'atributos'. Un 'TIPO00' sin más puntos
+    detrás es una línea de un solo punto: va como punto a la capa TIPO. El
+    tipo puede tener espacios: '26 REDONDO00' cierra la línea '26' abierta y
+    empieza otra en la capa '26 REDONDO'.
+    """
+    actual = None    # tipo de la polilínea abierta
+    pendiente = None # (fila, tipos posibles) de un TIPO00 a la espera de la siguiente fila
+    for fila in filas:
+        bases = bases_de_inicio(fila.codigo)
+        if pendiente is not None:
+            inicio, posibles = pendiente
+            pendiente = None
+            base = next((b for b in posibles if sigue_linea(fila.codigo, b, atributos)), None)
+            if base is not None:
+                dxf.empezar_polilinea(nombre_capa(base))
+                dxf.vertice(inicio.x, inicio.y, inicio.z)
+                dxf.vertice(fila.x, fila.y, fila.z)
+                actual = base
+                continue
+            dxf.punto(nombre_capa(posibles[0]), inicio.x, inicio.y, inicio.z)
+        elif actual is not None:
+            if sigue_linea(fila.codigo, actual, atributos):
+                dxf.vertice(fila.x, fila.y, fila.z)
+                continue
+            dxf.terminar_polilinea()
+            actual = None
+
+        if bases:
+            pendiente = (fila, bases)
+        else:
+            dxf.punto(nombre_capa(tipo_agrupado(fila.codigo, atributos)), fila.x, fila.y, fila.z)
+
+    if pendiente is not None:
+        inicio, posibles = pendiente
+        dxf.punto(nombre_capa(posibles[0]), inicio.x, inicio.y, inicio.z)
+
+
+def escribir_sin_agrupar(dxf, filas):
+    """Códigos 'TIPO&CONTADOR': filas ordenadas como la fase 7 y una polilínea por (tipo, contador)."""
+    modulo = fases.cargar_modulo(7)
+    filas = [(fila, codigo_fase7(fila.codigo)) for fila in filas]
+    codigos = list(dict.fromkeys(info for _, info in filas))
+    rango_linea, rango_suelto = rangos_fase7(codigos, modulo.get_type_sort_key, modulo.get_counter_sort_key)
+    rangos = [rango_fase7(info, rango_linea, rango_suelto) for _, info in filas]
+
+    anterior = None
+    pendiente = None # primer punto de una línea: polilínea solo si tiene al menos dos
+    for i in sorted(range(len(filas)), key=rangos.__getitem__):
+        fila, info = filas[i]
+        if info.contador is None:
+            if pendiente is not None:
+                dxf.punto(nombre_capa(pendiente[1].tipo), pendiente[0].x, pendiente[0].y, pendiente[0].z)
+                pendiente = None
+            dxf.punto(nombre_capa(info.tipo), fila.x, fila.y, fila.z)
+        elif rangos[i] != anterior:
+            if pendiente is not None:
+                dxf.punto(nombre_capa(pendiente[1].tipo), pendiente[0].x, pendiente[0].y, pendiente[0].z)
+            pendiente = (fila, info)
+        elif pendiente is not None:
+            inicio, info_inicio = pendiente
+            pendiente = None
+            dxf.empezar_polilinea(nombre_capa(info_inicio.tipo))
+            dxf.vertice(inicio.x, inicio.y, inicio.z)
+            dxf.vertice(fila.x, fila.y, fila.z)
+        else:
+            dxf.vertice(fila.x, fila.y, fila.z)
+        anterior = rangos[i]
+    if pendiente is not None:
+        dxf.punto(nombre_capa(pendiente[1].tipo), pendiente[0].x, pendiente[0].y, pendiente[0].z)
+
+
+def procesar_dxf(archivo_entrada, archivo_salida, bloque=None):
+    """Escribe el DXF de 'archivo_entrada'. Retorna el número de entidades (None si hay error)."""
+    print(f"DXF - Leyendo: {archivo_entrada}...")
+    try:
+        agrupada, atributos = _analizar(archivo_entrada)
+        with EscritorDXF(archivo_salida, bloque) as dxf:
+            if agrupada:
+                escribir_agrupado(dxf, filas_xyz(archivo_entrada), atributos)
+            else:
+                escribir_sin_agrupar(dxf, filas_xyz(archivo_entrada))
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error: {e}")
+        return
+    total = dxf.polilineas + dxf.puntos
+    if not total:
+        os.remove(archivo_salida)
+        print("Archivo sin puntos con coordenadas.")
+        return
+    print(f"¡Éxito DXF! {dxf.polilineas} polilíneas y {dxf.puntos} puntos. Generado: {archivo_salida}")
+    return total
+
+
+def ruta_salida(ruta_entrada):
+    """Salida junto a la entrada: 'campo_xyz.txt' -> 'campo_xyz.dxf'."""
+    return os.path.splitext(ruta_entrada)[0] + ".dxf"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DXF con polilíneas 3D por línea y puntos sueltos.")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) 'punto,X,Y,Z,código'")
+    parser.add_argument('--bloque', help="Insertar este bloque en los puntos sueltos en vez de un POINT")
+    parser.add_argument('-o', '--salida', help="Fichero de salida (solo con una entrada)")
+    args = parser.parse_args(argv)
+    if args.salida and len(args.entradas) > 1:
+        parser.error("--salida solo con un fichero de entrada")
+
+    fallos = 0
+    for entrada in args.entradas:
+        if procesar_dxf(entrada, args.salida or ruta_salida(entrada), args.bloque) is None:
+            fallos += 1
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
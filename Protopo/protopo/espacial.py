@@ -0,0 +1,501 @@
+"""
+Índice espacial de puntos con coordenadas (rejilla uniforme con NumPy) y
+comprobaciones de duplicados y de puntos sueltos sobre líneas.
+
+Comparar cada punto con todos los demás es O(n²): con un millón de puntos
+no acaba. La rejilla reparte los puntos en celdas cuadradas (clave entera
+por celda, ordenadas) y cada consulta solo mira las celdas vecinas. Todas las
+consultas van en bloque:
+- Rejilla.pares_cercanos(radio): pares de puntos a menos de 'radio'.
+- Rejilla.en_radio(x, y, radio): puntos a menos de 'radio' de cada consulta.
+- Rejilla.mas_cercano(x, y): punto más cercano a cada consulta.
+
+Encima, el informe de duplicados sobre un fichero 'punto,X,Y,Z,código' ya
+agrupado (el '_xyz.txt' de protopo.reduccion pasado por la fase 6 o 7):
+- Disparos a menos de 2 cm con distinto tipo de código (y cuántos con el
+  mismo).
+- Puntos sueltos a menos de 2 cm de una línea (de un tramo entre dos de sus
+  puntos).
+
+Líneas del fichero: un código 'TIPO00' empieza una línea y la siguen las
+filas con código 'TIPO' (con los atributos de la fase 6 detrás: 'FE00 CE',
+'FE', 'FE F'); sin agrupar, las filas con el mismo 'TIPO&CONTADOR'. Lo demás
+son puntos sueltos.
+
+Uso:
+    python -m protopo.espacial campo_xyz_fase7.txt [--radio 0.02] [--tolerancia-linea 0.02]
+    -> campo_xyz_fase7_duplicados.txt
+"""
+import argparse
+import math
+import os
+import re
+import sys
+from array import array
+from collections import namedtuple
+
+from protopo import columnar
+from protopo.codigos import MAX_CODIGOS, codigo_fase7
+from protopo.flujo import escribir_lineas, leer_lineas
+
+np = columnar.np
+
+# Claves de celda: ix * 2^31 + (iy + 2^30); vale para |iy| < 2^30 celdas
+_DESPLAZAR_Y = 1 << 30
+_MULT_X = 1 << 31
+
+# Consultas por bloque (limita la memoria de los pares candidatos)
+CONSULTAS_POR_BLOQUE = 1 << 18
+
+# mas_cercano: cuadrados de hasta 2·8+1 celdas de lado; más lejos, contra todos
+MAX_ANILLOS = 8
+
+# sueltos_en_lineas: trozos de tramo por bloque (limita la memoria de los candidatos)
+TROZOS_POR_BLOQUE = 1 << 12
+
+RADIO_DUPLICADO = 0.02
+TOLERANCIA_LINEA = 0.02
+
+# Palabra que cierra el tipo en un inicio de línea: 'FE00', 'REDONDO00'...
+_FIN_INICIO = re.compile(r'\S00(?=\s|$)')
+
+# bases_de_inicio: resultados por texto del código (pocos códigos distintos)
+_bases_de = {}
+
+# Atributos que la fase 6 escribe detrás del tipo ('@CE' -> ' CE'); ver atributos_conocidos()
+ATRIBUTOS_FASE6 = frozenset(('F', 'AS', 'AE', 'C', 'CE'))
+
+PuntosXYZ = namedtuple('PuntosXYZ', ['punto', 'x', 'y', 'z', 'codigo', 'tipo', 'linea', 'descartadas'])
+
+
+class ErrorEspacial(Exception):
+    """Índice espacial que no se puede crear (sin NumPy, celda no válida...)."""
+
+
+def _requiere_numpy():
+    if not columnar.HAY_NUMPY:
+        raise ErrorEspacial("El índice espacial necesita NumPy")
+
+
+def _clave(ix, iy):
+    return ix * _MULT_X + (iy + _DESPLAZAR_Y)
+
+
+def _expandir(inicios, cuentas):
+    """[inicio, inicio + cuenta) de cada rango, todos seguidos."""
+    total = int(cuentas.sum())
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(cuentas) - cuentas, cuentas)
+    return np.repeat(inicios, cuentas) + desplazamiento
+
+
+class Rejilla:
+    """Rejilla uniforme de celdas de lado 'celda' sobre los puntos (x, y)."""
+
+    def __init__(self, x, y, celda):
+        _requiere_numpy()
+        if not celda > 0:
+            raise ErrorEspacial(f"Tamaño de celda no válido: {celda}")
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.celda = float(celda)
+        clave = _clave(*self._celdas(self.x, self.y))
+        # Puntos ordenados por celda; cada celda es un rango [inicio, fin)
+        self.orden = np.argsort(clave, kind='stable')
+        self.claves, self.inicio, cuentas = np.unique(clave[self.orden], return_index=True, return_counts=True)
+        self.fin = self.inicio + cuentas
+
+    def __len__(self):
+        return len(self.x)
+
+    def _celdas(self, x, y):
+        return np.floor(x / self.celda).astype(np.int64), np.floor(y / self.celda).astype(np.int64)
+
+    def _candidatos(self, ix, iy, desplazamientos):
+        """Pares (consulta, punto) con el punto en la celda de la consulta desplazada."""
+        if not len(self.claves):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Consultas ordenadas por celda: searchsorted va mucho más rápido
+        # con las claves en orden (y sumar un desplazamiento no lo cambia)
+        base = _clave(ix, iy)
+        orden_consultas = np.argsort(base, kind='stable')
+        base = base[orden_consultas]
+        consultas, puntos = [], []
+        for dx, dy in desplazamientos:
+            clave = base + (dx * _MULT_X + dy)
+            pos = np.minimum(np.searchsorted(self.claves, clave), len(self.claves) - 1)
+            con_puntos = np.flatnonzero(self.claves[pos] == clave)
+            celda = pos[con_puntos]
+            cuentas = self.fin[celda] - self.inicio[celda]
+            consultas.append(orden_consultas[np.repeat(con_puntos, cuentas)])
+            puntos.append(self.orden[_expandir(self.inicio[celda], cuentas)])
+        return np.concatenate(consultas), np.concatenate(puntos)
+
+    def _anillos(self, radio):
+        k = max(1, math.ceil(radio / self.celda))
+        return [(dx, dy) for dx in range(-k, k + 1) for dy in range(-k, k + 1)]
+
+    def en_radio(self, x, y, radio):
+        """Pares (consulta, punto) con el punto a distancia <= radio de la consulta (x[i], y[i])."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        anillos = self._anillos(radio)
+        consultas, puntos = [], []
+        for desde in range(0, len(x), CONSULTAS_POR_BLOQUE):
+            bx, by = x[desde:desde + CONSULTAS_POR_BLOQUE], y[desde:desde + CONSULTAS_POR_BLOQUE]
+            q, p = self._candidatos(*self._celdas(bx, by), anillos)
+            cerca = np.hypot(self.x[p] - bx[q], self.y[p] - by[q]) <= radio
+            consultas.append(q[cerca] + desde)
+            puntos.append(p[cerca])
+        if not consultas:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(consultas), np.concatenate(puntos)
+
+    def pares_cercanos(self, radio):
+        """Pares (i, j), i < j, de puntos a distancia <= radio entre sí."""
+        if radio > self.celda:
+            raise ErrorEspacial("pares_cercanos necesita una celda de al menos el radio")
+        ix, iy = self._celdas(self.x, self.y)
+        # Cada par de celdas vecinas una sola vez: la propia y la mitad de las vecinas
+        mitad = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+        primeros, segundos = [], []
+        for desde in range(0, len(self), CONSULTAS_POR_BLOQUE):
+            hasta = desde + CONSULTAS_POR_BLOQUE
+            q, p = self._candidatos(ix[desde:hasta], iy[desde:hasta], mitad)
+            q += desde
+            misma_celda = (ix[q] == ix[p]) & (iy[q] == iy[p])
+            validos = ~misma_celda | (q < p)
+            q, p = q[validos], p[validos]
+            cerca = np.hypot(self.x[p] - self.x[q], self.y[p] - self.y[q]) <= radio
+            q, p = q[cerca], p[cerca]
+            primeros.append(np.minimum(q, p))
+            segundos.append(np.maximum(q, p))
+        if not primeros:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(primeros), np.concatenate(segundos)
+
+    def mas_cercano(self, x, y, excluir=None):
+        """
+        (índice, distancia) del punto más cercano a cada consulta; -1 e inf
+        si no hay ninguno. 'excluir[i]' es un punto que no cuenta para la
+        consulta i (ella misma, si las consultas son los puntos).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        excluir = None if excluir is None else np.asarray(excluir, dtype=np.int64)
+        indice = np.full(len(x), -1, dtype=np.int64)
+        distancia = np.full(len(x), np.inf)
+        if not len(self):
+            return indice, distancia
+
+        # Cuadrados de celdas cada vez mayores alrededor de cada consulta
+        pendientes = np.arange(len(x))
+        k = 1
+        while len(pendientes) and k <= MAX_ANILLOS:
+            ix, iy = self._celdas(x[pendientes], y[pendientes])
+            q, p = self._candidatos(ix, iy, self._anillos(k * self.celda))
+            if excluir is not None:
+                otro = p != excluir[pendientes[q]]
+                q, p = q[otro], p[otro]
+            d = np.hypot(self.x[p] - x[pendientes[q]], self.y[p] - y[pendientes[q]])
+            # El mejor candidato de cada consulta (en empate, cualquiera de ellos)
+            minima = np.full(len(pendientes), np.inf)
+            np.minimum.at(minima, q, d)
+            mejor = np.flatnonzero(d == minima[q])
+            q, p, d = q[mejor], p[mejor], d[mejor]
+            # Solo vale si fuera del cuadrado mirado no puede haber nada más cerca
+            seguro = d <= k * self.celda
+            indice[pendientes[q[seguro]]] = p[seguro]
+            distancia[pendientes[q[seguro]]] = d[seguro]
+            resueltas = np.zeros(len(pendientes), dtype=bool)
+            resueltas[q[seguro]] = True
+            pendientes = pendientes[~resueltas]
+            k *= 2
+
+        # Consultas lejos de todo: contra todos los puntos, por bloques
+        por_bloque = max(1, (1 << 22) // len(self))
+        for desde in range(0, len(pendientes), por_bloque):
+            bloque = pendientes[desde:desde + por_bloque]
+            d = np.hypot(self.x[None, :] - x[bloque, None], self.y[None, :] - y[bloque, None])
+            if excluir is not None:
+                d[np.arange(len(bloque)), excluir[bloque]] = np.inf
+            mejor = np.argmin(d, axis=1)
+            dist = d[np.arange(len(bloque)), mejor]
+            hay = np.isfinite(dist)
+            indice[bloque[hay]] = mejor[hay]
+            distancia[bloque[hay]] = dist[hay]
+        return indice, distancia
+
+
+def leer_puntos(archivo_entrada):
+    """
+    Puntos de un fichero 'punto,X,Y,Z,código' (Z puede ir vacía) y la línea
+    de cada uno (-1 si es suelto). Las filas sin X e Y numéricas se descartan.
+    """
+    _requiere_numpy()
+    punto, codigo = [], []
+    x, y, z = array('d'), array('d'), array('d')
+    descartadas = 0
+    for linea_txt, corte in leer_lineas(archivo_entrada, min_campos=4):
+        campos = linea_txt[:corte].split(',')
+        try:
+            xi, yi = float(campos[1]), float(campos[2])
+            zi = float(campos[3]) if len(campos) > 4 and campos[3].strip() else math.nan
+        except ValueError:
+            descartadas += 1
+            continue
+        punto.append(campos[0].strip())
+        codigo.append(linea_txt[corte:])
+        x.append(xi)
+        y.append(yi)
+        z.append(zi)
+    x, y, z = (np.frombuffer(c, dtype=np.float64) for c in (x, y, z))
+    linea, tipo = lineas_de_codigos(codigo)
+    return PuntosXYZ(punto, x, y, z, codigo, tipo, linea, descartadas)
+
+
+def bases_de_inicio(codigo):
+    """
+    Tipos posibles si 'codigo' empieza una línea de las fases 6/7: una
+    palabra que acaba en '00' cierra el tipo y lo que va detrás son atributos
+    de la fase 6 ('FE00 CE' -> 'FE', '26 REDONDO00' -> '26 REDONDO').
+    De la última palabra así a la primera; vacío si no es un inicio.
+    """
+    try:
+        return _bases_de[codigo]
+    except KeyError:
+        pass
+    if len(_bases_de) >= MAX_CODIGOS:
+        _bases_de.clear()
+    limpio = codigo.strip()
+    bases = _bases_de[codigo] = tuple(limpio[:m.end() - 2] for m in reversed(list(_FIN_INICIO.finditer(limpio))))
+    return bases
+
+
+def atributos_conocidos(codigos=()):
+    """
+    Palabras que, detrás del tipo, son atributos de la fase 6: las de
+    ATRIBUTOS_FASE6, las de PROTOPO_ATRIBUTOS ('X,Y') y las que van detrás
+    del '00' en los inicios de línea de 'codigos' ('FE00 CE' -> 'CE').
+    """
+    atributos = set(ATRIBUTOS_FASE6)
+    atributos.update(a.strip() for a in os.environ.get('PROTOPO_ATRIBUTOS', '').split(',') if a.strip())
+    for codigo in codigos:
+        bases = bases_de_inicio(codigo)
+        if bases:
+            atributos.update(codigo.strip()[len(bases[0]) + 2:].split())
+    return frozenset(atributos)
+
+
+def sigue_linea(codigo, base, atributos):
+    """True si 'codigo' es una fila de la línea 'base' que no la empieza: 'FE', 'FE F', 'FE C F'."""
+    return codigo == base or _sigue(codigo.strip(), base, atributos)
+
+
+def _sigue(codigo, base, atributos):
+    """sigue_linea() con 'codigo' ya sin espacios en los extremos."""
+    if codigo == base:
+        return True
+    if not (codigo.startswith(base) and codigo[len(base):len(base) + 1].isspace()):
+        return False
+    return all(palabra in atributos for palabra in codigo[len(base):].split())
+
+
+def tipo_agrupado(codigo, atributos=ATRIBUTOS_FASE6):
+    """
+    Tipo de un código de las fases 6/7 visto solo: sin '00' ni atributos si
+    es un inicio de línea; si no, lo que va antes de la primera '@' sin los
+    'atributos' del final ('BAJ AS' -> 'BAJ', '26 REDONDO' se queda igual).
+    """
+    bases = bases_de_inicio(codigo)
+    if bases:
+        return bases[0]
+    tipo = codigo_fase7(codigo).tipo.strip()
+    while True:
+        resto, _, ultima = tipo.rpartition(' ')
+        if not resto or ultima not in atributos:
+            return tipo
+        tipo = resto.rstrip()
+
+
+def lineas_de_codigos(codigos, atributos=None):
+    """
+    (línea, tipo) de cada fila: número de línea en orden de aparición (-1 si
+    es un punto suelto) y tipo sin contador, atributos ni '00'. Sin
+    'atributos', los de atributos_conocidos(codigos).
+    """
+    linea = np.full(len(codigos), -1, dtype=np.int64)
+    tipos = [None] * len(codigos)
+    # Pocos códigos distintos: cada uno se analiza una vez
+    distintos = set(codigos)
+    if atributos is None:
+        atributos = atributos_conocidos(distintos)
+    bases_de = {codigo: bases_de_inicio(codigo) for codigo in distintos}
+    tipo_de = {codigo: tipo_agrupado(codigo, atributos) for codigo in distintos}
+    limpio = {codigo: codigo.strip() for codigo in distintos}
+    por_contador = {}
+    n = 0
+    i = 0
+    while i < len(codigos):
+        info = codigo_fase7(codigos[i])
+        if info.contador is not None:
+            # Sin agrupar: TIPO&CONTADOR
+            clave = (info.tipo, info.contador)
+            if clave not in por_contador:
+                por_contador[clave] = n
+                n += 1
+            linea[i] = por_contador[clave]
+            tipos[i] = info.tipo
+            i += 1
+            continue
+        tipos[i] = tipo_de[codigos[i]]
+        # Agrupado: TIPO00 [ATRIB...] seguido de filas TIPO [ATRIB...] (sin
+        # seguidoras es un suelto). Con varias palabras en '00' vale el tipo
+        # que sigue la fila de detrás.
+        siguiente = codigos[i + 1] if i + 1 < len(codigos) else None
+        base = next((b for b in bases_de[codigos[i]]
+                     if siguiente is not None and _sigue(limpio[siguiente], b, atributos)), None)
+        if base is not None:
+            fin = i + 1
+            while fin < len(codigos) and _sigue(limpio[codigos[fin]], base, atributos):
+                fin += 1
+            linea[i:fin] = n
+            tipos[i:fin] = [base] * (fin - i)
+            n += 1
+            i = fin
+            continue
+        i += 1
+    return linea, tipos
+
+
+def duplicados(puntos, radio=RADIO_DUPLICADO):
+    """
+    Pares (i, j, distancia) de disparos a distancia <= radio (3D si los dos
+    tienen Z, si no en planta).
+    """
+    rejilla = Rejilla(puntos.x, puntos.y, radio)
+    i, j = rejilla.pares_cercanos(radio)
+    dz = np.nan_to_num(puntos.z[i] - puntos.z[j]) # Sin Z: solo en planta
+    distancia = np.sqrt((puntos.x[i] - puntos.x[j]) ** 2 + (puntos.y[i] - puntos.y[j]) ** 2 + dz ** 2)
+    cerca = distancia <= radio
+    return i[cerca], j[cerca], distancia[cerca]
+
+
+def sueltos_en_lineas(puntos, tolerancia=TOLERANCIA_LINEA):
+    """
+    (punto suelto, tramo, distancia en planta) de los sueltos a menos de
+    'tolerancia' de un tramo de línea. El tramo t va del punto t al t + 1.
+    """
+    linea = puntos.linea
+    tramo = np.flatnonzero((linea[:-1] >= 0) & (linea[:-1] == linea[1:]))
+    sueltos = np.flatnonzero(linea < 0)
+    vacio = (np.empty(0, dtype=np.int64),) * 2 + (np.empty(0),)
+    if not len(tramo) or not len(sueltos):
+        return vacio
+
+    # Los tramos se parten en trozos de largo <= paso (el tramo típico cabe en
+    # uno): un suelto a menos de 'tolerancia' de un trozo está a menos de
+    # paso / 2 + tolerancia de su centro. Los trozos van por bloques.
+    ax, ay = puntos.x[tramo], puntos.y[tramo]
+    dx, dy = puntos.x[tramo + 1] - ax, puntos.y[tramo + 1] - ay
+    largo = np.hypot(dx, dy)
+    paso = max(2 * tolerancia, float(np.median(largo)))
+    trozos = np.maximum(np.ceil(largo / paso).astype(np.int64), 1)
+    acumulado = np.cumsum(trozos)
+    rejilla = Rejilla(puntos.x[sueltos], puntos.y[sueltos], paso)
+    px_sueltos, py_sueltos = puntos.x[sueltos], puntos.y[sueltos]
+
+    encontrados, de_tramo, distancias = [], [], []
+    for desde in range(0, int(acumulado[-1]), TROZOS_POR_BLOQUE):
+        trozo = np.arange(desde, min(desde + TROZOS_POR_BLOQUE, int(acumulado[-1])))
+        s = np.searchsorted(acumulado, trozo, side='right')
+        t = (trozo - (acumulado[s] - trozos[s]) + 0.5) / trozos[s]
+        q, p = rejilla.en_radio(ax[s] + t * dx[s], ay[s] + t * dy[s], paso / 2 + tolerancia)
+        s = s[q]
+
+        # Distancia exacta del punto al tramo
+        px, py = px_sueltos[p], py_sueltos[p]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            u = np.where(largo[s] > 0, ((px - ax[s]) * dx[s] + (py - ay[s]) * dy[s]) / (largo[s] ** 2), 0)
+        u = np.clip(u, 0, 1)
+        distancia = np.hypot(px - (ax[s] + u * dx[s]), py - (ay[s] + u * dy[s]))
+        cerca = distancia <= tolerancia
+        encontrados.append(p[cerca])
+        de_tramo.append(s[cerca])
+        distancias.append(distancia[cerca])
+
+    # Un suelto cerca de varios trozos del mismo tramo sale una vez
+    encontrados, de_tramo, distancias = (np.concatenate(v) for v in (encontrados, de_tramo, distancias))
+    pares, primero = np.unique(np.stack((encontrados, de_tramo), axis=1), axis=0, return_index=True)
+    if not len(pares):
+        return vacio
+    return sueltos[pares[:, 0]], tramo[pares[:, 1]], distancias[primero]
+
+
+def ruta_salida(ruta_entrada):
+    """Informe junto a la entrada: 'campo_xyz.txt' -> 'campo_xyz_duplicados.txt'."""
+    return os.path.splitext(ruta_entrada)[0] + "_duplicados.txt"
+
+
+def procesar_duplicados(archivo_entrada, archivo_salida, radio=RADIO_DUPLICADO, tolerancia_linea=TOLERANCIA_LINEA):
+    """
+    Escribe el informe de duplicados y sueltos sobre líneas de 'archivo_entrada'.
+    Retorna el número de avisos escritos (None si hay error).
+    """
+    print(f"Duplicados - Leyendo: {archivo_entrada}...")
+    try:
+        puntos = leer_puntos(archivo_entrada)
+    except ErrorEspacial as e:
+        print(f"Error: {e}")
+        return
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+    if puntos.descartadas:
+        print(f"  Aviso: {puntos.descartadas} filas sin X, Y numéricas")
+    if not len(puntos.x):
+        print("Archivo sin puntos.")
+        return
+
+    i, j, d = duplicados(puntos, radio)
+    codigo, tipo = puntos.codigo, puntos.tipo
+    distinto = np.array([tipo[a] != tipo[b] for a, b in zip(i.tolist(), j.tolist())], dtype=bool)
+    s, tramo, ds = sueltos_en_lineas(puntos, tolerancia_linea)
+
+    nombre = puntos.punto
+    informe = ["tipo,punto,codigo,punto2,codigo2,distancia"]
+    for a, b, dist in zip(i[distinto].tolist(), j[distinto].tolist(), d[distinto].tolist()):
+        informe.append(f"DUPLICADO,{nombre[a]},{codigo[a]},{nombre[b]},{codigo[b]},{dist:.3f}")
+    for a, t, dist in zip(s.tolist(), tramo.tolist(), ds.tolist()):
+        informe.append(f"EN_LINEA,{nombre[a]},{codigo[a]},{nombre[t]}-{nombre[t + 1]},{codigo[t]},{dist:.3f}")
+
+    try:
+        escribir_lineas(archivo_salida, informe)
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    print(f"  {len(puntos.x)} puntos, {int(puntos.linea.max(initial=-1)) + 1} líneas")
+    print(f"  {int(distinto.sum())} pares a menos de {radio} con distinto código "
+          f"({int((~distinto).sum())} más con el mismo código, no se listan)")
+    print(f"  {len(s)} puntos sueltos a menos de {tolerancia_linea} de una línea")
+    print(f"¡Éxito Duplicados! Generado: {archivo_salida}")
+    return len(informe) - 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Disparos duplicados y puntos sueltos sobre líneas (índice espacial).")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) 'punto,X,Y,Z,código'")
+    parser.add_argument('--radio', type=float, default=RADIO_DUPLICADO,
+                        help=f"Distancia máxima entre disparos duplicados, metros ({RADIO_DUPLICADO})")
+    parser.add_argument('--tolerancia-linea', type=float, default=TOLERANCIA_LINEA,
+                        help=f"Distancia máxima de un suelto a una línea, metros ({TOLERANCIA_LINEA})")
+    args = parser.parse_args(argv)
+
+    fallos = 0
+    for entrada in args.entradas:
+        if procesar_duplicados(entrada, ruta_salida(entrada), args.radio, args.tolerancia_linea) is None:
+            fallos += 1
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Registro de las fases de Protopo.
+
+Cada fase sigue viviendo en su carpeta ('Fase N/...') como script
+independiente. Aquí se apunta dónde está cada una, qué función la ejecuta
+y cómo se llama su fichero de salida, para poder lanzarlas desde otras
+herramientas (proceso por lotes, caché...) sin copiar esas reglas.
+"""
+import importlib.util
+import os
+import sys
+from collections import namedtuple
+
+# Carpeta Protopo/ (la que contiene las carpetas 'Fase N')
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Fase = namedtuple('Fase', ['numero', 'script', 'funcion', 'sufijo', 'conserva_extension'])
+
+FASES = {
+    1: Fase(1, os.path.join('Fase 1', 'Entregable', 'procesar_topografia.py'), 'procesar_topografia', '_proc', False),
+    2: Fase(2, os.path.join('Fase 2', 'procesar_fase2.py'), 'procesar_fase2', '_fase2', False),
+    3: Fase(3, os.path.join('Fase 3', 'procesar_fase3.py'), 'procesar_fase3', '_fase3', False),
+    4: Fase(4, os.path.join('Fase 4', 'procesar_fase4.py'), 'procesar_fase4', '_fase4', False),
+    5: Fase(5, os.path.join('Fase 5', 'procesar_fase5.py'), 'procesar_fase5', '_fase5', False),
+    6: Fase(6, os.path.join('Fase 6', 'procesar_fase6.py'), 'procesar_fase6', '_00', False),
+    7: Fase(7, os.path.join('Fase 7', 'dist', 'procesar_fase7.py'), 'procesar_fase7', '_fase7', True),
+}
+
+# Fases que ordenan el fichero completo (admiten memoria_max_mb)
+FASES_CON_ORDEN = (5, 6, 7)
+
+
+def ruta_salida(numero, ruta_entrada):
+    """Nombre de salida que usa el exe de la fase al arrastrar 'ruta_entrada'."""
+    fase = FASES[numero]
+    folder = os.path.dirname(ruta_entrada)
+    nombre_base, ext = os.path.splitext(os.path.basename(ruta_entrada))
+    if not fase.conserva_extension or ext.lower() == '.ptp':
+        ext = '.txt' # La salida de un índice binario (.ptp) es texto
+    return os.path.join(folder, f"{nombre_base}{fase.sufijo}{ext}")
+
+
+def es_salida(numero, ruta):
+    """True si 'ruta' parece una salida de esa fase (para no reprocesarla)."""
+    nombre_base = os.path.splitext(os.path.basename(ruta))[0]
+    return nombre_base.endswith(FASES[numero].sufijo)
+
+
+def cargar(numero):
+    """Importa el script de la fase y retorna su función de proceso."""
+    return getattr(cargar_modulo(numero), FASES[numero].funcion)
+
+
+def version_reglas(numero):
+    """VERSION_REGLAS del script de la fase (0 si no la declara)."""
+    return getattr(cargar_modulo(numero), 'VERSION_REGLAS', 0)
+
+
+def cargar_modulo(numero):
+    """Importa (una sola vez) el script de la fase y retorna el módulo."""
+    fase = FASES[numero]
+    nombre_modulo = os.path.splitext(os.path.basename(fase.script))[0]
+
+    modulo = sys.modules.get(nombre_modulo)
+    if modulo is None:
+        spec = importlib.util.spec_from_file_location(nombre_modulo, os.path.join(RAIZ, fase.script))
+        modulo = importlib.util.module_from_spec(spec)
+        sys.modules[nombre_modulo] = modulo
+        try:
+            spec.loader.exec_module(modulo)
+        except Exception:
+            del sys.modules[nombre_modulo]
+            raise
+
+    return modulo
@@ -0,0 +1,227 @@
+"""
+Motor de procesado en flujo para las fases secuenciales (1 a 4).
+
+Esas fases solo miran el punto ANTERIOR y el SIGUIENTE para decidir cómo
+marcar el actual, así que no hace falta cargar el fichero entero: se lee,
+se marca y se escribe fila a fila con una ventana de tres filas.
+La memoria usada no depende del tamaño del fichero.
+
+Solo se toca el último campo (el código): cada fila se corta por su última
+coma y el resto se copia tal cual, sin separar ni volver a unir campos.
+
+También están aquí las utilidades de lectura a nivel de bytes (fichero
+proyectado en memoria con mmap) que usa la tabla por columnas.
+"""
+import codecs
+import mmap
+import os
+
+# Lo que str.strip() quita en ASCII (bytes.strip() no quita \x1c-\x1f)
+ESPACIOS = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+# Primeros bytes de un índice binario .ptp (ver protopo.indice)
+MAGIA_INDICE = b'PROTOPO\x00'
+
+
+class ErrorLectura(Exception):
+    """Fallo leyendo el fichero de entrada (para distinguirlo de la escritura)."""
+
+
+def leer_lineas(archivo_entrada, min_campos=1):
+    """
+    Generador de (linea_txt, corte) sin separar todos los campos.
+    'linea_txt' es la línea sin espacios en los extremos y 'corte' la
+    posición donde empieza el código (justo después de la última coma):
+        linea_txt[:corte] -> prefijo que se copia tal cual a la salida
+        linea_txt[corte:] -> código (último campo)
+    Se saltan las líneas vacías y las que tengan menos de 'min_campos'
+    campos (separados por comas).
+    Si 'archivo_entrada' es un índice .ptp, las líneas salen de él.
+    """
+    if es_indice(archivo_entrada):
+        from protopo.indice import Indice # Importa este módulo
+        yield from Indice(archivo_entrada).lineas(min_campos)
+        return
+
+    with open(archivo_entrada, 'r', encoding='utf-8') as f:
+        for raw_linea in f:
+            linea_txt = raw_linea.strip()
+            if not linea_txt: continue
+            if min_campos > 1 and linea_txt.count(',') < min_campos - 1: continue
+            yield linea_txt, linea_txt.rfind(',') + 1
+
+
+def es_indice(ruta):
+    """True si 'ruta' es un índice .ptp (por su contenido, no por el nombre)."""
+    try:
+        with open(ruta, 'rb') as f:
+            return f.read(len(MAGIA_INDICE)) == MAGIA_INDICE
+    except OSError:
+        return False
+
+
+def proyectar(archivo_entrada):
+    """
+    Proyecta el fichero en memoria (mmap de solo lectura). Un fichero vacío
+    da b'' (mmap no admite tamaño 0). El mmap se cierra con close() o al
+    dejar de usarse.
+    """
+    with open(archivo_entrada, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def validar_utf8(mapa, tam_bloque=1 << 20):
+    """Lanza UnicodeDecodeError si el contenido no es UTF-8 (como al leer en modo texto)."""
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    for inicio in range(0, len(mapa), tam_bloque):
+        bloque = mapa[inicio:inicio + tam_bloque]
+        if not bloque.isascii():
+            decodificador.decode(bloque)
+        elif decodificador.getstate()[0]:
+            decodificador.decode(bloque) # Carácter partido entre bloques
+    decodificador.decode(b'', final=True)
+
+
+def indice_lineas(mapa, min_campos=1):
+    """
+    Generador de (inicio, corte, fin) en bytes de cada fila de 'mapa':
+        mapa[inicio:corte] -> prefijo (hasta la última coma incluida)
+        mapa[corte:fin]    -> código
+    Mismas reglas que leer_lineas en modo texto (saltos LF, CRLF y CR,
+    espacios en los extremos, líneas vacías y 'min_campos').
+    """
+    n = len(mapa)
+    pos = 0
+    while pos < n:
+        fin = mapa.find(b'\n', pos)
+        if fin < 0:
+            fin = n
+        inicio, pos = pos, fin + 1
+
+        while fin > inicio and mapa[fin - 1] in ESPACIOS:
+            fin -= 1
+        while inicio < fin and mapa[inicio] in ESPACIOS:
+            inicio += 1
+        if inicio == fin:
+            continue
+
+        if mapa.find(b'\r', inicio, fin) >= 0 or mapa[inicio] >= 0x80 or mapa[fin - 1] >= 0x80:
+            # Raro: \r suelto (salto de línea en modo texto) o espacios no ASCII
+            yield from _indice_texto(mapa, inicio, fin, min_campos)
+            continue
+
+        corte = mapa.rfind(b',', inicio, fin) + 1
+        if min_campos > 1 and (not corte or mapa[inicio:fin].count(b',') < min_campos - 1):
+            continue
+        yield inicio, corte or inicio, fin
+
+
+def _indice_texto(mapa, inicio, fin, min_campos):
+    """indice_lineas para un trozo con reglas de texto (decodifica y usa str.strip)."""
+    texto = mapa[inicio:fin].decode('utf-8')
+    desplazamiento = inicio
+    for trozo in texto.split('\r'):
+        limpio = trozo.strip()
+        if limpio and not (min_campos > 1 and limpio.count(',') < min_campos - 1):
+            ini = desplazamiento + len(trozo[:len(trozo) - len(trozo.lstrip())].encode('utf-8'))
+            fin_limpio = ini + len(limpio.encode('utf-8'))
+            corte = limpio.rfind(',') + 1
+            yield ini, ini + len(limpio[:corte].encode('utf-8')), fin_limpio
+        desplazamiento += len(trozo.encode('utf-8')) + 1
+
+
+def num_punto(linea_txt, campo_punto):
+    """Número de punto de la columna 'campo_punto' (0 si no es numérico)."""
+    try:
+        return float(linea_txt.split(',', campo_punto + 1)[campo_punto])
+    except (ValueError, IndexError):
+        return 0
+
+
+def escribir_lineas(archivo_salida, lineas, filas_por_bloque=8192):
+    """
+    Escribe un iterable de líneas (sin salto) agrupando las escrituras.
+    Retorna el número de líneas escritas.
+    """
+    total = 0
+    with open(archivo_salida, 'w', encoding='utf-8') as f_out:
+        bloque = []
+        for linea in lineas:
+            bloque.append(linea)
+            if len(bloque) >= filas_por_bloque:
+                f_out.write('\n'.join(bloque) + '\n')
+                total += len(bloque)
+                bloque.clear()
+        if bloque:
+            f_out.write('\n'.join(bloque) + '\n')
+            total += len(bloque)
+    return total
+
+
+def ventana_triple(filas):
+    """
+    Recorre 'filas' devolviendo (anterior, actual, siguiente).
+    En los extremos del fichero anterior/siguiente valen None.
+    """
+    filas = iter(filas)
+    actual = next(filas, None)
+    if actual is None:
+        return
+
+    anterior = None
+    for siguiente in filas:
+        yield anterior, actual, siguiente
+        anterior, actual = actual, siguiente
+    yield anterior, actual, None
+
+
+def procesar_en_flujo(archivo_entrada, archivo_salida, marcar):
+    """
+    Lee, marca y escribe en una sola pasada.
+
+    'marcar(codigo_anterior, codigo_actual, codigo_siguiente)' recibe el
+    último campo de cada fila de la ventana (None en los extremos) y
+    devuelve el nuevo código para la fila actual.
+
+    Retorna el número de filas escritas. Si la entrada no tiene filas
+    retorna 0 y NO crea el fichero de salida.
+    Si falla a mitad, borra la salida parcial y relanza la excepción.
+    """
+    ventanas = ventana_triple(filas_con_codigo(archivo_entrada))
+
+    # Leemos la primera ventana antes de abrir la salida (fichero vacío -> nada)
+    primera = next(ventanas, None)
+    if primera is None:
+        return 0
+
+    # Cada fila es (prefijo, código): el prefijo se copia sin separar campos
+    def lineas_salida():
+        for anterior, (prefijo, codigo), siguiente in _encadenar(primera, ventanas):
+            codigo_anterior = anterior[1] if anterior is not None else None
+            codigo_siguiente = siguiente[1] if siguiente is not None else None
+            yield prefijo + marcar(codigo_anterior, codigo, codigo_siguiente)
+
+    try:
+        total = escribir_lineas(archivo_salida, lineas_salida())
+    except Exception:
+        if os.path.exists(archivo_salida):
+            os.remove(archivo_salida)
+        raise
+
+    return total
+
+
+def filas_con_codigo(archivo_entrada):
+    """(prefijo, código) de cada fila; los fallos de lectura como ErrorLectura."""
+    try:
+        for linea_txt, corte in leer_lineas(archivo_entrada):
+            yield linea_txt[:corte], linea_txt[corte:]
+    except (OSError, UnicodeDecodeError) as e:
+        raise ErrorLectura(e) from e
+
+
+def _encadenar(primero, resto):
+    yield primero
+    yield from resto
@@ -0,0 +1,233 @@
+"""
+Modo incremental de la fase 7 para ficheros que crecen durante el día.
+
+La salida de la fase 7 es una serie de tramos: una línea (tipo, contador)
+del Grupo B, o todos los puntos sueltos del Grupo A con la misma clave de
+tipo. Dentro de cada tramo las filas van en orden de lectura, así que si
+el fichero solo crece por el final, cada fila nueva va al FINAL de su tramo
+(o abre un tramo nuevo) y lo ya escrito no cambia.
+
+Junto a la salida se guarda un fichero de estado ('<salida>.estado.json')
+con los bytes de entrada ya procesados, los tipos/contadores vistos y la
+posición de cada tramo en la salida. En la siguiente pasada solo se leen y
+clasifican los bytes añadidos; la salida se rehace copiando tal cual los
+bytes de los tramos sin cambios e intercalando las filas nuevas.
+
+Una última línea sin salto se deja para la siguiente pasada (puede estar a
+medio escribir), salvo en la primera pasada o si el fichero no ha crecido
+desde la anterior. Si luego resulta que esa línea seguía (lo añadido no
+empieza por un salto), se reprocesa todo.
+
+Si la entrada no es continuación de la anterior (se editó, se truncó) o la
+salida se tocó a mano, se reprocesa todo desde cero.
+"""
+import hashlib
+import io
+import json
+import os
+
+from protopo.codigos import Codigo
+from protopo.orden import rango_fase7, rangos_fase7
+
+FORMATO_ESTADO = 1
+
+# Bytes del final de lo procesado que se comparan para detectar ediciones
+BYTES_COLA = 64 * 1024
+
+# Bytes por lectura al copiar tramos de la salida anterior
+TAM_COPIA = 1 << 20
+
+
+def ruta_estado(archivo_salida):
+    return archivo_salida + '.estado.json'
+
+
+def _hash_cola(ruta, fin):
+    """SHA-256 de los últimos BYTES_COLA bytes antes de 'fin'."""
+    inicio = max(0, fin - BYTES_COLA)
+    with open(ruta, 'rb') as f:
+        f.seek(inicio)
+        return hashlib.sha256(f.read(fin - inicio)).hexdigest()
+
+
+def _firma_salida(ruta):
+    st = os.stat(ruta)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def cargar_estado(archivo_entrada, archivo_salida, version_reglas):
+    """
+    Estado de la pasada anterior, o None si no sirve (no existe, otra
+    versión de reglas, entrada editada o salida modificada).
+    """
+    try:
+        with open(ruta_estado(archivo_salida), 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+        if estado.get('formato') != FORMATO_ESTADO or estado.get('version_reglas') != version_reglas:
+            return None
+        procesado = estado['entrada']['bytes']
+        if os.path.getsize(archivo_entrada) < procesado:
+            return None
+        if _hash_cola(archivo_entrada, procesado) != estado['entrada']['hash_cola']:
+            return None
+        if estado['entrada'].get('sin_salto') and not _sigue_con_salto(archivo_entrada, procesado):
+            return None
+        if estado['tramos'] and _firma_salida(archivo_salida) != estado['salida']:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return estado
+
+
+def _sigue_con_salto(ruta, desde):
+    """True si lo que hay a partir de 'desde' empieza por un salto de línea (o no hay nada)."""
+    with open(ruta, 'rb') as f:
+        f.seek(desde)
+        return f.read(1) in (b'', b'\n', b'\r')
+
+
+def leer_nuevas(archivo_entrada, desde, con_cola=False):
+    """
+    Lee las líneas a partir del byte 'desde' (saltos '\n', '\r\n' o '\r').
+    Retorna ([(linea_txt, corte), ...], byte_fin, bytes_leidos, sin_salto).
+    La última línea sin salto (quizá a medio escribir) se deja para la
+    siguiente pasada salvo con 'con_cola'; 'sin_salto' dice si se leyó.
+    """
+    with open(archivo_entrada, 'rb') as f:
+        f.seek(desde)
+        datos = f.read()
+    leidos = len(datos)
+    fin_util = max(datos.rfind(b'\n'), datos.rfind(b'\r')) + 1
+    sin_salto = con_cola and fin_util < leidos
+    if not sin_salto:
+        datos = datos[:fin_util]
+
+    # Mismas reglas de lectura que leer_lineas (modo texto, strip, sin vacías)
+    lineas = []
+    for raw_linea in io.TextIOWrapper(io.BytesIO(datos), encoding='utf-8'):
+        linea_txt = raw_linea.strip()
+        if not linea_txt: continue
+        lineas.append((linea_txt, linea_txt.rfind(',') + 1))
+    return lineas, desde + len(datos), desde + leidos, sin_salto
+
+
+def procesar_incremental(archivo_entrada, archivo_salida, parsear, clave_tipo, clave_contador,
+                         codigo_salida, version_reglas=0):
+    """
+    Fase 7 incremental.
+    'codigo_salida(info, codigo_raw, es_inicio)' da el código que se escribe.
+    Retorna (filas_totales, filas_nuevas). Si no hay filas, (0, 0) y no se
+    crea la salida.
+    """
+    estado = cargar_estado(archivo_entrada, archivo_salida, version_reglas)
+    # La cola sin salto se lee en la primera pasada o si el fichero no ha crecido
+    con_cola = estado is None or os.path.getsize(archivo_entrada) == estado['entrada'].get('tamano')
+    if estado is None:
+        estado = {'entrada': {'bytes': 0}, 'codigos': [], 'tramos': []}
+
+    lineas, fin, tamano, sin_salto = leer_nuevas(archivo_entrada, estado['entrada']['bytes'], con_cola)
+    if fin == estado['entrada']['bytes']:
+        sin_salto = estado['entrada'].get('sin_salto', False) # Nada leído: lo procesado acaba igual
+    entrada = {'bytes': fin, 'tamano': tamano, 'sin_salto': sin_salto}
+
+    # Tipos/contadores vistos, en orden de primera aparición
+    codigos = [Codigo(tipo, contador, False, ()) for tipo, contador in estado['codigos']]
+    vistos = {(c.tipo, c.contador) for c in codigos}
+
+    # Clasificación de las filas nuevas por tramo
+    tramos_previos = {_id_tramo(t): t for t in estado['tramos']}
+    nuevas = {}
+    for fila, (linea_txt, corte) in enumerate(lineas):
+        codigo = linea_txt[corte:]
+        info = parsear(codigo)
+        if (info.tipo, info.contador) not in vistos:
+            vistos.add((info.tipo, info.contador))
+            codigos.append(Codigo(info.tipo, info.contador, False, ()))
+        id_tramo = ('L', info.tipo, info.contador) if info.contador is not None else ('A', info.tipo)
+        nuevas.setdefault(id_tramo, []).append((fila, linea_txt[:corte], codigo, info))
+
+    total_previo = sum(t[-1] for t in estado['tramos'])
+    n_nuevas = sum(len(filas) for filas in nuevas.values())
+
+    if not n_nuevas:
+        if total_previo:
+            _guardar_estado(archivo_entrada, archivo_salida, version_reglas, entrada, codigos, estado['tramos'])
+        return total_previo, 0
+
+    # Orden de los tramos con todos los códigos (los nuevos pueden ir en medio)
+    rango_linea, rango_suelto = rangos_fase7(codigos, clave_tipo, clave_contador)
+
+    # Los puntos sueltos con la misma clave de tipo comparten tramo
+    por_rango = {}
+    for id_tramo in {**tramos_previos, **nuevas}:
+        cod = Codigo(id_tramo[1], id_tramo[2] if id_tramo[0] == 'L' else None, False, ())
+        rango = rango_fase7(cod, rango_linea, rango_suelto)
+        por_rango.setdefault(rango, []).append(id_tramo)
+
+    temporal = f"{archivo_salida}.{os.getpid()}.tmp"
+    tramos = []
+    try:
+        anterior = open(archivo_salida, 'rb') if tramos_previos else None
+        try:
+            with open(temporal, 'wb') as f_out:
+                for rango in sorted(por_rango):
+                    ids = por_rango[rango]
+                    previo = next((tramos_previos[i] for i in ids if i in tramos_previos), None)
+                    inicio = f_out.tell()
+                    filas = 0
+                    if previo is not None:
+                        _copiar(anterior, f_out, previo[-3], previo[-2])
+                        filas = previo[-1]
+
+                    # Filas nuevas de este tramo, en orden de lectura
+                    nuevas_tramo = sorted(fila for i in ids for fila in nuevas.get(i, ()))
+                    bloque = []
+                    for _, prefijo, codigo, info in nuevas_tramo:
+                        bloque.append(prefijo + codigo_salida(info, codigo, filas == 0) + os.linesep)
+                        filas += 1
+                    f_out.write(''.join(bloque).encode('utf-8'))
+
+                    representante = previo[:-3] if previo is not None else list(ids[0])
+                    tramos.append(representante + [inicio, f_out.tell() - inicio, filas])
+        finally:
+            if anterior is not None:
+                anterior.close()
+        os.replace(temporal, archivo_salida)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    _guardar_estado(archivo_entrada, archivo_salida, version_reglas, entrada, codigos, tramos)
+    return total_previo + n_nuevas, n_nuevas
+
+
+def _id_tramo(tramo):
+    """Identificador de un tramo guardado: ('L', tipo, contador) o ('A', tipo)."""
+    return tuple(tramo[:-3])
+
+
+def _copiar(origen, destino, inicio, longitud):
+    origen.seek(inicio)
+    while longitud > 0:
+        bloque = origen.read(min(TAM_COPIA, longitud))
+        if not bloque:
+            raise OSError("La salida anterior es más corta de lo esperado")
+        destino.write(bloque)
+        longitud -= len(bloque)
+
+
+def _guardar_estado(archivo_entrada, archivo_salida, version_reglas, entrada, codigos, tramos):
+    """'entrada': {'bytes' procesados, 'tamano' visto, 'sin_salto' si lo procesado acaba sin salto}."""
+    estado = {
+        'formato': FORMATO_ESTADO,
+        'version_reglas': version_reglas,
+        'entrada': {**entrada, 'hash_cola': _hash_cola(archivo_entrada, entrada['bytes'])},
+        'salida': _firma_salida(archivo_salida),
+        'codigos': [[c.tipo, c.contador] for c in codigos],
+        'tramos': tramos,
+    }
+    temporal = ruta_estado(archivo_salida) + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(temporal, ruta_estado(archivo_salida))
@@ -0,0 +1,246 @@
+"""
+Índice binario de un fichero de campo ('.ptp') para procesarlo varias veces
+sin volver a leer y separar el texto.
+
+Cuando del mismo fichero se sacan varias salidas (la limpia de la fase 4, el
+'_00' de la fase 6, la de la fase 7...) cada fase vuelve a partir el texto en
+líneas, campos y códigos. El índice lo hace una sola vez y guarda:
+- las posiciones en bytes de cada fila en el TEXTO original (inicio de la
+  fila e inicio del código): el texto no se copia, se sigue leyendo de él;
+- la tabla de códigos distintos y, por fila, el índice de su código;
+- el número de punto de los campos 0 y 1 (los que usan las fases 5 y 6).
+
+Todas las fases aceptan el '.ptp' como entrada en lugar del texto: las que
+van por columnas (NumPy) proyectan el índice y el texto en memoria (mmap)
+sin separar nada; el resto recibe las mismas líneas que leerían del texto.
+Si el texto cambia después de crear el índice, el índice deja de valer y
+hay que volver a crearlo (se avisa con un error de lectura).
+
+Formato: MAGIA, longitud (uint32) y cabecera JSON, y las columnas en binario
+(little-endian, alineadas a 8 bytes) en las posiciones que da la cabecera.
+
+Uso:
+    python -m protopo.indice campo.txt [otro.txt ...]    -> campo.ptp
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+from array import array
+
+from protopo.cache import hash_fichero
+from protopo.flujo import MAGIA_INDICE, ErrorLectura, indice_lineas, num_punto, proyectar, validar_utf8
+
+FORMATO = 1
+EXTENSION = '.ptp'
+
+# Columnas de número de punto que se guardan (fase 5 usa el 1, fase 6 el 0)
+CAMPOS_PUNTO = (0, 1)
+
+# Tipo de cada columna: código de 'array' y de NumPy
+TIPOS = {'inicio': ('q', '<i8'), 'corte': ('q', '<i8'), 'id_codigo': ('i', '<i4'), 'num': ('d', '<f8')}
+
+_CABECERA = struct.Struct('<8sI')
+
+
+class ErrorIndice(ErrorLectura):
+    """Índice que no se puede usar (formato desconocido o texto modificado)."""
+
+
+def ruta_indice(ruta_texto):
+    """Nombre del índice de un fichero: mismo nombre con extensión .ptp."""
+    return os.path.splitext(ruta_texto)[0] + EXTENSION
+
+
+def crear(ruta_texto, ruta=None):
+    """
+    Crea el índice de 'ruta_texto' (por defecto junto a él, ver ruta_indice).
+    Retorna (ruta del índice, número de filas).
+    """
+    ruta = ruta or ruta_indice(ruta_texto)
+    mapa = proyectar(ruta_texto)
+    try:
+        validar_utf8(mapa)
+        inicio, corte, nums, id_codigo, codigos = _columnas(mapa)
+    finally:
+        if len(mapa):
+            mapa.close()
+
+    st = os.stat(ruta_texto)
+    cabecera = {
+        'formato': FORMATO,
+        'texto': os.path.relpath(os.path.abspath(ruta_texto), os.path.dirname(os.path.abspath(ruta))),
+        'tamano': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': hash_fichero(ruta_texto),
+        'filas': len(inicio),
+        'codigos': codigos,
+        'columnas': {},
+    }
+    columnas = [('inicio', inicio), ('corte', corte), ('id_codigo', id_codigo)]
+    columnas += [(f'num{campo}', nums[campo]) for campo in CAMPOS_PUNTO]
+
+    # La cabecera lleva las posiciones de las columnas, que dependen de su
+    # propio tamaño: se reserva sitio de sobra y se rellena con espacios
+    datos = [col.tobytes() for _, col in columnas]
+    reserva = len(json.dumps(cabecera, ensure_ascii=False).encode('utf-8')) + 64 * len(columnas) + 64
+    posicion = _alinear(_CABECERA.size + reserva)
+    for (nombre, _), bloque in zip(columnas, datos):
+        cabecera['columnas'][nombre] = [posicion, len(bloque)]
+        posicion = _alinear(posicion + len(bloque))
+    texto_cabecera = json.dumps(cabecera, ensure_ascii=False).encode('utf-8').ljust(reserva)
+
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(_CABECERA.pack(MAGIA_INDICE, reserva))
+            f.write(texto_cabecera)
+            for nombre, bloque in zip(cabecera['columnas'], datos):
+                f.write(b'\0' * (cabecera['columnas'][nombre][0] - f.tell()))
+                f.write(bloque)
+        os.replace(temporal, ruta)
+    except Exception:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return ruta, len(inicio)
+
+
+def _alinear(posicion):
+    return (posicion + 7) & ~7
+
+
+def _columnas(mapa):
+    """(inicio, corte, {campo: num}, id_codigo, códigos) de las filas del texto."""
+    from protopo import columnar
+    if columnar.HAY_NUMPY:
+        np = columnar.np
+        inicio, corte, fin = columnar.indice_mapa(mapa)
+        nums = {campo: columnar._numeros(mapa, inicio, fin, campo) for campo in CAMPOS_PUNTO}
+        inicio = inicio.astype('<i8')
+        corte = corte.astype('<i8')
+        cortes, fines = corte.tolist(), fin.tolist()
+    else:
+        np = None
+        inicio, corte, fines = array('q'), array('q'), []
+        for ini, cor, f in indice_lineas(mapa):
+            inicio.append(ini)
+            corte.append(cor)
+            fines.append(f)
+        cortes = corte
+        nums = {campo: array('d') for campo in CAMPOS_PUNTO}
+        for ini, f in zip(inicio, fines):
+            linea = mapa[ini:f].decode('utf-8')
+            for campo in CAMPOS_PUNTO:
+                nums[campo].append(num_punto(linea, campo))
+
+    # Códigos distintos en orden de primera aparición
+    ids = {}
+    id_codigo = array('i')
+    for c, f in zip(cortes, fines):
+        codigo = mapa[c:f]
+        idx = ids.get(codigo)
+        if idx is None:
+            idx = ids[codigo] = len(ids)
+        id_codigo.append(idx)
+    codigos = [codigo.decode('utf-8') for codigo in ids]
+
+    if np is not None:
+        id_codigo = np.frombuffer(id_codigo, dtype=np.int32)
+    return inicio, corte, nums, id_codigo, codigos
+
+
+class Indice:
+    """
+    Índice abierto. 'mapa' es el texto original proyectado en memoria; las
+    columnas son arrays de NumPy (vistas del .ptp, sin copiar) o, sin NumPy,
+    de 'array'.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, 'rb') as f:
+            magia, largo = _CABECERA.unpack(f.read(_CABECERA.size))
+            if magia != MAGIA_INDICE:
+                raise ErrorIndice(f"{ruta} no es un índice de Protopo")
+            cabecera = json.loads(f.read(largo).decode('utf-8'))
+        if cabecera.get('formato') != FORMATO:
+            raise ErrorIndice(f"{ruta}: formato de índice {cabecera.get('formato')} no soportado")
+
+        self.texto = os.path.join(os.path.dirname(os.path.abspath(ruta)), cabecera['texto'])
+        _comprobar_texto(self.texto, cabecera)
+        self.filas = cabecera['filas']
+        self.codigos = cabecera['codigos']
+
+        from protopo import columnar # columnar importa este módulo
+        np = columnar.np if columnar.HAY_NUMPY else None
+
+        self.mapa = proyectar(self.texto)
+        binario = proyectar(ruta)
+        self.columnas = {}
+        for nombre, (posicion, largo) in cabecera['columnas'].items():
+            codigo_array, tipo_numpy = TIPOS['num' if nombre.startswith('num') else nombre]
+            if np is not None:
+                # Vista del .ptp proyectado: no se copia ni se convierte nada
+                columna = np.frombuffer(binario, dtype=tipo_numpy, count=self.filas, offset=posicion)
+            else:
+                columna = array(codigo_array)
+                columna.frombytes(binario[posicion:posicion + largo])
+            self.columnas[nombre] = columna
+
+    def __len__(self):
+        return self.filas
+
+    def num(self, campo_punto):
+        """Número de punto del campo 'campo_punto' (0 o 1) de cada fila."""
+        if campo_punto not in CAMPOS_PUNTO:
+            raise ErrorIndice(f"El índice solo guarda el número de punto de los campos {CAMPOS_PUNTO}")
+        return self.columnas[f'num{campo_punto}']
+
+    def lineas(self, min_campos=1):
+        """Mismas (linea_txt, corte) que flujo.leer_lineas sobre el texto."""
+        mapa, codigos = self.mapa, self.codigos
+        columnas = self.columnas
+        inicio, corte, id_codigo = columnas['inicio'], columnas['corte'], columnas['id_codigo']
+        if not isinstance(inicio, array):
+            inicio, corte, id_codigo = inicio.tolist(), corte.tolist(), id_codigo.tolist()
+        for ini, cor, idx in zip(inicio, corte, id_codigo):
+            prefijo = mapa[ini:cor].decode('utf-8')
+            if min_campos > 1 and prefijo.count(',') < min_campos - 1: continue
+            yield prefijo + codigos[idx], len(prefijo)
+
+
+def _comprobar_texto(ruta_texto, cabecera):
+    """Lanza ErrorIndice si el texto no es el mismo que se indexó."""
+    try:
+        st = os.stat(ruta_texto)
+    except OSError:
+        raise ErrorIndice(f"No se encuentra el texto del índice: {ruta_texto}")
+    if st.st_size != cabecera['tamano']:
+        raise ErrorIndice(f"{ruta_texto} ha cambiado desde que se creó el índice; vuelve a crearlo")
+    # Misma fecha: sin cambios. Si no, se confirma por contenido (p.ej. copiado)
+    if st.st_mtime_ns != cabecera['mtime_ns'] and hash_fichero(ruta_texto) != cabecera['sha256']:
+        raise ErrorIndice(f"{ruta_texto} ha cambiado desde que se creó el índice; vuelve a crearlo")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crea el índice binario (.ptp) de ficheros de campo.")
+    parser.add_argument('entradas', nargs='+', help="Ficheros de texto")
+    args = parser.parse_args(argv)
+
+    fallos = 0
+    for entrada in args.entradas:
+        try:
+            ruta, filas = crear(entrada)
+        except (OSError, ValueError, ErrorLectura) as e:
+            # Un fichero que no se puede indexar cuenta como fallo; se sigue con los demás
+            print(f"Error lectura: {entrada}: {e}")
+            fallos += 1
+            continue
+        print(f"Índice creado: {ruta} ({filas} filas)")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Lanzador ligero de las fases: pasa el fichero al servidor residente
+(protopo.servidor) y muestra el resultado. Si no hay servidor abierto,
+ejecuta la fase aquí mismo, igual que el exe.
+
+Solo importa lo mínimo para hablar con el servidor: el código de las fases
+(y NumPy) se carga únicamente si hay que ejecutar aquí.
+
+Uso (se le puede arrastrar el fichero a un acceso directo):
+    python -m protopo.lanzador --fase 7 fichero.txt [otro.txt ...]
+
+Sin --fase, la fase sale del nombre del programa: una copia del exe del
+lanzador llamada 'lanzador_fase7.exe' hace la fase 7 al arrastrarle ficheros.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+# Paquete común 'protopo' (carpeta Protopo/), también si se ejecuta como script o exe
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from protopo import fases, servidor
+
+
+def procesar(fase, entrada):
+    """Procesa un fichero (en el servidor si está abierto). Retorna la respuesta (dict)."""
+    entrada = os.path.abspath(entrada)
+    salida = fases.ruta_salida(fase, entrada)
+    entorno = {nombre: os.environ[nombre] for nombre in servidor.VARIABLES if os.environ.get(nombre)}
+
+    respuesta = servidor.enviar({'orden': 'fase', 'fase': fase, 'entrada': entrada, 'salida': salida,
+                                 'entorno': entorno})
+    if respuesta is None:
+        respuesta = servidor.ejecutar(fase, entrada, salida, entorno)
+        respuesta['en_servidor'] = False
+    else:
+        respuesta['en_servidor'] = True
+    return respuesta
+
+
+def fase_del_nombre(programa):
+    """Número de fase en el nombre del programa ('lanzador_fase7.exe' -> 7), o None."""
+    encontrado = re.search(r'fase(\d)', os.path.basename(programa).lower())
+    return int(encontrado.group(1)) if encontrado else None
+
+
+def main(argv=None):
+    inicio = time.perf_counter()
+    parser = argparse.ArgumentParser(description="Ejecuta una fase (en el servidor residente si está abierto).")
+    parser.add_argument('--fase', type=int, default=fase_del_nombre(sys.argv[0]), choices=sorted(fases.FASES),
+                        help="Fase a ejecutar (por defecto, la del nombre del programa: lanzador_fase7.exe)")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) de entrada")
+    args = parser.parse_args(argv)
+    if args.fase is None:
+        parser.error("Falta --fase (o un nombre de programa como lanzador_fase7.exe)")
+
+    fallos = 0
+    en_servidor = False
+    for entrada in args.entradas:
+        if not os.path.exists(entrada):
+            print(f"No se encuentra el archivo de entrada: {entrada}")
+            fallos += 1
+            continue
+        respuesta = procesar(args.fase, entrada)
+        en_servidor = respuesta['en_servidor']
+        # Los mensajes de la fase, sin sus pausas (se hace una al final si hubo fallos)
+        for linea in respuesta['mensajes'].splitlines():
+            if not linea.startswith("Presiona"):
+                print(linea)
+        if respuesta['error']:
+            if respuesta['error'] not in respuesta['mensajes']:
+                print(respuesta['error'])
+            fallos += 1
+
+    print(f"({'servidor' if en_servidor else 'sin servidor'}, {time.perf_counter() - inicio:.2f} s)")
+    if fallos and sys.stdin is not None and sys.stdin.isatty():
+        input("Presiona Intro para salir...")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
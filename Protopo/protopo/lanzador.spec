@@ -0,0 +1,55 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Lanzador ligero (sin NumPy): copiar el exe como lanzador_fase1.exe ...
+# lanzador_fase7.exe para arrastrar ficheros sobre cada uno.
+import os
+
+RAIZ = os.path.join(SPECPATH, '..')
+
+# Los scripts de las fases van como datos: sin servidor se cargan desde ahí
+SCRIPTS = [
+    os.path.join('Fase 1', 'Entregable', 'procesar_topografia.py'),
+    os.path.join('Fase 2', 'procesar_fase2.py'),
+    os.path.join('Fase 3', 'procesar_fase3.py'),
+    os.path.join('Fase 4', 'procesar_fase4.py'),
+    os.path.join('Fase 5', 'procesar_fase5.py'),
+    os.path.join('Fase 6', 'procesar_fase6.py'),
+    os.path.join('Fase 7', 'dist', 'procesar_fase7.py'),
+]
+
+a = Analysis(
+    ['lanzador.py'],
+    pathex=[RAIZ],  # paquete comun 'protopo'
+    binaries=[],
+    datas=[(os.path.join(RAIZ, s), os.path.dirname(s)) for s in SCRIPTS],
+    hiddenimports=['protopo.cache', 'protopo.codigos', 'protopo.columnar', 'protopo.flujo',
+                   'protopo.incremental', 'protopo.indice', 'protopo.lote', 'protopo.orden',
+                   'protopo.orden_externo', 'protopo.perfil'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=['numpy'],
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    a.binaries,
+    a.datas,
+    [],
+    name='lanzador',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    runtime_tmpdir=None,
+    console=True,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
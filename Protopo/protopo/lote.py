@@ -0,0 +1,208 @@
+"""
+Proceso por lotes: aplica una fase a todos los ficheros de una carpeta.
+
+En vez de arrastrar los ficheros uno a uno sobre el exe, se recorre el
+árbol de carpetas y se reparten los ficheros entre varios procesos
+(ProcessPoolExecutor). Cada salida se escribe junto a su entrada con el
+mismo nombre que pondría el exe ('_proc', '_faseN', '_00'...).
+
+Uso:
+    python -m protopo.lote CARPETA --fase 5 [--trabajadores 4] [--patron "*.txt"] [--cache]
+
+Con --cache (fases 5-7) los ficheros que no han cambiado desde la última
+pasada se copian de la caché de resultados en vez de reprocesarse.
+"""
+import argparse
+import contextlib
+import fnmatch
+import io
+import os
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from protopo import fases
+from protopo.cache import MAX_MB_POR_DEFECTO, CacheResultados, procesar_con_cache
+
+Resultado = namedtuple('Resultado', ['entrada', 'salida', 'filas', 'segundos', 'error', 'desde_cache', 'mensajes'],
+                       defaults=[False, ''])
+
+
+def buscar_ficheros(carpeta, fase, patron='*.txt'):
+    """Ficheros de 'carpeta' (y subcarpetas) que casan con 'patron', sin las salidas de la fase."""
+    encontrados = []
+    for root, dirs, files in os.walk(carpeta):
+        dirs.sort()
+        for nombre in sorted(files):
+            if not fnmatch.fnmatch(nombre.lower(), patron.lower()):
+                continue
+            ruta = os.path.join(root, nombre)
+            if fases.es_salida(fase, ruta):
+                continue
+            encontrados.append(ruta)
+    return encontrados
+
+
+def procesar_archivo(fase, entrada, salida, opciones=None, cache=None):
+    """
+    Ejecuta la fase sobre un fichero y retorna un Resultado.
+    Los mensajes de la fase se capturan (Resultado.mensajes); si falla, el
+    último es el error.
+    'cache' son los argumentos de CacheResultados (carpeta, max_mb, enlazar)
+    o None para no usar la caché. Aquí no se poda: lo hace procesar_lote al final.
+    """
+    funcion = fases.cargar(fase)
+    if cache is not None:
+        cache = CacheResultados(*cache)
+    mensajes = io.StringIO()
+    inicio = time.perf_counter()
+    try:
+        # Sin consola: los input() de las fases fallan en vez de esperar
+        with contextlib.redirect_stdout(mensajes), open(os.devnull) as sin_entrada:
+            stdin_original = sys.stdin
+            sys.stdin = sin_entrada
+            try:
+                if cache is None:
+                    filas = funcion(entrada, salida, **(opciones or {}))
+                else:
+                    filas = procesar_con_cache(cache, fase, fases.version_reglas(fase), funcion,
+                                               entrada, salida, podar=False, **(opciones or {}))
+            finally:
+                sys.stdin = stdin_original
+    except Exception as e:
+        filas = None
+        fallo = f"{type(e).__name__}: {e}"
+    else:
+        fallo = "Sin salida"
+
+    segundos = time.perf_counter() - inicio
+    if filas is None:
+        # El mensaje de la fase ('Error al leer: ...') explica mejor el fallo.
+        # La primera línea es siempre el 'Leyendo...' y se ignoran las pausas.
+        lineas = [l for l in mensajes.getvalue().strip().splitlines()[1:] if not l.startswith("Presiona")]
+        return Resultado(entrada, salida, None, segundos, lineas[-1] if lineas else fallo,
+                         mensajes=mensajes.getvalue())
+    desde_cache = mensajes.getvalue().startswith("Sin cambios")
+    return Resultado(entrada, salida, filas, segundos, None, desde_cache, mensajes.getvalue())
+
+
+def procesar_lote(carpeta, fase, trabajadores=None, patron='*.txt', opciones=None, cache=None):
+    """
+    Procesa todos los ficheros de 'carpeta' con la fase indicada.
+    'trabajadores' es el número de procesos (por defecto, uno por núcleo).
+    'cache' como en procesar_archivo.
+    Retorna la lista de Resultado en el orden de los ficheros.
+    """
+    entradas = buscar_ficheros(carpeta, fase, patron)
+    if not entradas:
+        return []
+
+    resultados = {}
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        futuros = {
+            pool.submit(procesar_archivo, fase, entrada, fases.ruta_salida(fase, entrada), opciones, cache): entrada
+            for entrada in entradas
+        }
+        for futuro in as_completed(futuros):
+            entrada = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e: # El proceso hijo murió
+                resultado = Resultado(entrada, fases.ruta_salida(fase, entrada), None, 0.0, f"{type(e).__name__}: {e}")
+            resultados[entrada] = resultado
+            estado = "ERROR" if resultado.error is not None else "CACHÉ" if resultado.desde_cache else "OK"
+            print(f"[{len(resultados)}/{len(entradas)}] {estado} {os.path.relpath(entrada, carpeta)}")
+
+    # Una sola poda para todo el lote (cada una recorre la carpeta de la caché)
+    if cache is not None:
+        CacheResultados(*cache).podar()
+    return [resultados[e] for e in entradas]
+
+
+def imprimir_resumen(resultados, carpeta, segundos_totales):
+    """Resumen final: filas/s por fichero y lista de fallos."""
+    correctos = [r for r in resultados if r.error is None]
+    fallos = [r for r in resultados if r.error is not None]
+
+    print()
+    print("RESUMEN")
+    print("-------")
+    for r in correctos:
+        velocidad = r.filas / r.segundos if r.segundos > 0 else float('inf')
+        origen = " (caché)" if r.desde_cache else ""
+        print(f"{os.path.relpath(r.entrada, carpeta)}: {r.filas} filas, {r.segundos:.2f} s, {velocidad:,.0f} filas/s{origen}")
+
+    filas_totales = sum(r.filas for r in correctos)
+    print()
+    print(f"{len(correctos)} ficheros correctos, {filas_totales} filas en {segundos_totales:.2f} s "
+          f"({filas_totales / segundos_totales if segundos_totales > 0 else 0:,.0f} filas/s en total)")
+    de_cache = sum(1 for r in correctos if r.desde_cache)
+    if de_cache:
+        print(f"{de_cache} de ellos sin cambios (copiados desde la caché)")
+
+    if fallos:
+        print()
+        print(f"{len(fallos)} FALLOS:")
+        for r in fallos:
+            print(f"  {os.path.relpath(r.entrada, carpeta)}: {r.error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa con una fase todos los ficheros de una carpeta.")
+    parser.add_argument('carpeta', help="Carpeta con los ficheros de campo (se recorren las subcarpetas)")
+    parser.add_argument('--fase', type=int, required=True, choices=sorted(fases.FASES), help="Fase a aplicar (1-7)")
+    parser.add_argument('--trabajadores', type=int, default=None, help="Procesos en paralelo (por defecto, uno por núcleo)")
+    parser.add_argument('--patron', default='*.txt', help="Patrón de nombre de fichero (por defecto '*.txt')")
+    parser.add_argument('--memoria-mb', type=float, default=None,
+                        help="Fases 5-7: ordenar fuera de memoria con este presupuesto por fichero")
+    parser.add_argument('--cache', nargs='?', const='', default=None, metavar='CARPETA',
+                        help="Fases 5-7: reutilizar resultados de ficheros sin cambios "
+                             "(carpeta por defecto: PROTOPO_CACHE o ~/.protopo/cache)")
+    parser.add_argument('--cache-mb', type=float, default=None,
+                        help="Tamaño máximo de la caché (por defecto 2048 MB)")
+    parser.add_argument('--enlazar', action='store_true',
+                        help="Con --cache: salidas como enlaces duros a la caché en vez de copias")
+    parser.add_argument('--perfil', nargs='?', const='1', default=None, metavar='FICHERO',
+                        help="Medir cada etapa de la fase (líneas JSON a stderr o añadidas a FICHERO)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Fase 7: procesar solo las filas añadidas desde la última pasada")
+    args = parser.parse_args(argv)
+
+    # Los procesos hijos heredan la variable (ver protopo.perfil)
+    if args.perfil:
+        os.environ["PROTOPO_PERFIL"] = os.path.abspath(args.perfil) if args.perfil != '1' else '1'
+
+    opciones = {}
+    if args.memoria_mb:
+        if args.fase not in fases.FASES_CON_ORDEN:
+            parser.error("--memoria-mb solo aplica a las fases 5, 6 y 7")
+        opciones['memoria_max_mb'] = args.memoria_mb
+
+    if args.incremental:
+        if args.fase != 7:
+            parser.error("--incremental solo aplica a la fase 7")
+        if args.cache is not None:
+            parser.error("--incremental y --cache no se pueden usar juntos")
+        opciones['incremental'] = True
+
+    cache = None
+    if args.cache is not None:
+        if args.fase not in fases.FASES_CON_ORDEN:
+            parser.error("--cache solo aplica a las fases 5, 6 y 7")
+        carpeta_cache = args.cache or os.environ.get("PROTOPO_CACHE") or None
+        max_mb = args.cache_mb or float(os.environ.get("PROTOPO_CACHE_MB") or MAX_MB_POR_DEFECTO)
+        cache = (carpeta_cache, max_mb, args.enlazar)
+
+    inicio = time.perf_counter()
+    resultados = procesar_lote(args.carpeta, args.fase, args.trabajadores, args.patron, opciones, cache)
+    if not resultados:
+        print(f"No hay ficheros '{args.patron}' en {args.carpeta}")
+        return 1
+
+    imprimir_resumen(resultados, args.carpeta, time.perf_counter() - inicio)
+    return 1 if any(r.error for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Claves de ordenación compartidas por los distintos motores de la fase 7
+(Python puro, columnar y ordenación externa).
+
+Los tipos y contadores distintos son pocos, así que se ordenan aquí en
+Python con las claves de la fase y cada fila solo necesita un entero.
+
+También están aquí los registros compactos (__slots__) con los que el
+camino en Python puro de las fases 5 y 6 agrupa los puntos.
+"""
+from operator import attrgetter
+
+
+class Punto:
+    """
+    Una fila: prefijo (todo lo anterior al código, se copia tal cual),
+    número de punto e info del código (Codigo, compartido entre filas).
+    """
+
+    __slots__ = ('prefijo', 'num', 'info')
+
+    def __init__(self, prefijo, num, info):
+        self.prefijo = prefijo
+        self.num = num
+        self.info = info
+
+    @property
+    def min_punto(self):
+        """Un punto suelto va entre las líneas según su propio número."""
+        return self.num
+
+
+class Linea:
+    """Puntos de una misma línea (tipo, contador) y su número más bajo."""
+
+    __slots__ = ('puntos', 'min_punto')
+
+    def __init__(self):
+        self.puntos = []
+        self.min_punto = float('inf')
+
+
+def agrupar_lineas(puntos):
+    """
+    Regla de agrupación de las fases 5 y 6.
+    Retorna (elementos, lineas):
+    - elementos: Linea y Punto sueltos en orden de llegada. El punto suelto
+      va tal cual (sin un grupo de un solo punto).
+    - lineas: dict (tipo, contador) -> Linea.
+    """
+    elementos = []
+    lineas = {}
+    for p in puntos:
+        info = p.info
+        if info.contador is not None:
+            clave_grupo = (info.tipo, info.contador)
+            linea = lineas.get(clave_grupo)
+            if linea is None:
+                linea = lineas[clave_grupo] = Linea()
+                elementos.append(linea)
+            linea.puntos.append(p)
+        else:
+            elementos.append(p)
+    return elementos, lineas
+
+
+def ordenar_grupos(elementos, lineas):
+    """
+    Ordena los puntos de cada línea por número (su min_punto es el del
+    primero) y luego líneas y puntos sueltos por 'min_punto' (estable).
+    """
+    for linea in lineas.values():
+        linea.puntos.sort(key=attrgetter('num'))
+        linea.min_punto = linea.puntos[0].num
+    elementos.sort(key=attrgetter('min_punto'))
+
+
+def recorrer_grupos(elementos):
+    """
+    Generador de (punto, tipo_base, es_inicio) en el orden de 'elementos'.
+    tipo_base es el del primer punto de la línea (todos lo comparten).
+    """
+    for elem in elementos:
+        if type(elem) is Punto:
+            yield elem, elem.info.tipo, False
+            continue
+        tipo_base = elem.puntos[0].info.tipo
+        for i, p in enumerate(elem.puntos):
+            yield p, tipo_base, i == 0
+
+
+def rangos_fase7(codigos, clave_tipo, clave_contador):
+    """
+    'codigos' son los Codigo distintos EN ORDEN DE PRIMERA APARICIÓN.
+
+    Retorna (rango_linea, rango_suelto):
+    - rango_linea[(tipo, contador)]: posición de esa línea en la salida del
+      Grupo B (tipos ordenados y, dentro de cada tipo, contadores ordenados;
+      a igual clave manda el orden de aparición, como en b_dict).
+    - rango_suelto[tipo]: posición del tipo en el Grupo A, contando a
+      continuación de las líneas. Tipos con la misma clave comparten rango
+      (dentro de él manda el orden de lectura, como en grupo_a.sort).
+    """
+    b_dict = {}
+    tipos_a = {}
+    for cod in codigos:
+        if cod.contador is None:
+            tipos_a.setdefault(cod.tipo, None)
+        else:
+            b_dict.setdefault(cod.tipo, {}).setdefault(cod.contador, None)
+
+    rango_linea = {}
+    for tipo in sorted(b_dict.keys(), key=clave_tipo):
+        for contador in sorted(b_dict[tipo].keys(), key=clave_contador):
+            rango_linea[(tipo, contador)] = len(rango_linea)
+
+    claves_a = sorted({clave_tipo(t) for t in tipos_a})
+    rango_clave = {clave: len(rango_linea) + r for r, clave in enumerate(claves_a)}
+    rango_suelto = {tipo: rango_clave[clave_tipo(tipo)] for tipo in tipos_a}
+
+    return rango_linea, rango_suelto
+
+
+def rango_fase7(cod, rango_linea, rango_suelto):
+    """Rango de un Codigo (ver rangos_fase7)."""
+    if cod.contador is None:
+        return rango_suelto[cod.tipo]
+    return rango_linea[(cod.tipo, cod.contador)]
@@ -0,0 +1,179 @@
+"""
+Ordenación externa (fuera de memoria) para las fases 5, 6 y 7.
+
+Para ficheros más grandes que la RAM disponible: las filas se leen en
+tandas que caben en el presupuesto de memoria, cada tanda se ordena y se
+guarda en un fichero temporal ("run"), y al final los runs se mezclan
+(k-way merge con heapq.merge) mientras se escribe la salida.
+
+La clave de cada fila es la misma que usan las fases en memoria; siempre
+termina con el número de fila, así que el orden es estable y el resultado
+idéntico. El fichero de entrada se lee dos veces: la primera solo guarda
+lo que es pequeño (un mínimo por línea, o los tipos/contadores distintos)
+y la segunda reparte las filas en runs.
+"""
+import heapq
+import os
+import pickle
+import tempfile
+from operator import itemgetter
+
+from protopo.flujo import leer_lineas, num_punto
+from protopo.orden import rango_fase7, rangos_fase7
+
+# Bytes estimados por fila además del texto (tupla clave, floats, lista...)
+BYTES_POR_FILA = 200
+
+# Filas por bloque al volcar un run (pickle por bloques, no fila a fila)
+FILAS_POR_BLOQUE = 4096
+
+# Máximo de runs abiertos a la vez en una mezcla
+MAX_RUNS_ABIERTOS = 128
+
+
+def ordenar_externo(registros, memoria_max_mb, dir_temporal=None):
+    """
+    Ordena 'registros' (tuplas cuyo primer elemento es la clave) usando como
+    mucho unos 'memoria_max_mb' MB para la tanda en memoria.
+    Generador: devuelve los registros ordenados por clave.
+    Si todo cabe en una tanda no se crea ningún fichero temporal.
+    """
+    limite = max(1, int(memoria_max_mb * 1024 * 1024))
+
+    with tempfile.TemporaryDirectory(prefix='protopo_', dir=dir_temporal) as carpeta:
+        runs = []
+        tanda = []
+        ocupado = 0
+
+        for registro in registros:
+            tanda.append(registro)
+            ocupado += BYTES_POR_FILA + sum(len(x) for x in registro[1:] if isinstance(x, str))
+            if ocupado >= limite:
+                runs.append(_volcar_run(carpeta, len(runs), sorted(tanda, key=itemgetter(0))))
+                tanda = []
+                ocupado = 0
+
+        tanda.sort(key=itemgetter(0))
+        if not runs:
+            yield from tanda
+            return
+        if tanda:
+            runs.append(_volcar_run(carpeta, len(runs), tanda))
+        del tanda
+
+        # Si hay demasiados runs se mezclan por niveles
+        while len(runs) > MAX_RUNS_ABIERTOS:
+            siguientes = []
+            for i in range(0, len(runs), MAX_RUNS_ABIERTOS):
+                grupo = runs[i:i + MAX_RUNS_ABIERTOS]
+                ruta = _volcar_run(carpeta, f"n{len(runs)}_{i}", _mezclar(grupo))
+                for r in grupo:
+                    os.remove(r)
+                siguientes.append(ruta)
+            runs = siguientes
+
+        yield from _mezclar(runs)
+
+
+def _volcar_run(carpeta, nombre, registros_ordenados):
+    ruta = os.path.join(carpeta, f"run_{nombre}.bin")
+    with open(ruta, 'wb') as f:
+        bloque = []
+        for registro in registros_ordenados:
+            bloque.append(registro)
+            if len(bloque) >= FILAS_POR_BLOQUE:
+                pickle.dump(bloque, f, pickle.HIGHEST_PROTOCOL)
+                bloque = []
+        if bloque:
+            pickle.dump(bloque, f, pickle.HIGHEST_PROTOCOL)
+    return ruta
+
+
+def _leer_run(ruta):
+    with open(ruta, 'rb') as f:
+        while True:
+            try:
+                bloque = pickle.load(f)
+            except EOFError:
+                return
+            yield from bloque
+
+
+def _mezclar(runs):
+    return heapq.merge(*(_leer_run(r) for r in runs), key=itemgetter(0))
+
+
+def ordenar_por_grupos_externo(archivo_entrada, parsear, campo_punto, memoria_max_mb, dir_temporal=None):
+    """
+    Orden de las fases 5 y 6 (ver protopo.columnar.orden_por_grupos) sin
+    cargar el fichero en memoria.
+
+    Generador de (prefijo, info, es_inicio) en el orden de salida:
+    'prefijo' es el texto de la fila hasta el código, 'info' su Codigo y
+    'es_inicio' si es el primer punto de una línea.
+    """
+    # 1ª pasada: por cada línea (tipo, contador) su menor punto y su 1ª fila
+    grupos = {}
+    for fila, (linea_txt, corte) in enumerate(leer_lineas(archivo_entrada, min_campos=2)):
+        info = parsear(linea_txt[corte:])
+        if info.contador is None:
+            continue
+        num = num_punto(linea_txt, campo_punto)
+        grupo = grupos.get((info.tipo, info.contador))
+        if grupo is None:
+            grupos[(info.tipo, info.contador)] = [num, fila]
+        elif num < grupo[0]:
+            grupo[0] = num
+
+    # 2ª pasada: clave (min_punto del grupo, 1ª fila del grupo, punto, fila)
+    def registros():
+        for fila, (linea_txt, corte) in enumerate(leer_lineas(archivo_entrada, min_campos=2)):
+            codigo = linea_txt[corte:]
+            info = parsear(codigo)
+            num = num_punto(linea_txt, campo_punto)
+            if info.contador is None:
+                clave = (num, fila, num, fila) # Punto suelto: grupo propio
+            else:
+                min_punto, primera_fila = grupos[(info.tipo, info.contador)]
+                clave = (min_punto, primera_fila, num, fila)
+            yield clave, linea_txt[:corte], codigo
+
+    grupo_anterior = None
+    for clave, prefijo, codigo in ordenar_externo(registros(), memoria_max_mb, dir_temporal):
+        info = parsear(codigo)
+        es_inicio = info.contador is not None and clave[1] != grupo_anterior
+        grupo_anterior = clave[1]
+        yield prefijo, info, es_inicio
+
+
+def ordenar_fase7_externo(archivo_entrada, parsear, clave_tipo, clave_contador,
+                          memoria_max_mb, dir_temporal=None):
+    """
+    Orden de la fase 7 (ver protopo.columnar.orden_fase7) sin cargar el
+    fichero en memoria.
+
+    Generador de (prefijo, codigo_raw, info, es_inicio) en el orden de
+    salida, con 'es_inicio' True en el primer punto de cada línea.
+    """
+    # 1ª pasada: códigos distintos en orden de aparición
+    distintos = {}
+    for linea_txt, corte in leer_lineas(archivo_entrada):
+        codigo = linea_txt[corte:]
+        if codigo not in distintos:
+            distintos[codigo] = parsear(codigo)
+    rango_linea, rango_suelto = rangos_fase7(distintos.values(), clave_tipo, clave_contador)
+    del distintos
+
+    # 2ª pasada: clave (rango de la línea o del tipo suelto, fila)
+    def registros():
+        for fila, (linea_txt, corte) in enumerate(leer_lineas(archivo_entrada)):
+            codigo = linea_txt[corte:]
+            rango = rango_fase7(parsear(codigo), rango_linea, rango_suelto)
+            yield (rango, fila), linea_txt[:corte], codigo
+
+    rango_anterior = None
+    for (rango, _), prefijo, codigo in ordenar_externo(registros(), memoria_max_mb, dir_temporal):
+        info = parsear(codigo)
+        es_inicio = info.contador is not None and rango != rango_anterior
+        rango_anterior = rango
+        yield prefijo, codigo, info, es_inicio
@@ -0,0 +1,163 @@
+"""
+Medición por etapas de las fases (opcional).
+
+Con la variable de entorno PROTOPO_PERFIL cada ejecución de una fase añade
+una línea JSON con el tiempo y las filas de cada etapa y, en las fases que
+agrupan, cuántos puntos hay de cada tipo, cuántas líneas y puntos sueltos y
+el tamaño de la línea más larga:
+    PROTOPO_PERFIL=1            -> a la salida de errores (stderr)
+    PROTOPO_PERFIL=perfil.jsonl -> añadido al final de ese fichero
+
+Etapas (según el motor no todas existen o van juntas):
+    lectura, clasificacion, agrupacion, ordenacion, codigos, escritura
+    (y 'flujo' en las fases 1-4, que leen, marcan y escriben a la vez).
+
+Sin la variable no se mide nada y el coste es despreciable.
+"""
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class Perfil:
+    """Tiempos y contadores de una ejecución de una fase."""
+
+    activo = True
+
+    def __init__(self, fase, entrada, motor, destino='1'):
+        self.fase = fase
+        self.entrada = entrada
+        self.motor = motor
+        self.destino = destino
+        self.etapas = []
+        self.contadores = None
+        self.cuentas = Counter()
+        self.inicio = self.ultimo = time.perf_counter()
+
+    @contextmanager
+    def etapa(self, nombre, filas=None):
+        """
+        Mide el bloque 'with'. Retorna un dict en el que se puede apuntar
+        registro['filas'] si no se conocen al empezar.
+        """
+        registro = {'etapa': nombre, 'filas': filas}
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            self.ultimo = time.perf_counter()
+            registro['segundos'] = round(self.ultimo - inicio, 6)
+            self.etapas.append(registro)
+
+    def marca(self, nombre, filas=None):
+        """Cierra una etapa que empezó al terminar la anterior (código secuencial)."""
+        ahora = time.perf_counter()
+        self.etapas.append({'etapa': nombre, 'filas': filas, 'segundos': round(ahora - self.ultimo, 6)})
+        self.ultimo = ahora
+
+    def contando(self, filas, campo_info):
+        """Deja pasar 'filas' contando (tipo, contador) de fila[campo_info]."""
+        cuentas = self.cuentas
+        for fila in filas:
+            info = fila[campo_info]
+            cuentas[(info.tipo, info.contador)] += 1
+            yield fila
+
+    def contar(self, infos):
+        """Cuenta (tipo, contador) de los Codigo de 'infos'."""
+        self.cuentas.update((info.tipo, info.contador) for info in infos)
+
+    def grupos(self, cuentas):
+        """
+        'cuentas' es un dict (tipo, contador) -> filas (contador None para
+        los puntos sueltos), como los agrupan las fases 5, 6 y 7.
+        """
+        por_tipo = Counter()
+        lineas = sueltos = mayor = 0
+        for (tipo, contador), n in cuentas.items():
+            por_tipo[tipo] += n
+            if contador is None:
+                sueltos += n
+            else:
+                lineas += 1
+                mayor = max(mayor, n)
+        self.contadores = {
+            'lineas': lineas,
+            'puntos_sueltos': sueltos,
+            'mayor_linea': mayor,
+            'por_tipo': dict(por_tipo.most_common()),
+        }
+
+    def emitir(self, filas):
+        """Escribe la línea JSON de esta ejecución."""
+        registro = {
+            'fase': self.fase,
+            'entrada': self.entrada,
+            'motor': self.motor,
+            'filas': filas,
+            'segundos': round(time.perf_counter() - self.inicio, 6),
+            'etapas': self.etapas,
+        }
+        if self.contadores is None and self.cuentas:
+            self.grupos(self.cuentas)
+        if self.contadores is not None:
+            registro.update(self.contadores)
+        linea = json.dumps(registro, ensure_ascii=False) + '\n'
+
+        if self.destino == '1':
+            sys.stderr.write(linea)
+        else:
+            # Una sola escritura en modo 'a': varios procesos pueden compartir fichero
+            with open(self.destino, 'a', encoding='utf-8') as f:
+                f.write(linea)
+
+
+class _PerfilInactivo:
+    """Mismo interfaz que Perfil, sin medir nada."""
+
+    activo = False
+    _registro = {}
+
+    @contextmanager
+    def etapa(self, nombre, filas=None):
+        yield self._registro
+
+    def marca(self, nombre, filas=None):
+        pass
+
+    def contando(self, filas, campo_info):
+        return filas
+
+    def contar(self, infos):
+        pass
+
+    def grupos(self, cuentas):
+        pass
+
+    def emitir(self, filas):
+        pass
+
+
+INACTIVO = _PerfilInactivo()
+
+
+def perfil_desde_entorno(fase, entrada, motor):
+    """Perfil si PROTOPO_PERFIL está definida; si no, uno que no hace nada."""
+    destino = os.environ.get("PROTOPO_PERFIL")
+    if not destino or destino == '0':
+        return INACTIVO
+    return Perfil(fase, os.path.basename(entrada), motor, destino)
+
+
+def cuentas_por_codigo(infos, cuenta_codigo):
+    """
+    Cuentas (tipo, contador) -> filas a partir de los códigos distintos
+    ('infos') y las filas de cada uno ('cuenta_codigo', en el mismo orden).
+    """
+    cuentas = Counter()
+    for info, n in zip(infos, cuenta_codigo):
+        cuentas[(info.tipo, info.contador)] += int(n)
+    return cuentas
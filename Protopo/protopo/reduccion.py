@@ -0,0 +1,350 @@
+"""
+Reducción de observaciones polares (radiación) a coordenadas X, Y, Z.
+
+Las filas de campo (como las de 'Fase 7/dist/prueba.txt') son:
+    estación, punto, Hz, V, distancia geométrica, altura de prisma, altura de instrumento, código
+    9001,100,380.5295000000,104.3658000000,28.031,1.500,1.531,5
+
+Con las coordenadas de las bases conocidas se calcula todo el fichero de una
+vez con NumPy, en vez de punto a punto:
+- Estacionamiento: filas seguidas con la misma estación y altura de
+  instrumento (al cambiar la altura se vuelve a orientar).
+- Orientación: las visuales a puntos de coordenadas conocidas (la 9002 desde
+  la 9001) dan la desorientación del estacionamiento (media de todas).
+- Círculo directo e inverso: las filas al mismo punto desde el mismo
+  estacionamiento se promedian en una visual (ver protopo.caras); la
+  distancia es la media de las que la traen (una fila sin distancia,
+  '200.0103,296.2134,,', solo aporta ángulos).
+- Estaciones nuevas: una estación que no está entre las conocidas toma las
+  coordenadas radiadas desde las anteriores (8000 desde 9001, 8001 desde
+  8000...), en el orden del fichero.
+
+Z = Z estación + altura de instrumento + D·cos(V) - altura de prisma (sin
+corrección de esfericidad ni refracción).
+
+Coordenadas conocidas: fichero con 'punto,X,Y[,Z]' por línea (también con
+';' o espacios) y/o '--punto 9001=1000,2000,100'.
+
+Uso:
+    python -m protopo.reduccion campo.txt --coordenadas bases.txt [--unidades grados]
+    -> campo_xyz.txt con 'punto,X,Y,Z,código'
+"""
+import argparse
+import math
+import os
+import re
+import sys
+from array import array
+from collections import namedtuple
+
+from protopo import columnar
+from protopo.flujo import escribir_lineas, leer_lineas
+
+np = columnar.np
+
+# Vuelta completa en cada unidad angular
+UNIDADES = {'gon': 400.0, 'grados': 360.0}
+
+Observaciones = namedtuple('Observaciones', ['estacion', 'punto', 'hz', 'v', 'distancia', 'altura_prisma',
+                                             'altura_instrumento', 'codigo', 'linea', 'posicion', 'otras'])
+Estacionamiento = namedtuple('Estacionamiento', ['estacion', 'altura_instrumento', 'visuales', 'referencias',
+                                                 'desorientacion', 'residuo_max'])
+Reduccion = namedtuple('Reduccion', ['puntos', 'estacionamientos', 'avisos'])
+
+
+class ErrorReduccion(Exception):
+    """Datos con los que no se puede reducir (sin NumPy, unidades desconocidas...)."""
+
+
+def leer_coordenadas(archivo):
+    """{punto: (X, Y, Z)} de un fichero 'punto,X,Y[,Z]'. Z es nan si falta; las líneas sin números se saltan."""
+    conocidas = {}
+    with open(archivo, 'r', encoding='utf-8') as f:
+        for linea in f:
+            campos = [c for c in re.split(r'[,;\s]+', linea.strip()) if c]
+            if len(campos) < 3:
+                continue
+            try:
+                x, y = float(campos[1]), float(campos[2])
+                z = float(campos[3]) if len(campos) > 3 else math.nan
+            except ValueError:
+                continue # Cabecera u otra línea de texto
+            conocidas[campos[0]] = (x, y, z)
+    return conocidas
+
+
+def _requiere_numpy():
+    if not columnar.HAY_NUMPY:
+        raise ErrorReduccion("La reducción de coordenadas necesita NumPy")
+
+
+def leer_observaciones(archivo_entrada):
+    """Observaciones del fichero por columnas (ver observaciones)."""
+    return observaciones(leer_lineas(archivo_entrada))
+
+
+def observaciones(lineas):
+    """
+    Observaciones de las (linea_txt, corte) de flujo.leer_lineas, por columnas.
+    Las filas sin 8 campos o con ángulos no numéricos van a 'otras' como
+    (posición, línea); 'posicion' es la de cada observación entre todas.
+    """
+    _requiere_numpy()
+    estacion, punto, codigo, texto, otras = [], [], [], [], []
+    hz, v, distancia, altura_prisma, altura_instrumento = (array('d') for _ in range(5))
+    posicion = array('q')
+    nan = math.nan
+    for i, (linea_txt, corte) in enumerate(lineas):
+        if linea_txt.count(',') < 7:
+            otras.append((i, linea_txt))
+            continue
+        est, pt, h, z, d, hp, hi = linea_txt[:corte].split(',', 7)[:7]
+        try:
+            fila = (float(h), float(z), float(d) if d.strip() else nan,
+                    float(hp) if hp.strip() else 0.0, float(hi) if hi.strip() else 0.0) # Altura vacía = 0
+        except ValueError:
+            otras.append((i, linea_txt))
+            continue
+        estacion.append(est.strip())
+        punto.append(pt.strip())
+        codigo.append(linea_txt[corte:])
+        texto.append(linea_txt)
+        posicion.append(i)
+        hz.append(fila[0])
+        v.append(fila[1])
+        distancia.append(fila[2])
+        altura_prisma.append(fila[3])
+        altura_instrumento.append(fila[4])
+
+    hz, v, distancia, altura_prisma, altura_instrumento = (
+        np.frombuffer(c, dtype=np.float64) for c in (hz, v, distancia, altura_prisma, altura_instrumento))
+    posicion = np.frombuffer(posicion, dtype=np.int64)
+    return Observaciones(estacion, punto, hz, v, distancia, altura_prisma, altura_instrumento, codigo, texto,
+                         posicion, otras)
+
+
+def vuelta_de(unidades):
+    """Vuelta completa en 'unidades' (400 gon, 360 grados)."""
+    if unidades not in UNIDADES:
+        raise ErrorReduccion(f"Unidades desconocidas: {unidades} (gon o grados)")
+    return UNIDADES[unidades]
+
+
+def _ids(nombres):
+    """Id entero de cada nombre (mismo nombre, mismo id)."""
+    ids = {nombre: i for i, nombre in enumerate(dict.fromkeys(nombres))}
+    return np.fromiter(map(ids.__getitem__, nombres), dtype=np.int64, count=len(nombres))
+
+
+def _acimut(desde, hasta, vuelta):
+    """Acimut (desde el norte, Y, en sentido horario) de 'desde' a 'hasta'."""
+    return math.atan2(hasta[0] - desde[0], hasta[1] - desde[1]) % (2 * math.pi) * vuelta / (2 * math.pi)
+
+
+def reducir(obs, conocidas, unidades='gon'):
+    """
+    Coordenadas de todas las visuales de 'obs' (ver leer_observaciones) a
+    partir de los puntos 'conocidas' ({punto: (X, Y, Z)}).
+    Retorna Reduccion(puntos, estacionamientos, avisos), con 'puntos' una
+    lista de (punto, X, Y, Z, código) en el orden del fichero.
+    """
+    from protopo import caras # caras importa este módulo
+
+    vuelta = vuelta_de(unidades)
+    a_radianes = 2 * math.pi / vuelta
+    avisos = []
+    if obs.otras:
+        avisos.append(f"{len(obs.otras)} filas sin el formato estación,punto,Hz,V,D,hp,hi,código")
+    if not len(obs.hz):
+        return Reduccion([], [], avisos)
+
+    # Una visual por (estacionamiento, punto, altura de prisma): caras CD/CI y repeticiones promediadas
+    parejas = caras.emparejar(obs, unidades)
+    if parejas.inconsistente.any():
+        avisos.append(f"{int(parejas.inconsistente.sum())} visuales con caras inconsistentes "
+                      f"(ver python -m protopo.caras)")
+    primera = parejas.primera
+    inicio_est = parejas.inicio_estacionamiento
+    est_de_visual = parejas.estacionamiento
+    visuales_por_est = np.bincount(est_de_visual, minlength=len(inicio_est))
+    inicio_visual_est = np.concatenate(([0], np.cumsum(visuales_por_est)))
+    hz_v, v_v, dist_v, n_dist = parejas.hz, parejas.v, parejas.distancia, parejas.con_distancia
+
+    # Proyección de cada visual (no depende de la orientación)
+    v_rad = v_v * a_radianes
+    horizontal = dist_v * np.sin(v_rad)
+    dz = dist_v * np.cos(v_rad) + obs.altura_instrumento[primera] - obs.altura_prisma[primera]
+    puntos_v = [obs.punto[i] for i in primera.tolist()]
+
+    # Orientación de cada estacionamiento, en el orden del fichero: las
+    # estaciones nuevas toman las coordenadas radiadas desde las anteriores
+    estaciones = set(obs.estacion)
+    calculadas = {} # estación -> [suma X, suma Y, suma Z, n]
+    origen = np.full((len(inicio_est), 3), np.nan)
+    desorientacion = np.full(len(inicio_est), np.nan)
+    es_referencia = np.zeros(len(primera), dtype=bool)
+    estacionamientos = []
+    # Visuales a bases o estaciones: las únicas que pueden orientar o dar una estación nueva
+    a_base = np.array([p in conocidas or p in estaciones for p in puntos_v], dtype=bool)
+
+    def coordenadas(nombre):
+        if nombre in conocidas:
+            return conocidas[nombre]
+        if nombre in calculadas:
+            sx, sy, sz, n = calculadas[nombre]
+            return sx / n, sy / n, sz / n
+        return None
+
+    for k, fila in enumerate(inicio_est.tolist()):
+        nombre = obs.estacion[fila]
+        desde, hasta = inicio_visual_est[k], inicio_visual_est[k + 1]
+        estacion = coordenadas(nombre)
+        if estacion is None:
+            avisos.append(f"Estación {nombre} (fila {fila + 1}) sin coordenadas: "
+                          f"{hasta - desde} visuales sin calcular")
+            estacionamientos.append(Estacionamiento(nombre, float(obs.altura_instrumento[fila]), hasta - desde, 0,
+                                                    None, None))
+            continue
+
+        candidatas = (desde + np.flatnonzero(a_base[desde:hasta])).tolist()
+        referencias = [j for j in candidatas if puntos_v[j] != nombre and coordenadas(puntos_v[j]) is not None]
+        if not referencias:
+            avisos.append(f"Estación {nombre} (fila {fila + 1}) sin visual a un punto conocido: "
+                          f"{hasta - desde} visuales sin calcular")
+            estacionamientos.append(Estacionamiento(nombre, float(obs.altura_instrumento[fila]), hasta - desde, 0,
+                                                    None, None))
+            continue
+
+        es_referencia[referencias] = True
+        media = vuelta / 2
+        w = [(_acimut(estacion, coordenadas(puntos_v[j]), vuelta) - hz_v[j]) % vuelta for j in referencias]
+        w0 = w[0]
+        residuos = [(wi - w0 + media) % vuelta - media for wi in w]
+        w_media = (w0 + sum(residuos) / len(residuos)) % vuelta
+        residuo_max = max(abs(r - sum(residuos) / len(residuos)) for r in residuos)
+        origen[k] = estacion
+        desorientacion[k] = w_media
+        estacionamientos.append(Estacionamiento(nombre, float(obs.altura_instrumento[fila]), hasta - desde,
+                                                len(referencias), w_media, residuo_max))
+
+        # Estaciones radiadas desde aquí: sus coordenadas hacen falta para los siguientes
+        for j in candidatas:
+            punto = puntos_v[j]
+            if punto in estaciones and punto not in conocidas and not es_referencia[j] and n_dist[j]:
+                acimut = (hz_v[j] + w_media) * a_radianes
+                xyz = (estacion[0] + horizontal[j] * math.sin(acimut), estacion[1] + horizontal[j] * math.cos(acimut),
+                       estacion[2] + dz[j])
+                suma = calculadas.setdefault(punto, [0.0, 0.0, 0.0, 0])
+                for i in range(3):
+                    suma[i] += xyz[i]
+                suma[3] += 1
+
+    # Radiación de todas las visuales a la vez
+    orientada = ~np.isnan(desorientacion[est_de_visual])
+    calcular = orientada & ~es_referencia & (n_dist > 0)
+    sin_distancia = orientada & ~es_referencia & (n_dist == 0)
+    if sin_distancia.any():
+        avisos.append(f"{int(sin_distancia.sum())} visuales sin distancia (solo ángulos): puntos "
+                      + ", ".join(puntos_v[j] for j in np.flatnonzero(sin_distancia)[:10].tolist())
+                      + (" ..." if sin_distancia.sum() > 10 else ""))
+
+    indices = np.flatnonzero(calcular)
+    est = est_de_visual[indices]
+    acimut = (hz_v[indices] + desorientacion[est]) * a_radianes
+    x = origen[est, 0] + horizontal[indices] * np.sin(acimut)
+    y = origen[est, 1] + horizontal[indices] * np.cos(acimut)
+    z = origen[est, 2] + dz[indices]
+
+    puntos = list(zip(map(puntos_v.__getitem__, indices.tolist()), x.tolist(), y.tolist(), z.tolist(),
+                      map(obs.codigo.__getitem__, primera[indices].tolist())))
+    return Reduccion(puntos, estacionamientos, avisos)
+
+
+def escribir_coordenadas(archivo_salida, puntos, decimales=3):
+    """Escribe 'punto,X,Y,Z,código' (Z vacía si no se conoce). Retorna las filas escritas."""
+    def formato(valor):
+        return "" if math.isnan(valor) else f"{valor:.{decimales}f}"
+    return escribir_lineas(archivo_salida, (f"{p},{formato(x)},{formato(y)},{formato(z)},{codigo}"
+                                            for p, x, y, z, codigo in puntos))
+
+
+def ruta_salida(ruta_entrada):
+    """Salida junto a la entrada: 'campo.txt' -> 'campo_xyz.txt'."""
+    return os.path.splitext(ruta_entrada)[0] + "_xyz.txt"
+
+
+def _punto_cli(texto):
+    """'9001=1000,2000,100' -> ('9001', (1000.0, 2000.0, 100.0))."""
+    try:
+        nombre, valores = texto.split('=', 1)
+        xyz = [float(c) for c in valores.split(',')]
+        if len(xyz) not in (2, 3):
+            raise ValueError
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"se esperaba PUNTO=X,Y[,Z]: {texto}")
+    return nombre.strip(), (xyz[0], xyz[1], xyz[2] if len(xyz) == 3 else math.nan)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reduce observaciones polares (Hz, V, D) a coordenadas X, Y, Z.")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) de campo")
+    parser.add_argument('--coordenadas', help="Fichero con 'punto,X,Y[,Z]' de las bases conocidas")
+    parser.add_argument('--punto', type=_punto_cli, action='append', default=[], metavar='P=X,Y[,Z]',
+                        help="Punto conocido (se puede repetir)")
+    parser.add_argument('--unidades', choices=sorted(UNIDADES), default='gon', help="Unidades de Hz y V (gon)")
+    parser.add_argument('-o', '--salida', help="Fichero de salida (solo con una entrada)")
+    args = parser.parse_args(argv)
+    if args.salida and len(args.entradas) > 1:
+        parser.error("--salida solo con un fichero de entrada")
+
+    conocidas = {}
+    if args.coordenadas:
+        try:
+            conocidas.update(leer_coordenadas(args.coordenadas))
+        except OSError as e:
+            print(f"Error lectura: {e}")
+            return 1
+    conocidas.update(args.punto)
+    if not conocidas:
+        parser.error("Faltan coordenadas conocidas (--coordenadas o --punto)")
+
+    fallos = 0
+    for entrada in args.entradas:
+        print(f"Reducción - Leyendo: {entrada}...")
+        try:
+            obs = leer_observaciones(entrada)
+            resultado = reducir(obs, conocidas, args.unidades)
+        except ErrorReduccion as e:
+            print(f"Error: {e}")
+            return 1
+        except Exception as e:
+            print(f"Error lectura: {e}")
+            fallos += 1
+            continue
+
+        for est in resultado.estacionamientos:
+            if est.desorientacion is None:
+                continue
+            print(f"  Estación {est.estacion} (hi {est.altura_instrumento:.3f}): {est.visuales} visuales, "
+                  f"desorientación {est.desorientacion:.4f} con {est.referencias} referencias "
+                  f"(dispersión {est.residuo_max:.4f})")
+        for aviso in resultado.avisos:
+            print(f"  Aviso: {aviso}")
+        if not resultado.puntos:
+            print("No se ha calculado ningún punto.")
+            fallos += 1
+            continue
+
+        salida = args.salida or ruta_salida(entrada)
+        try:
+            total = escribir_coordenadas(salida, resultado.puntos)
+        except Exception as e:
+            print(f"Error escritura: {e}")
+            fallos += 1
+            continue
+        print(f"¡Éxito Reducción! {total} puntos. Generado: {salida}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Servidor residente de las fases (opcional).
+
+Cada vez que se arrastra un fichero sobre un exe, el exe se desempaqueta y
+arranca Python y NumPy antes de leer la primera fila; con ficheros pequeños
+eso es casi todo el tiempo. El servidor es un proceso que se deja abierto
+con todas las fases ya importadas y que escucha en un canal local (tubería
+con nombre en Windows, socket Unix en el resto). El lanzador
+(protopo.lanzador) solo le pasa la ruta del fichero y muestra la respuesta.
+Si el servidor no está abierto, el lanzador ejecuta la fase él mismo.
+
+Solo se aceptan conexiones del mismo usuario: la clave se guarda en
+~/.protopo/servidor.clave al arrancar.
+
+Uso:
+    python -m protopo.servidor            (arrancar; Ctrl+C para cerrar)
+    python -m protopo.servidor --estado
+    python -m protopo.servidor --parar
+"""
+import argparse
+import getpass
+import os
+import sys
+import tempfile
+import time
+from multiprocessing.connection import Client, Listener
+
+CARPETA_CLAVE = os.path.join(os.path.expanduser('~'), '.protopo')
+RUTA_CLAVE = os.path.join(CARPETA_CLAVE, 'servidor.clave')
+
+# Variables de entorno de las fases que el lanzador pasa al servidor
+VARIABLES = ('PROTOPO_MEMORIA_MB', 'PROTOPO_CACHE', 'PROTOPO_CACHE_MB', 'PROTOPO_INCREMENTAL', 'PROTOPO_PERFIL')
+
+
+def direccion():
+    """Canal del usuario actual: (dirección, familia) de multiprocessing.connection."""
+    usuario = ''.join(c for c in getpass.getuser() if c.isalnum()) or 'protopo'
+    if sys.platform == 'win32':
+        return rf'\\.\pipe\protopo-{usuario}', 'AF_PIPE'
+    return os.path.join(tempfile.gettempdir(), f'protopo-{usuario}.sock'), 'AF_UNIX'
+
+
+def leer_clave():
+    """Clave del servidor abierto, o None si no hay."""
+    try:
+        with open(RUTA_CLAVE, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _crear_clave():
+    os.makedirs(CARPETA_CLAVE, exist_ok=True)
+    clave = os.urandom(32)
+    # Solo legible por el usuario
+    descriptor = os.open(RUTA_CLAVE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, 'wb') as f:
+        f.write(clave)
+    return clave
+
+
+def enviar(mensaje):
+    """
+    Envía un mensaje (dict) al servidor y retorna su respuesta, o None si
+    el servidor no está abierto.
+    """
+    clave = leer_clave()
+    if clave is None:
+        return None
+    ruta, familia = direccion()
+    try:
+        with Client(ruta, family=familia, authkey=clave) as conexion:
+            conexion.send(mensaje)
+            return conexion.recv()
+    except (OSError, EOFError):
+        return None
+
+
+def ejecutar(fase, entrada, salida, entorno):
+    """
+    Ejecuta la fase como lo haría su exe con las variables 'entorno'
+    (PROTOPO_MEMORIA_MB, PROTOPO_CACHE...). Retorna un dict con filas,
+    segundos, error y los mensajes que habría mostrado el exe.
+    """
+    from protopo import fases, lote
+    from protopo.cache import MAX_MB_POR_DEFECTO
+
+    opciones = {}
+    cache = None
+    if fase in fases.FASES_CON_ORDEN and entorno.get('PROTOPO_MEMORIA_MB'):
+        opciones['memoria_max_mb'] = float(entorno['PROTOPO_MEMORIA_MB'])
+    if fase == 7 and entorno.get('PROTOPO_INCREMENTAL') == '1':
+        opciones['incremental'] = True
+    elif fase in fases.FASES_CON_ORDEN and entorno.get('PROTOPO_CACHE'):
+        max_mb = float(entorno.get('PROTOPO_CACHE_MB') or MAX_MB_POR_DEFECTO)
+        cache = (entorno['PROTOPO_CACHE'], max_mb, False)
+
+    # PROTOPO_PERFIL la lee la propia fase: se fija solo durante la ejecución
+    perfil_previo = os.environ.pop('PROTOPO_PERFIL', None)
+    if entorno.get('PROTOPO_PERFIL'):
+        os.environ['PROTOPO_PERFIL'] = entorno['PROTOPO_PERFIL']
+    try:
+        resultado = lote.procesar_archivo(fase, entrada, salida, opciones, cache)
+    finally:
+        os.environ.pop('PROTOPO_PERFIL', None)
+        if perfil_previo is not None:
+            os.environ['PROTOPO_PERFIL'] = perfil_previo
+    return resultado._asdict()
+
+
+def servir():
+    """Bucle del servidor: atiende las peticiones de una en una."""
+    from multiprocessing import AuthenticationError
+
+    from protopo import columnar, fases
+
+    ruta, familia = direccion()
+    if enviar({'orden': 'estado'}) is not None:
+        print(f"Ya hay un servidor abierto en {ruta}")
+        return 1
+    if familia == 'AF_UNIX' and os.path.exists(ruta):
+        os.remove(ruta) # Socket de un servidor que no se cerró bien
+
+    # Todas las fases importadas de antemano (y NumPy, si está)
+    for numero in fases.FASES:
+        fases.cargar(numero)
+    inicio = time.time()
+
+    clave = _crear_clave()
+    atendidas = 0
+    print(f"Servidor de Protopo abierto en {ruta} (NumPy: {'sí' if columnar.HAY_NUMPY else 'no'}). Ctrl+C para cerrar.")
+    try:
+        with Listener(ruta, family=familia, authkey=clave) as escucha:
+            while True:
+                try:
+                    conexion = escucha.accept()
+                except (AuthenticationError, OSError, EOFError):
+                    continue
+                with conexion:
+                    try:
+                        mensaje = conexion.recv()
+                    except (OSError, EOFError):
+                        continue
+                    orden = mensaje.get('orden')
+                    if orden == 'parar':
+                        conexion.send({'parado': True})
+                        break
+                    if orden == 'estado':
+                        conexion.send({'pid': os.getpid(), 'desde': inicio, 'atendidas': atendidas,
+                                       'numpy': columnar.HAY_NUMPY})
+                        continue
+
+                    respuesta = ejecutar(mensaje['fase'], mensaje['entrada'], mensaje['salida'],
+                                         mensaje.get('entorno', {}))
+                    atendidas += 1
+                    estado = "ERROR" if respuesta['error'] else "OK"
+                    print(f"{time.strftime('%H:%M:%S')} {estado} fase {mensaje['fase']}: {mensaje['entrada']} "
+                          f"({respuesta['segundos']:.2f} s)")
+                    try:
+                        conexion.send(respuesta)
+                    except OSError:
+                        pass # El lanzador se cerró antes de tiempo
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(RUTA_CLAVE):
+            os.remove(RUTA_CLAVE)
+    print(f"Servidor cerrado ({atendidas} ficheros atendidos)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor residente de las fases de Protopo.")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument('--estado', action='store_true', help="Mostrar si hay un servidor abierto")
+    grupo.add_argument('--parar', action='store_true', help="Cerrar el servidor abierto")
+    args = parser.parse_args(argv)
+
+    if args.estado or args.parar:
+        respuesta = enviar({'orden': 'parar' if args.parar else 'estado'})
+        if respuesta is None:
+            print("No hay ningún servidor abierto")
+            return 1
+        if args.parar:
+            print("Servidor cerrado")
+        else:
+            minutos = (time.time() - respuesta['desde']) / 60
+            print(f"Servidor abierto (proceso {respuesta['pid']}, {minutos:.0f} min, "
+                  f"{respuesta['atendidas']} ficheros atendidos)")
+        return 0
+    return servir()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
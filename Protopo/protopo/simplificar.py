@@ -0,0 +1,231 @@
+"""
+Simplificación de líneas densas (Douglas-Peucker) con tolerancia por tipo.
+
+Bordillos y muros tomados con estación robotizada dan líneas con miles de
+vértices casi alineados, y todos acaban en el dibujo. Aquí se quitan los
+vértices que se separan menos de la tolerancia de la línea simplificada,
+sobre un fichero 'punto,X,Y,Z,código' ya agrupado (el '_xyz.txt' de
+protopo.reduccion pasado por la fase 6 o 7; también sin agrupar, con las
+filas de cada 'TIPO&CONTADOR' en el orden del fichero).
+
+Se conservan siempre:
+- El primer punto de cada línea ('TIPO00') y el último.
+- Los puntos con atributos (' F' de un '@F', ' AS', ' AE'...), que parten la
+  línea en tramos que se simplifican por separado.
+- Los puntos sueltos y las filas sin coordenadas, tal cual.
+
+Va por columnas con NumPy: en cada pasada se parten a la vez todos los tramos
+de todas las líneas que aún tienen algún vértice fuera de tolerancia.
+
+Uso:
+    python -m protopo.simplificar campo_xyz_fase6.txt [--tolerancia 0.01] [--tolerancia 59=0.05 ...]
+    -> campo_xyz_fase6_simplificado.txt
+"""
+import argparse
+import os
+import sys
+from array import array
+
+from protopo import columnar
+from protopo.espacial import lineas_de_codigos
+from protopo.flujo import escribir_lineas, leer_lineas
+
+np = columnar.np
+
+TOLERANCIA = 0.01
+
+
+class ErrorSimplificar(Exception):
+    """Simplificación que no se puede hacer (sin NumPy, tolerancia no válida...)."""
+
+
+def _requiere_numpy():
+    if not columnar.HAY_NUMPY:
+        raise ErrorSimplificar("La simplificación de líneas necesita NumPy")
+
+
+def leer_tolerancias(textos, por_defecto=TOLERANCIA):
+    """
+    Tolerancias de la línea de órdenes: '0.02' cambia la de por defecto,
+    'TIPO=0.05' la de un tipo ('0' no simplifica ese tipo).
+    Retorna (por defecto, {tipo: tolerancia}).
+    """
+    por_tipo = {}
+    for texto in textos or ():
+        tipo, igual, valor = texto.rpartition('=')
+        try:
+            tolerancia = float(valor)
+        except ValueError:
+            raise ErrorSimplificar(f"Tolerancia no válida: '{texto}'") from None
+        if not tolerancia >= 0:
+            raise ErrorSimplificar(f"Tolerancia negativa: '{texto}'")
+        if igual:
+            por_tipo[tipo.strip()] = tolerancia
+        else:
+            por_defecto = tolerancia
+    return por_defecto, por_tipo
+
+
+def _obligatorio(codigo, tipo):
+    """Punto de la línea 'tipo' con atributos: ' F', 'FE00 CE'... (fase 6) o '@...' (sin agrupar)."""
+    if '@' in codigo or '&' in codigo:
+        return '@' in codigo
+    return codigo.strip() not in (tipo, tipo + '00')
+
+
+def _expandir(inicios, cuentas):
+    """[inicio, inicio + cuenta) de cada rango, todos seguidos."""
+    desplazamiento = np.arange(int(cuentas.sum())) - np.repeat(np.cumsum(cuentas) - cuentas, cuentas)
+    return np.repeat(inicios, cuentas) + desplazamiento
+
+
+def douglas_peucker(x, y, linea, tolerancia, conservar):
+    """
+    Máscara de vértices que quedan. 'linea' es el número de línea de cada
+    fila (-1 suelto), 'tolerancia' la de cada fila y 'conservar' los que
+    quedan sí o sí. Los vértices de una línea van en el orden de las filas.
+    Distancia al tramo en planta: la Z no cuenta (un bordillo que sube una
+    rampa en línea recta en planta se simplifica igual).
+    """
+    n = len(linea)
+    queda = np.ones(n, dtype=bool)
+    en_linea = np.flatnonzero(linea >= 0)
+    if len(en_linea) < 3:
+        return queda
+
+    # Vértices de línea en orden (las líneas sin agrupar no van seguidas)
+    en_linea = en_linea[np.argsort(linea[en_linea], kind='stable')]
+    nl = linea[en_linea]
+    primero = np.r_[True, nl[1:] != nl[:-1]]
+    ultimo = np.r_[nl[1:] != nl[:-1], True]
+    fijo = primero | ultimo | conservar[en_linea] | ~(tolerancia[en_linea] > 0)
+    px, py = x[en_linea], y[en_linea]
+    tol = tolerancia[en_linea]
+
+    # Tramos entre vértices fijos consecutivos de la misma línea, con algo en medio
+    fijos = np.flatnonzero(fijo)
+    a, b = fijos[:-1], fijos[1:]
+    mismo = (nl[a] == nl[b]) & (b - a > 1)
+    a, b = a[mismo], b[mismo]
+
+    while len(a):
+        cuentas = b - a - 1
+        de_tramo = np.repeat(np.arange(len(a)), cuentas)
+        k = _expandir(a + 1, cuentas)
+        ia, ib = a[de_tramo], b[de_tramo]
+        dx, dy = px[ib] - px[ia], py[ib] - py[ia]
+        largo2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            u = np.where(largo2 > 0, ((px[k] - px[ia]) * dx + (py[k] - py[ia]) * dy) / largo2, 0)
+        u = np.clip(u, 0, 1)
+        distancia = np.hypot(px[k] - px[ia] - u * dx, py[k] - py[ia] - u * dy)
+
+        # Vértice más alejado de cada tramo (el primero si empatan)
+        inicio = np.cumsum(cuentas) - cuentas
+        maxima = np.maximum.reduceat(distancia, inicio)
+        es_max = np.flatnonzero(distancia == maxima[de_tramo])
+        tramos, primera = np.unique(de_tramo[es_max], return_index=True)
+        lejos = k[es_max[primera]]
+
+        partir = maxima[tramos] > tol[lejos]
+        tramos, lejos = tramos[partir], lejos[partir]
+        fijo[lejos] = True
+        a = np.concatenate((a[tramos], lejos))
+        b = np.concatenate((lejos, b[tramos]))
+        largo = b - a > 1
+        a, b = a[largo], b[largo]
+
+    queda[en_linea[~fijo]] = False
+    return queda
+
+
+def simplificar(lineas, tolerancia=TOLERANCIA, por_tipo=None):
+    """
+    Líneas de texto 'punto,X,Y,Z,código' (como las da leer_lineas: pares
+    (texto, corte)). Retorna (lista de textos que quedan, vértices quitados).
+    """
+    _requiere_numpy()
+    textos, codigos = [], []
+    x, y = array('d'), array('d')
+    for linea_txt, corte in lineas:
+        campos = linea_txt[:corte].split(',', 4)
+        textos.append(linea_txt)
+        codigos.append(linea_txt[corte:])
+        try:
+            xi, yi = float(campos[1]), float(campos[2])
+        except ValueError:
+            xi = yi = np.nan
+        x.append(xi)
+        y.append(yi)
+    if not textos:
+        return textos, 0
+
+    x, y = (np.frombuffer(c, dtype=np.float64) for c in (x, y))
+    linea, tipos = lineas_de_codigos(codigos)
+    sin_xy = np.isnan(x) | np.isnan(y)
+    # Una fila sin coordenadas no entra en su línea (ni la parte)
+    linea = np.where(sin_xy, -1, linea)
+
+    por_tipo = por_tipo or {}
+    tolerancia_tipo = {tipo: por_tipo.get(tipo, tolerancia) for tipo in set(tipos)}
+    tol = np.array([tolerancia_tipo[tipo] for tipo in tipos], dtype=np.float64)
+    obligatorio = {clave: _obligatorio(*clave) for clave in set(zip(codigos, tipos))}
+    conservar = np.array([obligatorio[clave] for clave in zip(codigos, tipos)], dtype=bool)
+
+    queda = douglas_peucker(x, y, linea, tol, conservar)
+    return [t for t, q in zip(textos, queda.tolist()) if q], int((~queda).sum())
+
+
+def ruta_salida(ruta_entrada):
+    """Salida junto a la entrada: 'campo_xyz_fase6.txt' -> 'campo_xyz_fase6_simplificado.txt'."""
+    return os.path.splitext(ruta_entrada)[0] + "_simplificado.txt"
+
+
+def procesar_simplificar(archivo_entrada, archivo_salida, tolerancia=TOLERANCIA, por_tipo=None):
+    """Escribe 'archivo_entrada' con las líneas simplificadas. Retorna las filas escritas (None si hay error)."""
+    print(f"Simplificar - Leyendo: {archivo_entrada}...")
+    try:
+        filas, quitados = simplificar(leer_lineas(archivo_entrada, min_campos=4), tolerancia, por_tipo)
+    except ErrorSimplificar as e:
+        print(f"Error: {e}")
+        return
+    except Exception as e:
+        print(f"Error lectura: {e}")
+        return
+    if not filas:
+        print("Archivo vacío.")
+        return
+
+    try:
+        total = escribir_lineas(archivo_salida, filas)
+    except Exception as e:
+        print(f"Error escritura: {e}")
+        return
+    print(f"  {quitados} vértices quitados de {total + quitados} filas")
+    print(f"¡Éxito Simplificar! Generado: {archivo_salida}")
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simplifica las líneas (Douglas-Peucker) con tolerancia por tipo.")
+    parser.add_argument('entradas', nargs='+', help="Fichero(s) 'punto,X,Y,Z,código' agrupados (fase 6 o 7)")
+    parser.add_argument('--tolerancia', action='append', metavar='[TIPO=]METROS',
+                        help=f"Tolerancia por defecto ({TOLERANCIA}) o de un tipo (59=0.05); se puede repetir")
+    parser.add_argument('-o', '--salida', help="Fichero de salida (solo con una entrada)")
+    args = parser.parse_args(argv)
+    if args.salida and len(args.entradas) > 1:
+        parser.error("--salida solo con un fichero de entrada")
+    try:
+        tolerancia, por_tipo = leer_tolerancias(args.tolerancia)
+    except ErrorSimplificar as e:
+        parser.error(str(e))
+
+    fallos = 0
+    for entrada in args.entradas:
+        if procesar_simplificar(entrada, args.salida or ruta_salida(entrada), tolerancia, por_tipo) is None:
+            fallos += 1
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Generador de ficheros de campo sintéticos para medir las fases.
+
+Imita los ficheros reales de las carpetas de las fases ('Fase 7/dist/
+prueba.txt', 'Fase 6/entrada_fase6.txt'):
+- Radiación: estacion,punto,Hz,V,distancia,altura de prisma,altura de
+  instrumento,codigo (el orden de prueba.txt y de protopo.reduccion), en gon.
+  Cada estacionamiento empieza orientando a la referencia (código 39, CD y
+  CI, una lectura sin distancia): la primera estación es la 9001 orientada a
+  la 9002 (BASES) y cada estación nueva se radia al final de la anterior
+  (con su número de punto) y orienta a ella. A veces se vuelve a estacionar
+  con otra altura de instrumento (y se vuelve a orientar) y, a mitad de
+  estación, se cambia solo la altura de prisma.
+- Coordenadas: punto,X,Y,Z,codigo.
+- Códigos 'tipo&contador' con atributos '@AS', '@AE', '@C', cierres '@F',
+  puntos sueltos y tipos con espacios o acentos ('26 REDONDO', 'ÁRBOL').
+
+Mismas opciones -> mismo fichero (semilla fija).
+
+Uso:
+    python -m protopo.sintetico salida.txt --filas 100000 [--formato coordenadas] [--bases bases.txt]
+    python -m protopo.reduccion salida.txt --coordenadas bases.txt
+"""
+import argparse
+import itertools
+import math
+import random
+import sys
+
+FORMATOS = ('radiacion', 'coordenadas')
+
+# Sube cuando cambian los ficheros generados (protopo.benchmark los guarda por versión)
+VERSION = 2
+
+# Tipos de línea y de punto suelto con su peso (como en los ficheros reales)
+TIPOS_LINEA = [('2', 30), ('201', 10), ('1', 8), ('26', 6), ('59', 5), ('58', 3),
+               ('DEF', 2), ('Muro', 2), ('BORD', 1)]
+TIPOS_SUELTOS = [('2', 10), ('11', 8), ('26', 6), ('30', 5), ('19', 4), ('13', 4), ('201', 3),
+                 ('BAJ', 2), ('9', 2), ('26 REDONDO', 1), ('ÁRBOL', 1), ('POZO-R', 1)]
+ATRIBUTOS = ['@AS', '@AE', '@C', '@AS@C']
+
+# Proporción de filas que son puntos sueltos
+PROB_SUELTO = 0.3
+
+# Bases conocidas de la radiación: la 9001 es la primera estación y orienta a la 9002
+BASES = {'9001': (687000.0, 4226400.0, 11.5), '9002': (687031.2, 4226438.4, 11.9)}
+CODIGO_ORIENTACION = '39'
+# Probabilidad de volver a estacionar (otra altura de instrumento) en una estación
+PROB_REESTACIONAR = 0.2
+# Probabilidad, por visual, de cambiar la altura de prisma
+PROB_CAMBIO_PRISMA = 0.005
+
+
+def _elegir(rnd, pesos):
+    return rnd.choices([t for t, _ in pesos], weights=[p for _, p in pesos])[0]
+
+
+def generar_codigos(rnd):
+    """Generador infinito de códigos con líneas de 2 a 30 puntos y sueltos intercalados."""
+    contadores = {}
+    while True:
+        if rnd.random() < PROB_SUELTO:
+            yield _elegir(rnd, TIPOS_SUELTOS)
+            continue
+
+        tipo = _elegir(rnd, TIPOS_LINEA)
+        contadores[tipo] = contadores.get(tipo, 0) + 1
+        base = f"{tipo}&{contadores[tipo]}"
+        largo = rnd.randint(2, 30)
+        cerrada = rnd.random() < 0.2
+        for i in range(largo):
+            codigo = base
+            if i and rnd.random() < 0.05:
+                codigo += rnd.choice(ATRIBUTOS)
+            if cerrada and i == largo - 1:
+                codigo += '@F'
+            yield codigo
+
+
+def _visual(desde, hasta, desorientacion, altura_prisma, altura_instrumento):
+    """(Hz, V, distancia geométrica) en gon de 'desde' a 'hasta', como las reduce protopo.reduccion."""
+    dx, dy = hasta[0] - desde[0], hasta[1] - desde[1]
+    horizontal = math.hypot(dx, dy)
+    vertical = hasta[2] + altura_prisma - desde[2] - altura_instrumento
+    acimut = math.atan2(dx, dy) * 200 / math.pi
+    hz = (acimut - desorientacion) % 400
+    v = math.atan2(horizontal, vertical) * 200 / math.pi
+    return hz, v, math.hypot(horizontal, vertical)
+
+
+def _fila(estacion, punto, hz, v, distancia, altura_prisma, altura_instrumento, codigo):
+    return (f"{estacion},{punto},{hz % 400:.10f},{v:.10f},{distancia},"
+            f"{altura_prisma:.3f},{altura_instrumento:.3f},{codigo}")
+
+
+def _filas_orientacion(rnd, estacion, xyz, referencia, xyz_ref, desorientacion, altura_prisma, altura_instrumento):
+    """Lecturas a la referencia: CD, CD repetida y CI sin distancia."""
+    hz, v, distancia = _visual(xyz, xyz_ref, desorientacion, altura_prisma, altura_instrumento)
+    for cara_hz, cara_v, dist in ((hz, v, f"{distancia + rnd.uniform(-0.002, 0.002):.3f}"),
+                                  (hz, v, f"{distancia + rnd.uniform(-0.002, 0.002):.3f}"),
+                                  (hz + 200, 400 - v, "")):
+        yield _fila(estacion, referencia, cara_hz + rnd.uniform(-0.002, 0.002), cara_v + rnd.uniform(-0.002, 0.002),
+                    dist, altura_prisma, altura_instrumento, CODIGO_ORIENTACION)
+
+
+def _filas_radiacion(rnd, codigos):
+    """Generador infinito de filas de radiación (ver el docstring del módulo)."""
+    reservados = set(BASES)
+    numeros = (str(n) for n in itertools.count(100) if str(n) not in reservados)
+    estacion, referencia = '9001', '9002'
+    xyz, xyz_ref = BASES[estacion], BASES[referencia]
+    while True:
+        for _ in range(2 if rnd.random() < PROB_REESTACIONAR else 1):
+            desorientacion = rnd.uniform(0, 400)
+            altura_instrumento = round(rnd.uniform(1.45, 1.65), 3)
+            altura_prisma = round(rnd.uniform(1.30, 2.00), 3)
+            yield from _filas_orientacion(rnd, estacion, xyz, referencia, xyz_ref, desorientacion,
+                                          altura_prisma, altura_instrumento)
+            for _ in range(rnd.randint(25, 200)):
+                yield _fila(estacion, next(numeros), rnd.uniform(0, 400), rnd.uniform(95, 110),
+                            f"{rnd.uniform(2, 60):.3f}", altura_prisma, altura_instrumento, next(codigos))
+                # Cambio de altura de prisma a mitad de estación (no se vuelve a orientar)
+                if rnd.random() < PROB_CAMBIO_PRISMA:
+                    altura_prisma = round(rnd.uniform(1.30, 2.00), 3)
+
+        # Estación siguiente: radiada desde esta (CD y CI con distancia), orientará a esta
+        siguiente = next(numeros)
+        angulo = rnd.uniform(0, 2 * math.pi)
+        largo = rnd.uniform(40, 120)
+        xyz_sig = (xyz[0] + largo * math.sin(angulo), xyz[1] + largo * math.cos(angulo), xyz[2] + rnd.uniform(-1, 1))
+        hz, v, distancia = _visual(xyz, xyz_sig, desorientacion, altura_prisma, altura_instrumento)
+        for cara_hz, cara_v in ((hz, v), (hz + 200, 400 - v)):
+            yield _fila(estacion, siguiente, cara_hz, cara_v, f"{distancia:.3f}",
+                        altura_prisma, altura_instrumento, CODIGO_ORIENTACION)
+        estacion, referencia, xyz, xyz_ref = siguiente, estacion, xyz_sig, xyz
+
+
+def generar_filas(filas, formato='radiacion', semilla=0):
+    """Generador de 'filas' líneas de texto (sin salto) del formato pedido."""
+    rnd = random.Random(semilla)
+    codigos = generar_codigos(rnd)
+    punto = 100
+
+    if formato == 'coordenadas':
+        x, y, z = 687000.0, 4226400.0, 11.5
+        for _ in range(filas):
+            x += rnd.uniform(-5, 5)
+            y += rnd.uniform(-5, 5)
+            z += rnd.uniform(-0.05, 0.05)
+            yield f"{punto},{x:.3f},{y:.3f},{z:.3f},{next(codigos)}"
+            punto += 1
+        return
+
+    yield from itertools.islice(_filas_radiacion(rnd, codigos), filas)
+
+
+def generar(ruta, filas, formato='radiacion', semilla=0, filas_por_bloque=8192):
+    """Escribe el fichero sintético en 'ruta'. Retorna el número de filas."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato} (válidos: {', '.join(FORMATOS)})")
+    total = 0
+    with open(ruta, 'w', encoding='utf-8') as f:
+        bloque = []
+        for linea in generar_filas(filas, formato, semilla):
+            bloque.append(linea)
+            if len(bloque) >= filas_por_bloque:
+                f.write('\n'.join(bloque) + '\n')
+                total += len(bloque)
+                bloque.clear()
+        if bloque:
+            f.write('\n'.join(bloque) + '\n')
+            total += len(bloque)
+    return total
+
+
+def escribir_bases(ruta):
+    """Fichero 'punto,X,Y,Z' con las BASES de la radiación."""
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.writelines(f"{punto},{x:.3f},{y:.3f},{z:.3f}\n" for punto, (x, y, z) in BASES.items())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un fichero de campo sintético.")
+    parser.add_argument('salida', help="Fichero a crear")
+    parser.add_argument('--filas', type=int, default=100000, help="Número de filas (por defecto 100000)")
+    parser.add_argument('--formato', choices=FORMATOS, default='radiacion')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--bases', metavar='FICHERO',
+                        help="Escribe también las coordenadas de las bases (para protopo.reduccion --coordenadas)")
+    args = parser.parse_args(argv)
+
+    total = generar(args.salida, args.filas, args.formato, args.semilla)
+    print(f"Generado: {args.salida} ({total} filas)")
+    if args.bases:
+        escribir_bases(args.bases)
+        print(f"Generado: {args.bases} ({len(BASES)} bases)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,14 @@ import requests
 import json
 import sys
 import glob
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 
 # Load environment variables
 load_dotenv()
@@ -21,11 +27,132 @@ HEADERS = {
     "Notion-Version": "2022-06-28"
 }
 
+# Local sidecar index: path -> (mtime, size, hash, version, changelog, Notion page id)
+INDEX_FILE = ".notion_sync_index.json"
+INDEX_FORMAT = 1
+
+# Notion allows an average of ~3 requests per second per integration
+RATE_LIMIT = 3.0
+MAX_WORKERS = 4
+MAX_RETRIES = 5
+REQUEST_TIMEOUT = 30
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class RateLimiter:
+    """Thread-safe token bucket: 'rate' requests per second, bursts of 'capacity'."""
+    def __init__(self, rate=RATE_LIMIT, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds every thread back (Notion's Retry-After applies to the whole integration)."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+            self.updated = max(self.updated, self.paused_until)
+
 class NotionManager:
     def __init__(self):
         if not NOTION_TOKEN:
             print("Error: NOTION_TOKEN is not set in .env")
             sys.exit(1)
+        # One pooled keep-alive session shared by all worker threads
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+        self.session.mount("https://", adapter)
+        self.limiter = RateLimiter()
+        # (operation, detail) of every request that failed for good
+        self.failures = []
+        self.failures_lock = threading.Lock()
+
+    def _retry_delay(self, response, attempt):
+        """Seconds to wait before retrying: Retry-After if given, else exponential backoff with jitter."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            try:
+                return max(float(retry_after), 0.0)
+            except (TypeError, ValueError):
+                pass
+        return min(2 ** attempt, 30) + random.uniform(0, 0.5)
+
+    def _record_failure(self, operation, detail):
+        print(f"Error {operation}: {detail}")
+        with self.failures_lock:
+            self.failures.append((operation, detail))
+
+    def _request(self, method, url, operation, payload=None, find_existing=None):
+        """
+        Rate-limited request with retries on 429/5xx and network errors. Returns the JSON body or None.
+        For non-idempotent requests pass 'find_existing': after an error the request may have
+        been applied, so it is called before retrying and returns (checked, existing body).
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            response = None
+            maybe_applied = True
+            try:
+                response = self.session.request(method, url, json=payload, timeout=REQUEST_TIMEOUT)
+            except requests.exceptions.ConnectTimeout as e:
+                # No connection, so nothing was sent
+                detail = str(e)
+                maybe_applied = False
+            except requests.RequestException as e:
+                detail = str(e)
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                detail = f"{response.status_code} {response.text[:300]}"
+                if response.status_code not in RETRY_STATUS:
+                    break
+                # Rate-limited requests are rejected before they are processed
+                maybe_applied = response.status_code != 429
+            if attempt < MAX_RETRIES:
+                if find_existing is not None and maybe_applied:
+                    checked, existing = find_existing()
+                    if existing is not None:
+                        return existing
+                    if not checked:
+                        # Retrying blindly could apply it twice
+                        break
+                delay = self._retry_delay(response, attempt)
+                if response is not None and response.status_code == 429:
+                    self.limiter.pause(delay)
+                time.sleep(delay)
+        self._record_failure(operation, detail)
+        return None
+
+    def run_parallel(self, tasks):
+        """Runs callables on MAX_WORKERS threads (the limiter keeps the request rate). Returns their results in order."""
+        results = [None] * len(tasks)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+            futures = {pool.submit(task): i for i, task in enumerate(tasks)}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    self._record_failure("in worker", repr(e))
+        return results
 
     def query_database(self, database_id, filter_criteria=None):
         """Query a database and return results."""
@@ -42,57 +169,53 @@ class NotionManager:
             if start_cursor:
                 payload["start_cursor"] = start_cursor
             
-            response = requests.post(url, headers=HEADERS, json=payload)
-            if response.status_code == 200:
-                data = response.json()
-                results.extend(data["results"])
-                has_more = data["has_more"]
-                start_cursor = data["next_cursor"]
-            else:
-                print(f"Error querying DB {database_id}: {response.status_code}")
-                # print(response.text)
+            data = self._request("POST", url, f"querying DB {database_id}", payload)
+            if data is None:
                 break
+            results.extend(data["results"])
+            has_more = data["has_more"]
+            start_cursor = data["next_cursor"]
         return results
 
     def create_page(self, database_id, properties):
-        """Create a new page in a database."""
+        """Create a new page in a database. A failed attempt may still have created it: it is looked up by title before retrying."""
         url = "https://api.notion.com/v1/pages"
         payload = {
             "parent": {"database_id": database_id},
             "properties": properties
         }
-        response = requests.post(url, headers=HEADERS, json=payload)
-        if response.status_code == 200:
-            return response.json()
+        return self._request("POST", url, "creating page", payload,
+                             find_existing=lambda: self._find_page_by_title(database_id, properties))
+
+    def _find_page_by_title(self, database_id, properties):
+        """(checked, page) for the page of 'database_id' with the title in 'properties'; checked is False if the query failed."""
+        for name, value in properties.items():
+            if "title" in value:
+                title = "".join(t["text"]["content"] for t in value["title"])
+                break
         else:
-            print(f"Error creating page: {response.status_code}")
-            print(response.text)
-            return None
+            return False, None
+        url = f"https://api.notion.com/v1/databases/{database_id}/query"
+        payload = {"filter": {"property": name, "title": {"equals": title}}, "page_size": 1}
+        data = self._request("POST", url, f"looking up page '{title}'", payload)
+        if data is None:
+            return False, None
+        return True, data["results"][0] if data["results"] else None
 
     def update_page(self, page_id, properties):
         """Update an existing page."""
         url = f"https://api.notion.com/v1/pages/{page_id}"
         payload = {"properties": properties}
-        response = requests.patch(url, headers=HEADERS, json=payload)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Error updating page: {response.status_code}")
-            print(response.text)
-            return None
+        return self._request("PATCH", url, f"updating page {page_id}", payload)
     
     def update_database_schema(self, database_id, properties):
         """Add or update properties in the database schema."""
         url = f"https://api.notion.com/v1/databases/{database_id}"
         payload = {"properties": properties}
-        response = requests.patch(url, headers=HEADERS, json=payload)
-        if response.status_code == 200:
+        data = self._request("PATCH", url, f"updating schema for {database_id}", payload)
+        if data is not None:
             print(f"Schema updated for DB {database_id}")
-            return response.json()
-        else:
-            print(f"Error updating schema for {database_id}: {response.status_code}")
-            # print(response.text)
-            return None
+        return data
 
 class CatalogSync:
     def __init__(self):
@@ -101,9 +224,41 @@ class CatalogSync:
         
         # Cache for project IDs to avoid repeated queries
         self.project_cache = {}
+        self.projects_prefetched = False
+        # Failed requests whose work was redone another way (not counted as failures)
+        self.recovered_failures = []
+
+        self.index_path = os.path.join(self.root_dir, INDEX_FILE)
+        self.index = self._load_index()
+
+    def _load_index(self):
+        """Loads the local file-state index (empty if missing, unreadable or for another database)."""
+        empty = {"format": INDEX_FORMAT, "database": DB_VERSIONES_ID, "files": {}}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return empty
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable index {self.index_path}: {e}")
+            return empty
+        if index.get("format") != INDEX_FORMAT or index.get("database") != DB_VERSIONES_ID:
+            return empty
+        index.setdefault("files", {})
+        return index
+
+    def _save_index(self):
+        """Writes the index atomically (temp file + replace)."""
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print(f"Error writing index {self.index_path}: {e}")
 
-    def ensure_schema(self):
-        """Ensures Databases have the necessary properties."""
+    def ensure_schema(self, force=False):
+        """Ensures Databases have the necessary properties. Skipped if the last applied schema is the same."""
         print("Verifying Database Schema...")
         
         # Ideas DB Schema
@@ -130,7 +285,6 @@ class CatalogSync:
             },
             "Tags": {"multi_select": {}}
         }
-        self.notion.update_database_schema(DB_IDEAS_ID, ideas_props)
         
         # Versions DB Schema
         # Note: We cannot easily create a relation via API to a specific DB without knowing its internal name or if it already exists linked differently.
@@ -147,13 +301,47 @@ class CatalogSync:
                 }
             }
         }
-        self.notion.update_database_schema(DB_VERSIONES_ID, versions_props)
+        schemas = {DB_IDEAS_ID: ideas_props, DB_VERSIONES_ID: versions_props}
+        fingerprint = hashlib.sha256(json.dumps(schemas, sort_keys=True).encode("utf-8")).hexdigest()
+        if not force and self.index.get("schema") == fingerprint:
+            print("Schema unchanged since last sync, skipping.")
+            return
+
+        applied = [self.notion.update_database_schema(db_id, props) for db_id, props in schemas.items()]
+        if all(applied):
+            self.index["schema"] = fingerprint
+            self._save_index()
+
+    def prefetch_projects(self):
+        """Loads every Ideas page into project_cache with one paginated query. Returns False if it failed."""
+        failures = len(self.notion.failures)
+        results = self.notion.query_database(DB_IDEAS_ID)
+        if len(self.notion.failures) > failures:
+            # Partial list: fall back to per-project queries, which record their own failures
+            with self.notion.failures_lock:
+                self.recovered_failures.extend(self.notion.failures[failures:])
+                del self.notion.failures[failures:]
+            return False
+        for r in results:
+            try:
+                title_prop = r["properties"]["Feature"]["title"]
+            except KeyError:
+                continue
+            if title_prop:
+                name = "".join(t.get("plain_text", "") for t in title_prop)
+                self.project_cache.setdefault(name, r["id"])
+        self.projects_prefetched = True
+        return True
 
     def _get_or_create_project(self, project_name):
         """Finds the Idea/Project page ID, or creates it if missing."""
         if project_name in self.project_cache:
             return self.project_cache[project_name]
 
+        if self.projects_prefetched:
+            # The prefetch saw every Ideas page: it does not exist yet
+            return self._create_project(project_name)
+
         # Query Ideas DB
         filter_criteria = {
             "property": "Feature", # Title property name in Ideas DB
@@ -167,24 +355,27 @@ class CatalogSync:
             page_id = results[0]["id"]
             self.project_cache[project_name] = page_id
             return page_id
-        else:
-            # Create new Project
-            print(f"Creating new Project/Idea: {project_name}")
-            props = {
-                "Feature": {"title": [{"text": {"content": project_name}}]},
-                "Estado": {"select": {"name": "En Desarrollo"}},
-                "Descripción": {"rich_text": [{"text": {"content": "Proyecto generado automáticamente"}}]}
-            }
-            resp = self.notion.create_page(DB_IDEAS_ID, props)
-            if resp:
-                page_id = resp["id"]
-                self.project_cache[project_name] = page_id
-                return page_id
+        return self._create_project(project_name)
+
+    def _create_project(self, project_name):
+        """Creates the Idea/Project page and caches its ID."""
+        print(f"Creating new Project/Idea: {project_name}")
+        props = {
+            "Feature": {"title": [{"text": {"content": project_name}}]},
+            "Estado": {"select": {"name": "En Desarrollo"}},
+            "Descripción": {"rich_text": [{"text": {"content": "Proyecto generado automáticamente"}}]}
+        }
+        resp = self.notion.create_page(DB_IDEAS_ID, props)
+        if resp:
+            page_id = resp["id"]
+            self.project_cache[project_name] = page_id
+            return page_id
         return None
 
     def get_local_lisps(self):
-        """Scan directory for .lsp files."""
+        """Scan directory for .lsp files. Only new or changed files (by mtime/size, then hash) are re-read."""
         lisps = []
+        indexed = self.index["files"]
         for root, dirs, files in os.walk(self.root_dir):
             for file in files:
                 if file.lower().endswith(".lsp"):
@@ -195,8 +386,17 @@ class CatalogSync:
                     version = self._extract_version(file, rel_path)
                     stats = os.stat(full_path)
                     mod_time = datetime.fromtimestamp(stats.st_mtime).isoformat()
-                    
-                    changelog = self._extract_changelog(full_path)
+
+                    entry = indexed.get(rel_path)
+                    if entry and entry.get("mtime_ns") == stats.st_mtime_ns and entry.get("size") == stats.st_size:
+                        content_hash = entry["hash"]
+                        changelog = entry["changelog"]
+                    else:
+                        content_hash = self._hash_file(full_path)
+                        if entry and entry.get("hash") == content_hash:
+                            changelog = entry["changelog"]  # touched, not edited
+                        else:
+                            changelog = self._extract_changelog(full_path)
 
                     lisps.append({
                         "name": file,
@@ -204,10 +404,26 @@ class CatalogSync:
                         "project": project_name,
                         "version": version,
                         "last_modified": mod_time,
-                        "changelog": changelog
+                        "changelog": changelog,
+                        "mtime_ns": stats.st_mtime_ns,
+                        "size": stats.st_size,
+                        "hash": content_hash
                     })
         return lisps
 
+    def _hash_file(self, file_path):
+        """SHA-256 of the file contents."""
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _fingerprint(self, lisp):
+        """Hash of everything that goes into the version page: if unchanged, the page is up to date."""
+        fields = [lisp[k] for k in ("name", "path", "project", "version", "last_modified", "changelog", "hash")]
+        return hashlib.sha256(json.dumps(fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+
     def _extract_changelog(self, file_path):
         """Extracts checking for 'Novedades', 'Cambios' or 'Descripción' in file header."""
         changelog = ""
@@ -265,29 +481,53 @@ class CatalogSync:
         if "Manual" in path: return "Manual"
         return "Unknown"
 
-    def sync(self):
-        self.ensure_schema()
+    def sync(self, full=False):
+        """Pushes new or changed LISP files (all of them with full=True). Returns the number of failed requests."""
+        self.ensure_schema(force=full)
         
         print("Scanning local files...")
         local_files = self.get_local_lisps()
         print(f"Found {len(local_files)} LISP files.")
 
-        print("Fetching existing versions...")
-        existing_records = self.notion.query_database(DB_VERSIONES_ID)
-        
-        existing_map = {}
-        for r in existing_records:
-            try:
-                title_prop = r["properties"]["Name"]["title"]
-                if title_prop:
-                    name = title_prop[0]["plain_text"]
-                    existing_map[name] = r["id"]
-            except KeyError:
-                continue
-
+        indexed = self.index["files"]
+        pending = []
         for lisp in local_files:
+            lisp["fingerprint"] = self._fingerprint(lisp)
+            entry = indexed.get(lisp["path"], {})
+            lisp["page_id"] = None if full else entry.get("page_id")
+            if full or not lisp["page_id"] or entry.get("synced") != lisp["fingerprint"]:
+                pending.append(lisp)
+        print(f"{len(pending)} new or changed, {len(local_files) - len(pending)} up to date.")
+
+        # The full-database query is only needed for files the index has no page for
+        if any(not lisp["page_id"] for lisp in pending):
+            print("Fetching existing versions...")
+            existing_records = self.notion.query_database(DB_VERSIONES_ID)
+            
+            existing_map = {}
+            for r in existing_records:
+                try:
+                    title_prop = r["properties"]["Name"]["title"]
+                    if title_prop:
+                        name = title_prop[0]["plain_text"]
+                        existing_map[name] = r["id"]
+                except KeyError:
+                    continue
+            for lisp in pending:
+                lisp["page_id"] = lisp["page_id"] or existing_map.get(lisp["name"])
+
+        # Projects first, serially: the cache must not race (and there are only a few)
+        projects = sorted({lisp["project"] for lisp in pending})
+        if projects:
+            print("Fetching projects...")
+            self.prefetch_projects()
+        for project_name in projects:
+            self._get_or_create_project(project_name)
+
+        tasks = []
+        for lisp in pending:
             # 1. Links to Project
-            project_id = self._get_or_create_project(lisp["project"])
+            project_id = self.project_cache.get(lisp["project"])
             
             # 2. Prepare Properties
             props = {
@@ -305,12 +545,66 @@ class CatalogSync:
             if project_id:
                 props["Proyecto"] = {"relation": [{"id": project_id}]}
 
-            if lisp["name"] in existing_map:
+            tasks.append(self._page_task(lisp, props, lisp["page_id"]))
+
+        # 3. Page writes in parallel, paced by the rate limiter
+        results = self.notion.run_parallel(tasks)
+        self._update_index(local_files, pending, results)
+        return self.report_failures()
+
+    def _update_index(self, local_files, pending, results):
+        """Records the new file state. Failed pages keep their old fingerprint, so they are retried next time."""
+        indexed = self.index["files"]
+        written = {}
+        for lisp, result in zip(pending, results):
+            if result:
+                written[lisp["path"]] = result.get("id") or lisp["page_id"]
+
+        files = {}
+        for lisp in local_files:
+            entry = indexed.get(lisp["path"], {})
+            page_id = written.get(lisp["path"]) or lisp["page_id"]
+            files[lisp["path"]] = {
+                "mtime_ns": lisp["mtime_ns"],
+                "size": lisp["size"],
+                "hash": lisp["hash"],
+                "version": lisp["version"],
+                "changelog": lisp["changelog"],
+                "page_id": page_id,
+                "synced": lisp["fingerprint"] if lisp["path"] in written else
+                          (entry.get("synced") if page_id == entry.get("page_id") else None)
+            }
+        # Files deleted locally drop out of the index (their Notion pages are left alone)
+        self.index["files"] = files
+        self.index["synced_at"] = datetime.now().isoformat(timespec="seconds")
+        self._save_index()
+
+    def _page_task(self, lisp, props, page_id):
+        """Callable that creates or updates the version page of one LISP."""
+        def task():
+            if page_id:
                 print(f"Updating {lisp['name']} (Project: {lisp['project']})...")
-                self.notion.update_page(existing_map[lisp["name"]], props)
-            else:
-                print(f"Creating {lisp['name']} (Project: {lisp['project']})...")
-                self.notion.create_page(DB_VERSIONES_ID, props)
+                return self.notion.update_page(page_id, props)
+            print(f"Creating {lisp['name']} (Project: {lisp['project']})...")
+            return self.notion.create_page(DB_VERSIONES_ID, props)
+        return task
+
+    def report_failures(self):
+        """Prints the requests that failed after all retries. Returns how many."""
+        if self.recovered_failures:
+            print(f"\n{len(self.recovered_failures)} request(s) failed but were recovered:")
+            for operation, detail in self.recovered_failures:
+                print(f"  - {operation}: {detail}")
+        failures = self.notion.failures
+        if failures:
+            print(f"\n{len(failures)} request(s) failed:")
+            for operation, detail in failures:
+                print(f"  - {operation}: {detail}")
+        elif self.recovered_failures:
+            print("No unrecovered failures.")
+        else:
+            print("All Notion requests succeeded.")
+        return len(failures)
 
     def add_idea(self, title, description):
         props = {
@@ -328,12 +622,15 @@ if __name__ == "__main__":
         manager = CatalogSync()
         
         if cmd == "update-catalog":
-            manager.sync()
+            if manager.sync(full="--full" in sys.argv[2:]):
+                sys.exit(1)
         elif cmd == "add-idea" and len(sys.argv) > 3:
             manager.add_idea(sys.argv[2], sys.argv[3])
+            if manager.report_failures():
+                sys.exit(1)
         else:
             print("Usage:")
-            print("  python sync_notion.py update-catalog")
+            print("  python sync_notion.py update-catalog [--full]")
             print("  python sync_notion.py add-idea 'Title' 'Description'")
     else:
-        print("Usage: python sync_notion.py [update-catalog|add-idea]")
+        print("Usage: python sync_notion.py [update-catalog [--full]|add-idea]")